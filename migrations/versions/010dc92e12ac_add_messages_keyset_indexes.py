@@ -0,0 +1,55 @@
+"""add messages keyset indexes
+
+Revision ID: 010dc92e12ac
+Revises: 
+Create Date: 2026-10-18 12:20:41.317524
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '010dc92e12ac'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built concurrently so the messages tables stay writable, which requires running outside the transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_user_id_avatar_id_id',
+            'messages',
+            ['user_id', 'avatar_id', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_assistant_messages_user_id_id',
+            'assistant_messages',
+            ['user_id', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_assistant_messages_user_id_id',
+            table_name='assistant_messages',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            'ix_messages_user_id_avatar_id_id',
+            table_name='messages',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
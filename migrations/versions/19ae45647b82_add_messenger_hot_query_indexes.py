@@ -0,0 +1,76 @@
+"""add messenger hot query indexes
+
+Revision ID: 19ae45647b82
+Revises: 3396e6e066f0
+Create Date: 2026-10-18 12:58:27.140962
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '19ae45647b82'
+down_revision: Union[str, None] = '3396e6e066f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built concurrently so the messages tables stay writable, which requires running outside the transaction.
+    # (user_id, avatar_id, id) already exists since 010dc92e12ac
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_user_id_avatar_id_created_at',
+            'messages',
+            ['user_id', 'avatar_id', 'created_at'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_messages_unread',
+            'messages',
+            ['user_id', 'avatar_id'],
+            unique=False,
+            postgresql_where=sa.text('unread_mark = true'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_messages_photo',
+            'messages',
+            ['user_id', 'avatar_id', 'created_at'],
+            unique=False,
+            postgresql_where=sa.text('photo_id IS NOT NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_assistant_messages_user_id_created_at',
+            'assistant_messages',
+            ['user_id', 'created_at'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_assistant_messages_user_id_created_at',
+            table_name='assistant_messages',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index('ix_messages_photo', table_name='messages', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_messages_unread', table_name='messages', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(
+            'ix_messages_user_id_avatar_id_created_at',
+            table_name='messages',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
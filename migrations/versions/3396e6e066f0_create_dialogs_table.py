@@ -0,0 +1,44 @@
+"""create dialogs table
+
+Revision ID: 3396e6e066f0
+Revises: 010dc92e12ac
+Create Date: 2026-10-18 12:41:09.508133
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3396e6e066f0'
+down_revision: Union[str, None] = '010dc92e12ac'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'dialogs',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('avatar_id', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=False),
+        sa.Column('last_activity_at', sa.DateTime(), nullable=False),
+        sa.Column('unread_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.ForeignKeyConstraint(['avatar_id'], ['avatars.id'], name=op.f('fk_dialogs_avatar_id_avatars')),
+        sa.ForeignKeyConstraint(['last_message_id'], ['messages.id'], name=op.f('fk_dialogs_last_message_id_messages')),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=op.f('fk_dialogs_user_id_users')),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_dialogs')),
+        sa.UniqueConstraint('id', name=op.f('uq_dialogs_id')),
+        sa.UniqueConstraint('user_id', 'avatar_id', name='uq_dialogs_user_id_avatar_id'),
+    )
+    op.create_index('ix_dialogs_user_id_last_message_id', 'dialogs', ['user_id', 'last_message_id'], unique=False)
+
+    # The summaries of the existing dialogs are built by src/backfill_dialogs.py
+
+
+def downgrade() -> None:
+    op.drop_index('ix_dialogs_user_id_last_message_id', table_name='dialogs')
+    op.drop_table('dialogs')
@@ -0,0 +1,41 @@
+from sqlalchemy import select, func
+
+from core.db import get_session_maker, setup_database_service, shutdown_database_service
+from core.settings import get_application_settings
+
+from messenger.models import Message
+from messenger.crud import rebuild_dialogs
+
+import asyncio, sys
+
+
+BATCH_SIZE = 1000
+
+
+async def backfill_dialogs(batch_size: int = BATCH_SIZE) -> None:
+    """
+    Builds dialog summaries from the existing messages, the users are processed in batches
+    so every transaction stays short, run it once after the dialogs migration (it is safe to repeat)
+
+    :param batch_size: Number of user identifiers processed by one transaction
+    :return:
+    """
+
+    settings = get_application_settings()
+
+    await setup_database_service(settings)
+
+    async with get_session_maker() as session:
+        query = await session.execute(select(func.min(Message.user_id), func.max(Message.user_id)))
+        min_user_id, max_user_id = query.one()
+
+    if min_user_id is not None:
+        for from_user_id in range(min_user_id, max_user_id + 1, batch_size):
+            count = await rebuild_dialogs(from_user_id, from_user_id + batch_size)
+            print(f'Users {from_user_id}-{from_user_id + batch_size - 1}: {count} dialogs')
+
+    await shutdown_database_service()
+
+
+if __name__ == '__main__':
+    asyncio.run(backfill_dialogs(int(sys.argv[1]) if len(sys.argv) > 1 else BATCH_SIZE))
@@ -0,0 +1,88 @@
+from core.db import setup_database_service, shutdown_database_service
+from core.settings import get_application_settings
+from core.kafka import setup_kafka_service, shutdown_kafka_service, send_generation_task, \
+    wait_generation_result, get_generated_images
+from core.kafka.memory import is_memory_transport
+
+import asyncio, statistics, sys, time
+
+
+TASKS_COUNT = 1000
+CLIENTS_COUNTS = (1, 10, 100)
+TASK_ARGUMENTS = ('realistic', 'portrait', 'female', '20-24', 1)
+
+
+async def run_client(task_ids: list[int], latencies: list[float], failures: list[int], store: bool) -> None:
+    """ Submits tasks one after another and waits for each result """
+
+    for task_id in task_ids:
+        started_at = time.perf_counter()
+
+        try:
+            await send_generation_task(task_id, *TASK_ARGUMENTS, is_awaited=True)
+
+            if store:
+                await get_generated_images(task_id)
+            else:
+                await wait_generation_result(task_id)
+        except Exception:
+            failures.append(task_id)
+            continue
+
+        latencies.append(time.perf_counter() - started_at)
+
+
+async def run(first_id: int, clients_count: int, store: bool) -> None:
+    """ Runs the clients concurrently and prints latency percentiles and throughput """
+
+    task_ids = list(range(first_id, first_id + TASKS_COUNT))
+    latencies, failures = [], []
+
+    started_at = time.perf_counter()
+
+    await asyncio.gather(*(
+        run_client(task_ids[x::clients_count], latencies, failures, store)
+        for x in range(clients_count)
+    ))
+
+    elapsed = time.perf_counter() - started_at
+    p50, p95, p99 = (statistics.quantiles(latencies, n=100)[x - 1] * 1000 for x in (50, 95, 99))
+
+    print(
+        f'{clients_count:>4} clients: {len(latencies) / elapsed:>8.1f} tasks/s, '
+        f'p50 {p50:>7.2f} ms, p95 {p95:>7.2f} ms, p99 {p99:>7.2f} ms, failed {len(failures)}'
+    )
+
+
+async def benchmark() -> None:
+    """
+    Measures submit-to-result latency through the whole kafka path,
+    run with KAFKA_SERVICE=memory:// and a small KAFKA_FAKE_WORKER_LATENCY to work offline,
+    pass --store to save the images with get_generated_images (requires DATABASE_URL)
+    """
+
+    settings = get_application_settings()
+    store = '--store' in sys.argv
+
+    if not is_memory_transport(settings.KAFKA_SERVICE):
+        print(f'Running against the real broker: {settings.KAFKA_SERVICE}')
+
+    if store:
+        await setup_database_service(settings)
+
+    await setup_kafka_service(settings)
+
+    first_id = int(time.time()) * 10000
+
+    for clients_count in CLIENTS_COUNTS:
+        await run(first_id, clients_count, store)
+        first_id += TASKS_COUNT
+
+    await shutdown_kafka_service(settings)
+
+    if store:
+        await shutdown_database_service()
+
+
+if __name__ == '__main__':
+    asyncio.run(benchmark())
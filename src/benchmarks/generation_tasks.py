@@ -0,0 +1,92 @@
+from core.settings import get_application_settings
+from core.kafka import setup_kafka_service, shutdown_kafka_service, send_generation_task, send_generation_tasks, \
+    get_admission_controller
+
+import asyncio, time
+
+
+TASKS_COUNTS = (10, 100, 1000)
+TASK_ARGUMENTS = ('realistic', 'portrait', 'female', '20-24', 4)
+
+
+async def wait_for_workers(timeout: float = 60) -> None:
+    """
+    Waits until the workers take the tasks of the previous round, so no round runs into the backlog watermark
+
+    :param timeout: Maximum wait (in seconds)
+    :return:
+    """
+
+    settings = get_application_settings()
+
+    if not settings.KAFKA_ADMISSION_ENABLED:
+        return
+
+    admission_controller = get_admission_controller()
+    deadline = time.monotonic() + timeout
+
+    while admission_controller.stats['lag']:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'The workers did not take the tasks in {timeout} s: {admission_controller.stats}')
+
+        await asyncio.sleep(settings.KAFKA_ADMISSION_INTERVAL / 4)
+
+
+async def run_loop(first_id: int, count: int) -> tuple[float, int]:
+    """ Sends tasks one by one without waiting for each acknowledgment, only the bulk API is missing """
+
+    started_at = time.perf_counter()
+
+    deliveries = [send_generation_task(task_id, *TASK_ARGUMENTS) for task_id in range(first_id, first_id + count)]
+    results = await asyncio.gather(*deliveries, return_exceptions=True)
+
+    return time.perf_counter() - started_at, sum(isinstance(x, Exception) for x in results)
+
+
+async def run_batch(first_id: int, count: int) -> tuple[float, int]:
+    """ Sends tasks as one burst """
+
+    started_at = time.perf_counter()
+
+    _, failed = await send_generation_tasks((task_id, *TASK_ARGUMENTS) for task_id in range(first_id, first_id + count))
+
+    return time.perf_counter() - started_at, len(failed)
+
+
+async def benchmark() -> None:
+    """
+    Compares the concurrent submission loop with the bulk submission, the tasks are not awaited,
+    so they are limited only by the backlog watermark of the admission control.
+    Run with KAFKA_SERVICE=memory:// and a small KAFKA_FAKE_WORKER_LATENCY to work offline
+    """
+
+    settings = get_application_settings()
+
+    await setup_kafka_service(settings)
+
+    first_id = int(time.time()) * 10000
+
+    for count in TASKS_COUNTS:
+        await wait_for_workers()
+
+        loop_time, loop_failed = await run_loop(first_id, count)
+        first_id += count
+
+        await wait_for_workers()
+
+        batch_time, batch_failed = await run_batch(first_id, count)
+        first_id += count
+
+        print(
+            f'{count:>5} tasks: loop {loop_time * 1000:>9.1f} ms, batch {batch_time * 1000:>9.1f} ms, '
+            f'speedup x{loop_time / batch_time:.1f}, failed {loop_failed} / {batch_failed}'
+        )
+
+    if settings.KAFKA_ADMISSION_ENABLED:
+        print(f'admission: {get_admission_controller().stats}')
+
+    await shutdown_kafka_service(settings)
+
+
+if __name__ == '__main__':
+    asyncio.run(benchmark())
@@ -0,0 +1,84 @@
+from sqlalchemy import delete
+
+from core.db import get_session_maker, setup_database_service, shutdown_database_service
+from core.settings import get_application_settings
+
+from media.models import Media
+from media.services import create_media_list
+
+import asyncio, time
+
+
+ROWS_COUNTS = (1, 10, 100)
+ROUNDS = 20
+
+
+def get_items(count: int) -> list[tuple[str, str]]:
+    return [(f'benchmark-{x}.png', f'https://example.com/benchmark-{x}.png') for x in range(count)]
+
+
+async def run_loop(count: int) -> tuple[float, list[int]]:
+    """ Saves media objects one by one the way generation results used to be saved """
+
+    started_at = time.perf_counter()
+
+    async with get_session_maker() as session:
+        media_list = [Media(name=name, url=url) for name, url in get_items(count)]
+
+        for media in media_list:
+            session.add(media)
+
+        await session.commit()
+
+        for media in media_list:
+            await session.refresh(media)
+
+    return time.perf_counter() - started_at, [x.id for x in media_list]
+
+
+async def run_bulk(count: int) -> tuple[float, list[int]]:
+    """ Saves media objects with one statement """
+
+    started_at = time.perf_counter()
+
+    media_list = await create_media_list(get_items(count))
+
+    return time.perf_counter() - started_at, [x.id for x in media_list]
+
+
+async def benchmark() -> None:
+    """ Compares the per-object persistence with the bulk insert """
+
+    settings = get_application_settings()
+
+    await setup_database_service(settings)
+
+    media_ids = []
+
+    try:
+        for count in ROWS_COUNTS:
+            loop_time = bulk_time = 0
+
+            for _ in range(ROUNDS):
+                elapsed, ids = await run_loop(count)
+                loop_time += elapsed
+                media_ids += ids
+
+                elapsed, ids = await run_bulk(count)
+                bulk_time += elapsed
+                media_ids += ids
+
+            print(
+                f'{count:>4} rows: loop {loop_time / ROUNDS * 1000:>7.2f} ms, '
+                f'bulk {bulk_time / ROUNDS * 1000:>7.2f} ms, speedup x{loop_time / bulk_time:.1f}'
+            )
+    finally:
+        async with get_session_maker() as session:
+            await session.execute(delete(Media).where(Media.id.in_(media_ids)))
+            await session.commit()
+
+        await shutdown_database_service()
+
+
+if __name__ == '__main__':
+    asyncio.run(benchmark())
@@ -0,0 +1,157 @@
+from sqlalchemy import select, update, func, text
+from sqlalchemy.dialects import postgresql
+
+from core.db import get_session_maker, setup_database_service, shutdown_database_service
+from core.settings import get_application_settings
+
+from messenger.types import Role
+from messenger.models import Message, AssistantMessage, Dialog
+
+from typing import TYPE_CHECKING
+
+import asyncio, sys
+
+if TYPE_CHECKING:
+    from sqlalchemy import Executable
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+USER_ID = 1
+AVATAR_ID = 1
+MESSAGE_ID = 1000000
+
+
+def get_checks() -> list[tuple[str, 'Executable', set[str]]]:
+    """ Hot messenger queries and the indexes any of which their plans must use """
+
+    dialog = (Message.user_id == USER_ID, Message.avatar_id == AVATAR_ID)
+    today = Message.created_at.between(func.current_date(), func.now())
+
+    return [
+        (
+            'dialog messages page',
+            select(Message).where(*dialog, Message.id < MESSAGE_ID).order_by(Message.id.desc()).limit(20),
+            {'ix_messages_user_id_avatar_id_id'},
+        ),
+        (
+            'dialog messages count',
+            select(func.count(Message.id)).where(*dialog, Message.role == Role.USER),
+            {'ix_messages_user_id_avatar_id_id', 'ix_messages_user_id_avatar_id_created_at'},
+        ),
+        (
+            'dialog messages by date',
+            select(func.count(Message.id)).where(*dialog, today),
+            {'ix_messages_user_id_avatar_id_created_at'},
+        ),
+        (
+            'photos sent today',
+            select(func.count(Message.id)).where(*dialog, today, Message.photo_id != None),
+            {'ix_messages_photo'},
+        ),
+        (
+            'last message with photo',
+            select(Message).where(*dialog, Message.photo_id != None).order_by(Message.id.desc()).limit(1),
+            {'ix_messages_photo', 'ix_messages_user_id_avatar_id_id'},
+        ),
+        (
+            'mark dialog read',
+            update(Message).where(*dialog, Message.unread_mark == True).values(unread_mark=False),
+            {'ix_messages_unread'},
+        ),
+        (
+            'assistant messages page',
+            select(AssistantMessage).where(
+                AssistantMessage.user_id == USER_ID,
+                AssistantMessage.id < MESSAGE_ID,
+            ).order_by(AssistantMessage.id.desc()).limit(20),
+            {'ix_assistant_messages_user_id_id'},
+        ),
+        (
+            'assistant messages by date',
+            select(func.count(AssistantMessage.id)).where(
+                AssistantMessage.user_id == USER_ID,
+                AssistantMessage.created_at.between(func.current_date(), func.now()),
+            ),
+            {'ix_assistant_messages_user_id_created_at'},
+        ),
+        (
+            'dialog list',
+            select(Dialog).where(Dialog.user_id == USER_ID).order_by(Dialog.last_message_id.desc()).limit(20),
+            {'ix_dialogs_user_id_last_message_id'},
+        ),
+    ]
+
+
+def get_index_names(plan: dict) -> set[str]:
+    """ Collects names of the indexes used by the plan node and its children """
+
+    names = {plan['Index Name']} if 'Index Name' in plan else set()
+
+    for child in plan.get('Plans', ()):
+        names |= get_index_names(child)
+
+    return names
+
+
+async def explain(session: 'AsyncSession', statement: 'Executable') -> set[str]:
+    """
+    Returns indexes of the plan, the sequential scan is disabled since it wins on small tables anyway
+
+    :param session: Database session
+    :param statement: Checked statement
+    :return: Index names
+    """
+
+    sql = statement.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+
+    await session.execute(text('SET LOCAL enable_seqscan = off'))
+    query = await session.execute(text(f'EXPLAIN (FORMAT JSON) {sql}'))
+
+    return get_index_names(query.scalar_one()[0]['Plan'])
+
+
+async def get_plans() -> list[tuple[str, set[str], set[str]]]:
+    """
+    Explains the hot messenger queries against the migrated database
+
+    :return: Query name, indexes used by its plan and indexes any of which it must use
+    """
+
+    settings = get_application_settings()
+
+    await setup_database_service(settings)
+
+    plans = []
+
+    try:
+        async with get_session_maker() as session:
+            for name, statement, expected in get_checks():
+                plans.append((name, await explain(session, statement), expected))
+
+            await session.rollback()
+    finally:
+        await shutdown_database_service()
+
+    return plans
+
+
+async def check_plans() -> None:
+    """
+    Asserts the hot messenger queries are planned as index scans of the indexes added by the migrations,
+    the exit code is 1 if any plan misses its index (tests/test_messages_plans.py runs the same check)
+    """
+
+    failures = 0
+
+    for name, used, expected in await get_plans():
+        is_passed = bool(used & expected)
+        failures += not is_passed
+
+        print(f'{"OK  " if is_passed else "FAIL"} {name}: uses {", ".join(sorted(used)) or "no index"}')
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(check_plans())
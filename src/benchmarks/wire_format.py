@@ -0,0 +1,54 @@
+from core.kafka.codec import encode, decode, build_headers, peek_task_id
+from core.kafka.schemas import ImageTask, ImageAttemptInfo, ImageResult
+
+import timeit
+
+
+ITERATIONS = 100000
+
+
+def build_result() -> ImageResult:
+    return ImageResult(
+        id=1234567,
+        model='realistic',
+        prompt='portrait',
+        gender='female',
+        age='20-24',
+        images_count=4,
+        info=ImageAttemptInfo(attempt=1, last_attempt_error=''),
+        images=[f'generated/1234567/image_{i}.png' for i in range(4)],
+        status='success',
+        message='',
+    )
+
+
+def measure(name: str, statement) -> None:
+    elapsed = timeit.timeit(statement, number=ITERATIONS)
+    print(f'{name:<28} {elapsed / ITERATIONS * 1e6:>8.2f} us')
+
+
+def benchmark() -> None:
+    """ Compares the JSON and the binary wire formats """
+
+    result = build_result()
+    task = ImageTask.model_validate(result.model_dump())
+
+    for wire_format in ('json', 'binary'):
+        task_value = encode(task, wire_format=wire_format)
+        result_value = encode(result, wire_format=wire_format)
+        headers = [(k, v.encode('utf-8')) for k, v in build_headers(result, wire_format=wire_format).items()]
+        headerless = None
+
+        print(f'{wire_format}: task {len(task_value)} bytes, result {len(result_value)} bytes')
+
+        measure('encode task', lambda: encode(task, wire_format=wire_format))
+        measure('encode result', lambda: encode(result, wire_format=wire_format))
+        measure('decode result', lambda: decode(result_value, headers, ImageResult))
+        measure('peek task id (header)', lambda: peek_task_id(result_value, headers))
+
+        if wire_format == 'binary':
+            measure('peek task id (payload)', lambda: peek_task_id(result_value, headerless))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,127 @@
+from starlette.websockets import WebSocketState
+
+from core.streams import EventEnvelope
+
+from media.schemas import MediaSchema
+
+from messenger.types import ChatSchema, MessageSchema, WSMessageSchema
+from messenger.managers import OutboundConnection
+
+from datetime import datetime
+
+import asyncio, time
+
+
+SOCKETS_COUNTS = (1, 10, 100)
+EVENTS = 200
+
+
+class BenchmarkWebSocket:
+    """ Accepted websocket which only counts sent frames """
+
+    application_state = WebSocketState.CONNECTED
+
+    def __init__(self) -> None:
+        self.received = 0
+        self.is_done = asyncio.Event()
+
+    async def send_text(self, data: str) -> None:
+        self.received += 1
+
+        if self.received == EVENTS:
+            self.is_done.set()
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+def get_message(index: int) -> WSMessageSchema:
+    return WSMessageSchema(
+        type='message',
+        content=MessageSchema(
+            id=index,
+            text='Lorem ipsum dolor sit amet, consectetur adipiscing elit ' * 4,
+            photo=MediaSchema(id=index, name=f'benchmark-{index}.png', url=f'https://example.com/{index}.png'),
+            unread_mark=True,
+            created_at=datetime.now(),
+            from_user=ChatSchema(id=1, name='Avatar', is_online=True, is_avatar=True, photo=None),
+        ),
+    )
+
+
+async def run_per_socket(count: int) -> float:
+    """ Encodes the schema for every socket the way ConnectionManager.broadcast used to """
+
+    websockets = [BenchmarkWebSocket() for _ in range(count)]
+    messages = [get_message(x) for x in range(EVENTS)]
+
+    started_at = time.perf_counter()
+
+    for message in messages:
+        for websocket in websockets:
+            await websocket.send_text(message.model_dump_json())
+
+    return time.perf_counter() - started_at
+
+
+async def run_envelope(count: int) -> float:
+    """ Encodes the schema once and sends the same text to every socket """
+
+    websockets = [BenchmarkWebSocket() for _ in range(count)]
+    messages = [get_message(x) for x in range(EVENTS)]
+
+    started_at = time.perf_counter()
+
+    for message in messages:
+        event = EventEnvelope.from_schema(message)
+
+        for websocket in websockets:
+            await websocket.send_text(event.text)
+
+    return time.perf_counter() - started_at
+
+
+async def run_queued(count: int) -> float:
+    """ Passes the envelope through the outbound queues and waits for every writer """
+
+    websockets = [BenchmarkWebSocket() for _ in range(count)]
+    connections = [OutboundConnection(x, user_id=1, size=EVENTS) for x in websockets]
+    messages = [get_message(x) for x in range(EVENTS)]
+
+    for connection in connections:
+        connection.start()
+
+    started_at = time.perf_counter()
+
+    for message in messages:
+        event = EventEnvelope.from_schema(message)
+
+        for connection in connections:
+            connection.put(event, key=event.type)
+
+    await asyncio.gather(*[x.is_done.wait() for x in websockets])
+
+    elapsed = time.perf_counter() - started_at
+
+    await asyncio.gather(*[x.stop() for x in connections])
+
+    return elapsed
+
+
+async def benchmark() -> None:
+    """ Compares the per-socket encoding with the pre-encoded envelope """
+
+    for count in SOCKETS_COUNTS:
+        per_socket_time = await run_per_socket(count)
+        envelope_time = await run_envelope(count)
+        queued_time = await run_queued(count)
+
+        print(
+            f'{count:>4} sockets: per socket {per_socket_time / EVENTS * 1e6:>8.1f} us/event, '
+            f'envelope {envelope_time / EVENTS * 1e6:>8.1f} us/event, speedup x{per_socket_time / envelope_time:.1f}, '
+            f'through queues {queued_time / EVENTS * 1e6:>8.1f} us/event'
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(benchmark())
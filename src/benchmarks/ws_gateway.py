@@ -0,0 +1,261 @@
+from fastapi import WebSocket, WebSocketException
+from fastapi.security.utils import get_authorization_scheme_param
+from fastapi_users.jwt import decode_jwt
+
+from starlette.status import WS_1008_POLICY_VIOLATION
+
+from core.auth.base import get_jwt_strategy
+from core.settings import get_application_settings
+from core.streams import EventEnvelope, publish_event
+from core.broadcaster import is_memory_broadcast, setup_broadcast_service, shutdown_broadcast_service
+from core.pubsub import get_channel_multiplexer, setup_pubsub_service, shutdown_pubsub_service
+
+from users.dependencies import ws_current_user
+
+from messenger.managers import get_connection_manager, get_user_channel
+
+from main import app
+
+from dataclasses import dataclass
+
+import argparse, asyncio, json, os, random, resource, statistics, time
+
+
+@dataclass
+class LoadTestUser:
+    id: int
+
+
+async def ws_token_user(websocket: WebSocket) -> LoadTestUser:
+    """ Verifies the JWT of the socket like ws_current_user but without loading the user from the database """
+
+    scheme, token = get_authorization_scheme_param(websocket.headers.get('Authorization'))
+
+    if scheme.lower() != 'bearer':
+        raise WebSocketException(code=WS_1008_POLICY_VIOLATION, reason='Not authenticated')
+
+    strategy = get_jwt_strategy()
+
+    try:
+        data = decode_jwt(token, strategy.decode_key, strategy.token_audience, algorithms=[strategy.algorithm])
+    except Exception:
+        raise WebSocketException(code=WS_1008_POLICY_VIOLATION, reason='Not authenticated')
+
+    return LoadTestUser(id=int(data['sub']))
+
+
+class VirtualWebSocket:
+    """ Websocket client talking to the ASGI application in the same event loop """
+
+    user_id: int
+    latencies: list[float]
+    received: int
+    is_accepted: bool
+    close_code: int | None
+
+    _path: str
+    _token: str
+    _incoming: asyncio.Queue
+    _accepted: asyncio.Future
+    _application: asyncio.Task | None = None
+
+    def __init__(self, path: str, user_id: int, token: str, latencies: list[float]) -> None:
+        self.user_id = user_id
+        self.latencies = latencies
+        self.received = 0
+        self.is_accepted = False
+        self.close_code = None
+
+        self._path = path
+        self._token = token
+        self._incoming = asyncio.Queue()
+        self._accepted = asyncio.get_running_loop().create_future()
+
+    async def connect(self) -> bool:
+        """
+        Runs the websocket endpoint of the application and waits for the handshake
+
+        :return: Whether the connection was accepted
+        """
+
+        scope = {
+            'type': 'websocket',
+            'asgi': {'version': '3.0'},
+            'scheme': 'ws',
+            'http_version': '1.1',
+            'path': self._path,
+            'raw_path': self._path.encode('utf-8'),
+            'root_path': '',
+            'query_string': b'',
+            'headers': [(b'host', b'loadtest'), (b'authorization', f'Bearer {self._token}'.encode('utf-8'))],
+            'client': ('127.0.0.1', 0),
+            'server': ('loadtest', 80),
+            'subprotocols': [],
+            'state': {},
+        }
+
+        self._incoming.put_nowait({'type': 'websocket.connect'})
+        self._application = asyncio.create_task(app(scope, self._incoming.get, self._send))
+        self.is_accepted = await self._accepted
+
+        return self.is_accepted
+
+    async def close(self) -> None:
+        """ Sends the disconnect to the endpoint and waits for it to finish """
+
+        if self._application is None:
+            return
+
+        self._incoming.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.gather(self._application, return_exceptions=True)
+
+    async def _send(self, message: dict) -> None:
+        if message['type'] == 'websocket.accept':
+            self._accepted.set_result(True)
+        elif message['type'] == 'websocket.close':
+            self.close_code = message.get('code', 1000)
+
+            if not self._accepted.done():
+                self._accepted.set_result(False)
+        elif message['type'] == 'websocket.send':
+            received_at = time.perf_counter()
+            payload = json.loads(message.get('text') or message.get('bytes'))
+
+            if payload.get('type') == 'load_test':
+                self.latencies.append(received_at - payload['sent_at'])
+                self.received += 1
+
+
+def get_rss() -> int:
+    """ Resident memory of the process in bytes """
+
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def open_sockets(path: str, sockets_count: int, users_count: int, concurrency: int) -> list[VirtualWebSocket]:
+    """ Opens authenticated sockets with the limited number of concurrent handshakes """
+
+    strategy = get_jwt_strategy()
+    tokens = [await strategy.write_token(LoadTestUser(id=x)) for x in range(1, users_count + 1)]
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def open_socket(index: int) -> VirtualWebSocket:
+        user_id = index % users_count + 1
+        websocket = VirtualWebSocket(path, user_id, tokens[user_id - 1], latencies)
+
+        async with semaphore:
+            await websocket.connect()
+
+        return websocket
+
+    return list(await asyncio.gather(*(open_socket(x) for x in range(sockets_count))))
+
+
+async def publish_events(users_count: int, rate: float, duration: float) -> dict[int, int]:
+    """
+    Publishes events to random users at the fixed rate
+
+    :return: Number of events published to each user
+    """
+
+    published = {}
+    events_count = int(rate * duration)
+    started_at = time.perf_counter()
+
+    for index in range(events_count):
+        delay = started_at + index / rate - time.perf_counter()
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        user_id = random.randint(1, users_count)
+        payload = {'type': 'load_test', 'sequence': index, 'sent_at': time.perf_counter()}
+
+        await publish_event(
+            get_user_channel(user_id),
+            EventEnvelope(json.dumps(payload).encode('utf-8'), type='load_test'),
+            is_durable=False,
+        )
+
+        published[user_id] = published.get(user_id, 0) + 1
+
+    return published
+
+
+async def benchmark(arguments: argparse.Namespace) -> None:
+    """
+    Opens many /messages/ws sockets in process and measures how fast events reach them,
+    run with BROADCAST_URL=memory:// and PRESENCE_ENABLED=false to work without Redis,
+    the database is not used since the JWT is verified without loading the user
+    """
+
+    settings = get_application_settings()
+
+    if not is_memory_broadcast():
+        print(f'Running against the real broadcast backend: {settings.BROADCAST_URL or settings.REDIS_URL}')
+
+    app.dependency_overrides[ws_current_user] = ws_token_user
+
+    await setup_broadcast_service(settings)
+    await setup_pubsub_service(settings)
+
+    users_count = arguments.users or arguments.sockets
+    rss_before = get_rss()
+
+    started_at = time.perf_counter()
+    websockets = await open_sockets(arguments.path, arguments.sockets, users_count, arguments.concurrency)
+    connect_time = time.perf_counter() - started_at
+
+    accepted = [x for x in websockets if x.is_accepted]
+    memory_per_socket = (get_rss() - rss_before) / max(len(accepted), 1)
+
+    published = await publish_events(users_count, arguments.rate, arguments.duration)
+    await asyncio.sleep(arguments.drain)
+
+    expected = sum(published.get(x.user_id, 0) for x in accepted)
+    received = sum(x.received for x in accepted)
+    latencies = [x for websocket in accepted for x in websocket.latencies]
+    manager_stats = get_connection_manager().stats
+    multiplexer_stats = get_channel_multiplexer().stats
+
+    await asyncio.gather(*(x.close() for x in websockets))
+
+    await shutdown_pubsub_service(settings)
+    await shutdown_broadcast_service(settings)
+
+    print(
+        f'sockets: {len(accepted)}/{arguments.sockets} accepted, {len(accepted) / connect_time:.1f} connects/s, '
+        f'{memory_per_socket / 1024:.1f} KiB/socket (server and client side)'
+    )
+
+    if len(latencies) >= 2:
+        p50, p99 = (statistics.quantiles(latencies, n=100)[x - 1] * 1000 for x in (50, 99))
+        print(f'delivery: p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {max(latencies) * 1000:.2f} ms')
+
+    print(
+        f'events: {sum(published.values())} published, {received}/{expected} delivered, '
+        f'{expected - received} lost, {manager_stats["dropped"]} dropped by queues, '
+        f'{multiplexer_stats["dropped"]} without subscribers'
+    )
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Websocket gateway load test')
+    parser.add_argument('--path', default='/api/v1/messages/ws', help='websocket path')
+    parser.add_argument('--sockets', type=int, default=2000, help='number of sockets')
+    parser.add_argument('--users', type=int, default=0, help='number of users (one socket per user by default)')
+    parser.add_argument('--concurrency', type=int, default=100, help='concurrent handshakes')
+    parser.add_argument('--rate', type=float, default=1000, help='published events per second')
+    parser.add_argument('--duration', type=float, default=10, help='publishing time (in seconds)')
+    parser.add_argument('--drain', type=float, default=1, help='time to wait for the last events (in seconds)')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(benchmark(parse_arguments()))
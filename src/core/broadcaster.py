@@ -1,20 +1,143 @@
-from broadcaster import Broadcast
+from broadcaster import Broadcast, Event
 
 from core.settings import get_application_settings
 
 from loguru import logger
 
+from fnmatch import fnmatchcase
 from functools import lru_cache
-from typing import TYPE_CHECKING
+from typing import Any, TYPE_CHECKING
+
+import asyncio
 
 if TYPE_CHECKING:
     from core.settings import Settings
 
 
+MEMORY_SCHEME = 'memory://'
+
+
+def get_broadcast_url() -> str:
+    settings = get_application_settings()
+    return settings.BROADCAST_URL or str(settings.REDIS_URL)
+
+
+def is_memory_broadcast() -> bool:
+    return get_broadcast_url().startswith(MEMORY_SCHEME)
+
+
+class MemoryPubSub:
+    """ In-process subscription with the subset of the redis PubSub interface used by ChannelMultiplexer """
+
+    _backend: 'MemoryBroadcastBackend'
+    _channels: set[str]
+    _patterns: set[str]
+    _queue: asyncio.Queue
+
+    def __init__(self, backend: 'MemoryBroadcastBackend') -> None:
+        self._backend = backend
+        self._channels = set()
+        self._patterns = set()
+        self._queue = asyncio.Queue()
+
+    def is_matching(self, channel: str) -> bool:
+        return channel in self._channels or any(fnmatchcase(channel, x) for x in self._patterns)
+
+    def put(self, channel: str, data: bytes) -> None:
+        self._queue.put_nowait({'type': 'message', 'pattern': None, 'channel': channel.encode('utf-8'), 'data': data})
+
+    async def subscribe(self, *channels: str) -> None:
+        self._channels.update(channels)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        self._channels.difference_update(channels)
+
+    async def psubscribe(self, *patterns: str) -> None:
+        self._patterns.update(patterns)
+
+    async def get_message(self, ignore_subscribe_messages: bool = True, timeout: float = 0) -> dict | None:
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self) -> None:
+        self._backend.release(self)
+
+
+class MemoryBroadcastBackend:
+    """
+    Broadcast backend of the memory:// URL which also delivers to the pub/sub multiplexer,
+    used by load tests and local runs without Redis
+    """
+
+    _subscribed: set[str]
+    _pubsubs: set[MemoryPubSub]
+    _published: asyncio.Queue
+
+    def __init__(self) -> None:
+        self._subscribed = set()
+        self._pubsubs = set()
+        self._published = asyncio.Queue()
+
+    async def connect(self) -> None:
+        pass
+
+    async def disconnect(self) -> None:
+        pass
+
+    async def subscribe(self, channel: str) -> None:
+        self._subscribed.add(channel)
+
+    async def unsubscribe(self, channel: str) -> None:
+        self._subscribed.discard(channel)
+
+    async def publish(self, channel: str, message: Any) -> int:
+        """
+        Delivers the message to the matching subscriptions of this process
+
+        :param channel: Channel name
+        :param message: Encoded message
+        :return: Number of pub/sub subscriptions which received the message
+        """
+
+        data = message if isinstance(message, bytes) else str(message).encode('utf-8')
+        receivers = 0
+
+        for pubsub in self._pubsubs:
+            if pubsub.is_matching(channel):
+                pubsub.put(channel, data)
+                receivers += 1
+
+        if channel in self._subscribed:
+            self._published.put_nowait(Event(channel=channel, message=data.decode('utf-8')))
+
+        return receivers
+
+    async def next_published(self) -> Event:
+        return await self._published.get()
+
+    def pubsub(self, ignore_subscribe_messages: bool = True) -> MemoryPubSub:
+        pubsub = MemoryPubSub(self)
+        self._pubsubs.add(pubsub)
+
+        return pubsub
+
+    def release(self, pubsub: MemoryPubSub) -> None:
+        self._pubsubs.discard(pubsub)
+
+
+@lru_cache
+def get_memory_broadcast_backend() -> MemoryBroadcastBackend:
+    return MemoryBroadcastBackend()
+
+
 @lru_cache
 def get_broadcast() -> Broadcast:
-    settings = get_application_settings()
-    return Broadcast(str(settings.REDIS_URL))
+    if is_memory_broadcast():
+        return Broadcast(backend=get_memory_broadcast_backend())
+
+    return Broadcast(get_broadcast_url())
 
 
 async def setup_broadcast_service(_) -> None:
@@ -30,6 +153,12 @@ async def shutdown_broadcast_service(_) -> None:
 
 
 __all__ = (
+    'MEMORY_SCHEME',
+    'get_broadcast_url',
+    'is_memory_broadcast',
+    'MemoryPubSub',
+    'MemoryBroadcastBackend',
+    'get_memory_broadcast_backend',
     'get_broadcast',
     'setup_broadcast_service',
     'shutdown_broadcast_service',
@@ -0,0 +1,249 @@
+from core.redis import get_redis
+from core.settings import get_application_settings
+from core.pubsub import get_channel_multiplexer
+from core.streams import EventEnvelope, publish_event
+
+from loguru import logger
+
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Awaitable, Callable, TYPE_CHECKING
+
+import asyncio, time
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+
+Loader = Callable[[], Awaitable[bool]]
+
+
+class EntitlementCache:
+    """ Boolean entitlements (subscription etc.) cached by the process LRU in front of the shared Redis keys """
+
+    _redis: 'Redis'
+    _channel: str
+    _ttl: int
+    _negative_ttl: int
+    _stale_ttl: int
+    _max_size: int
+    _local: OrderedDict[str, tuple[bool, float]]
+    _inflight: dict[str, asyncio.Task]
+    _counters: dict[str, int]
+
+    def __init__(
+        self,
+        redis: 'Redis',
+        channel: str = 'entitlements',
+        ttl: int = 300,
+        negative_ttl: int = 60,
+        stale_ttl: int = 3600,
+        max_size: int = 10000,
+    ) -> None:
+        """
+        The entry older than its ttl is still returned until the stale ttl while one background load refreshes it,
+        concurrent loads of the same entry are merged into one
+
+        :param redis: Redis client
+        :param channel: Channel which delivers invalidations to other processes
+        :param ttl: Time the granted entitlement is fresh (in seconds)
+        :param negative_ttl: Time the missing entitlement is fresh (in seconds)
+        :param stale_ttl: Time the entry may be returned while it is refreshed (in seconds)
+        :param max_size: Maximum number of entries kept by this process
+        """
+
+        self._redis = redis
+        self._channel = channel
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._stale_ttl = stale_ttl
+        self._max_size = max_size
+        self._local = OrderedDict()
+        self._inflight = {}
+        self._counters = {'hits': 0, 'stale': 0, 'loads': 0}
+
+    @staticmethod
+    def get_key(kind: str, identifier: int | str) -> str:
+        return f'entitlement:{kind}:{identifier}'
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {**self._counters, 'local': len(self._local), 'inflight': len(self._inflight)}
+
+    async def start(self) -> None:
+        """ Starts receiving invalidations from other processes """
+
+        await get_channel_multiplexer().subscribe(self._channel, self._on_invalidate)
+
+    async def stop(self) -> None:
+        """ Stops receiving invalidations and waits for the running loads """
+
+        await get_channel_multiplexer().unsubscribe(self._channel, self._on_invalidate)
+        await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+
+        self._local.clear()
+
+    async def get(self, kind: str, identifier: int | str, load: Loader, is_revalidated: bool = False) -> bool:
+        """
+        Returns the cached entitlement, it is loaded only on a miss or when the entry is too old
+
+        :param kind: Entitlement kind, like "subscription"
+        :param identifier: Owner identifier
+        :param load: Coroutine function which asks the source of truth
+        :param is_revalidated: Whether the cached entry must be ignored (before denying something, for example)
+        :return: Whether the entitlement is granted
+        """
+
+        key = self.get_key(kind, identifier)
+
+        if not is_revalidated:
+            entry = self._local.get(key)
+
+            if entry is not None:
+                self._local.move_to_end(key)
+            else:
+                entry = await self._read(key)
+
+            if entry is not None:
+                value, loaded_at = entry
+                age = time.time() - loaded_at
+
+                if age < (self._ttl if value else self._negative_ttl):
+                    self._counters['hits'] += 1
+                    return value
+
+                if age < self._stale_ttl:
+                    self._counters['stale'] += 1
+                    self._load(key, load).add_done_callback(self._on_background_load)
+                    return value
+
+        return await asyncio.shield(self._load(key, load))
+
+    async def invalidate(self, kind: str, identifier: int | str) -> None:
+        """
+        Drops the entry everywhere, must be called when the entitlement changes (purchase, refund, etc.)
+
+        :param kind: Entitlement kind
+        :param identifier: Owner identifier
+        :return:
+        """
+
+        key = self.get_key(kind, identifier)
+
+        self._forget(key)
+
+        await self._redis.delete(key)
+        await publish_event(channel=self._channel, event=EventEnvelope(key.encode('utf-8')), is_durable=False)
+
+    async def _read(self, key: str) -> tuple[bool, float] | None:
+        """
+        Reads the shared entry and keeps it in this process
+
+        :param key: Entry key
+        :return: Entitlement and the time it was loaded or None if there is no entry
+        """
+
+        data = await self._redis.get(key)
+
+        if data is None:
+            return None
+
+        value, loaded_at = data.decode('utf-8').split(':', 1)
+        entry = value == '1', float(loaded_at)
+
+        self._remember(key, entry)
+
+        return entry
+
+    def _load(self, key: str, load: Loader) -> asyncio.Task:
+        """
+        Starts loading the entry unless it is being loaded already
+
+        :param key: Entry key
+        :param load: Coroutine function which asks the source of truth
+        :return: Task of the load
+        """
+
+        task = self._inflight.get(key)
+
+        if task is None:
+            task = asyncio.create_task(self._store(key, load))
+            task.add_done_callback(lambda x: self._inflight.pop(key) if self._inflight.get(key) is x else None)
+
+            self._inflight[key] = task
+
+        return task
+
+    async def _store(self, key: str, load: Loader) -> bool:
+        """
+        Loads the entry and stores it in both tiers unless it was invalidated meanwhile
+
+        :param key: Entry key
+        :param load: Coroutine function which asks the source of truth
+        :return: Whether the entitlement is granted
+        """
+
+        self._counters['loads'] += 1
+
+        value = await load()
+
+        if self._inflight.get(key) is asyncio.current_task():
+            entry = value, time.time()
+
+            self._remember(key, entry)
+            await self._redis.set(key, f'{int(value)}:{entry[1]}', ex=self._stale_ttl)
+
+        return value
+
+    def _remember(self, key: str, entry: tuple[bool, float]) -> None:
+        self._local[key] = entry
+        self._local.move_to_end(key)
+
+        while len(self._local) > self._max_size:
+            self._local.popitem(last=False)
+
+    def _forget(self, key: str) -> None:
+        self._local.pop(key, None)
+        self._inflight.pop(key, None)
+
+    @staticmethod
+    def _on_background_load(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f'Can\'t refresh entitlement: {task.exception()}')
+
+    async def _on_invalidate(self, _: str, event: EventEnvelope) -> None:
+        self._forget(event.data.decode('utf-8'))
+
+
+@lru_cache
+def get_entitlement_cache() -> EntitlementCache:
+    settings = get_application_settings()
+
+    return EntitlementCache(
+        redis=get_redis(),
+        channel=settings.ENTITLEMENT_CHANNEL,
+        ttl=settings.ENTITLEMENT_TTL,
+        negative_ttl=settings.ENTITLEMENT_NEGATIVE_TTL,
+        stale_ttl=settings.ENTITLEMENT_STALE_TTL,
+        max_size=settings.ENTITLEMENT_LOCAL_MAX_SIZE,
+    )
+
+
+async def setup_entitlement_service(_) -> None:
+    entitlement_cache = get_entitlement_cache()
+    await entitlement_cache.start()
+
+    logger.debug('setup_entitlement_service() attached')
+
+
+async def shutdown_entitlement_service(_) -> None:
+    entitlement_cache = get_entitlement_cache()
+    await entitlement_cache.stop()
+
+
+__all__ = (
+    'EntitlementCache',
+    'get_entitlement_cache',
+    'setup_entitlement_service',
+    'shutdown_entitlement_service',
+)
@@ -3,7 +3,12 @@ from loguru import logger
 from typing import TYPE_CHECKING
 
 from .db import setup_database_service, shutdown_database_service
+from .redis import setup_redis_service, shutdown_redis_service
 from .broadcaster import setup_broadcast_service, shutdown_broadcast_service
+from .pubsub import setup_pubsub_service, shutdown_pubsub_service
+from .presence import setup_presence_service, shutdown_presence_service
+from .entitlements import setup_entitlement_service, shutdown_entitlement_service
+from .kafka import setup_kafka_service, shutdown_kafka_service
 
 if TYPE_CHECKING:
     from .settings import Settings
@@ -15,7 +20,12 @@ async def on_startup_handler(settings: 'Settings') -> None:
     logger.debug('Application startup requested')
 
     await setup_database_service(settings)
+    await setup_redis_service(settings)
     await setup_broadcast_service(settings)
+    await setup_pubsub_service(settings)
+    await setup_presence_service(settings)
+    await setup_entitlement_service(settings)
+    await setup_kafka_service(settings)
 
 
 async def on_shutdown_handler(settings: 'Settings') -> None:
@@ -23,8 +33,13 @@ async def on_shutdown_handler(settings: 'Settings') -> None:
 
     logger.debug('Application shutdown requested')
 
+    await shutdown_kafka_service(settings)
     await shutdown_database_service()
+    await shutdown_entitlement_service(settings)
+    await shutdown_presence_service(settings)
+    await shutdown_pubsub_service(settings)
     await shutdown_broadcast_service(settings)
+    await shutdown_redis_service(settings)
 
 
 __all__ = (
@@ -25,7 +25,11 @@ def http_exception_handler(_: Request, exception: HTTPException) -> JSONResponse
     else:
         serializer.errors = [Error(detail=exception.detail, code=str(exception.status_code))]
 
-    return JSONResponse(serializer.model_dump(exclude_none=True), status_code=exception.status_code)
+    return JSONResponse(
+        serializer.model_dump(exclude_none=True),
+        status_code=exception.status_code,
+        headers=exception.headers,
+    )
 
 
 def request_validation_exception_handler(
@@ -49,7 +53,11 @@ def api_error_handler(_: Request, exception: 'APIError') -> JSONResponse:
             field=exception.field,
         )]
 
-    return JSONResponse(serializer.model_dump(exclude_none=True), status_code=exception.status_code)
+    return JSONResponse(
+        serializer.model_dump(exclude_none=True),
+        status_code=exception.status_code,
+        headers=exception.headers,
+    )
 
 
 validation_error_response_definition['properties'] = {
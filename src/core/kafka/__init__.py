@@ -1,48 +1,240 @@
-from confluent_kafka import Producer, Consumer
-from pydantic.errors import PydanticUserError
+from confluent_kafka import Producer, Consumer, TopicPartition, OFFSET_END
+from pydantic import TypeAdapter
 
-from core.db import get_session_maker
+from core.redis import get_redis
 from core.settings import get_application_settings
 
 from media.models import Media
+from media.services import create_media_list
 
 from .schemas import ImageTask, ImageResult
 from .exceptions import KafkaError
+from .bridge import AsyncConsumer
+from .dispatcher import ResultDispatcher, is_partial
+from .producer import ProducerService
+from .cache import GenerationCache
+from .retry import RetryScheduler
+from .admission import AdmissionController
+from .codec import encode, build_headers
+from .routing import get_routing_key, get_partition
+from .memory import MemoryBroker, MemoryProducer, MemoryConsumer, is_memory_transport
+from .worker import FakeWorker
 
 from functools import lru_cache
+from typing import AsyncIterator, Iterable, TYPE_CHECKING
 
 from loguru import logger
 
-import time, os
+import asyncio, os
+
+if TYPE_CHECKING:
+    from core.settings import Settings
+
+
+_IMAGE_TASK_FIELDS = ('id', 'model', 'prompt', 'gender', 'age', 'images_count')
+_image_tasks_adapter = TypeAdapter(list[ImageTask])
+
+
+@lru_cache
+def get_memory_broker() -> MemoryBroker:
+    settings = get_application_settings()
+
+    return MemoryBroker(partitions=settings.KAFKA_MEMORY_PARTITIONS)
 
 
 @lru_cache
-def get_kafka_producer() -> Producer:
+def get_kafka_producer() -> Producer | MemoryProducer:
     settings = get_application_settings()
 
-    return Producer({
+    config = {
         'bootstrap.servers': settings.KAFKA_SERVICE,
-        'group.id': 'sd-backend',
-    })
+        'linger.ms': settings.KAFKA_LINGER_MS,
+        'batch.size': settings.KAFKA_BATCH_SIZE,
+        'compression.type': settings.KAFKA_COMPRESSION_TYPE,
+        'acks': settings.KAFKA_ACKS,
+        'queue.buffering.max.messages': settings.KAFKA_QUEUE_MAX_MESSAGES,
+        'enable.idempotence': settings.KAFKA_ENABLE_IDEMPOTENCE,
+        'partitioner': 'murmur2_random',
+    }
+
+    if is_memory_transport(settings.KAFKA_SERVICE):
+        return MemoryProducer(get_memory_broker(), config)
+
+    return Producer(config)
 
 
-def get_kafka_consumer(topic: str) -> Consumer:
+@lru_cache
+def get_producer_service() -> ProducerService:
+    settings = get_application_settings()
+
+    return ProducerService(producer=get_kafka_producer(), buffer_timeout=settings.KAFKA_BUFFER_TIMEOUT)
+
+
+def get_kafka_consumer(group_id: str = None, auto_offset_reset: str = 'latest') -> Consumer | MemoryConsumer:
     settings = get_application_settings()
 
-    consumer = Consumer({
+    config = {
         'bootstrap.servers': settings.KAFKA_SERVICE,
-        'auto.offset.reset': 'earliest',
-        'group.id': f'sd-backend-{os.getpid()}',
-    })
+        'auto.offset.reset': auto_offset_reset,
+        'enable.auto.commit': False,
+        'group.id': group_id or f'sd-backend-{os.getpid()}',
+    }
 
-    consumer.subscribe([topic])
+    if is_memory_transport(settings.KAFKA_SERVICE):
+        return MemoryConsumer(get_memory_broker(), config)
 
-    return consumer
+    return Consumer(config)
 
 
-def send_generation_task(task_id: int, model: str, prompt: str, gender: str, age: str, images_count: int) -> ImageTask:
+def assign_results_partition(consumer: Consumer) -> None:
     """
-    Produce image generation task to the kafka
+    Assigns the consumer only to the results partition of this worker process
+
+    :param consumer: Consumer instance
+    :return:
+    """
+
+    settings = get_application_settings()
+    topic = settings.KAFKA_RESULTS_TOPIC
+
+    if not settings.KAFKA_PARTITIONED_RESULTS:
+        consumer.subscribe([topic])
+        return
+
+    metadata = consumer.list_topics(topic, timeout=settings.KAFKA_METADATA_TIMEOUT)
+    partition = get_partition(get_routing_key(), len(metadata.topics[topic].partitions))
+
+    consumer.assign([TopicPartition(topic, partition, OFFSET_END)])
+
+    logger.info(f'Assigned to the results partition: {topic=}, {partition=}')
+
+
+@lru_cache
+def get_retry_scheduler() -> RetryScheduler:
+    settings = get_application_settings()
+
+    return RetryScheduler(
+        produce_task=_produce_task,
+        producer_service=get_producer_service(),
+        dlq_topic=settings.KAFKA_DLQ_TOPIC,
+        wire_format=settings.KAFKA_WIRE_FORMAT,
+        max_attempts=settings.KAFKA_RETRY_MAX_ATTEMPTS,
+        base_delay=settings.KAFKA_RETRY_BASE_DELAY,
+        max_delay=settings.KAFKA_RETRY_MAX_DELAY,
+    )
+
+
+@lru_cache
+def get_result_dispatcher() -> ResultDispatcher:
+    settings = get_application_settings()
+    consumer = AsyncConsumer(get_kafka_consumer(), on_start=assign_results_partition)
+
+    return ResultDispatcher(
+        consumer=consumer,
+        expired_size=settings.KAFKA_EXPIRED_WAITERS_SIZE,
+        retry_scheduler=get_retry_scheduler(),
+    )
+
+
+@lru_cache
+def get_admission_controller() -> AdmissionController:
+    settings = get_application_settings()
+
+    return AdmissionController(
+        dispatcher=get_result_dispatcher(),
+        consumer=get_kafka_consumer(group_id=settings.KAFKA_WORKER_GROUP),
+        topic=settings.KAFKA_TASKS_TOPIC,
+        max_in_flight=settings.KAFKA_ADMISSION_MAX_IN_FLIGHT,
+        max_lag=settings.KAFKA_ADMISSION_MAX_LAG,
+        max_wait=settings.KAFKA_ADMISSION_MAX_WAIT,
+        interval=settings.KAFKA_ADMISSION_INTERVAL,
+    )
+
+
+@lru_cache
+def get_generation_cache() -> GenerationCache:
+    settings = get_application_settings()
+
+    return GenerationCache(
+        redis=get_redis(),
+        ttl=settings.GENERATION_CACHE_TTL,
+        size=settings.GENERATION_CACHE_SIZE,
+    )
+
+
+@lru_cache
+def get_fake_worker() -> FakeWorker:
+    settings = get_application_settings()
+    consumer = AsyncConsumer(
+        get_kafka_consumer(group_id=settings.KAFKA_WORKER_GROUP, auto_offset_reset='earliest'),
+        on_start=lambda x: x.subscribe([settings.KAFKA_TASKS_TOPIC]),
+    )
+
+    return FakeWorker(
+        consumer=consumer,
+        producer_service=get_producer_service(),
+        results_topic=settings.KAFKA_RESULTS_TOPIC,
+        latency=settings.KAFKA_FAKE_WORKER_LATENCY,
+        failure_rate=settings.KAFKA_FAKE_WORKER_FAILURE_RATE,
+        concurrency=settings.KAFKA_FAKE_WORKER_CONCURRENCY,
+    )
+
+
+def is_fake_worker_enabled(settings: 'Settings') -> bool:
+    return is_memory_transport(settings.KAFKA_SERVICE) and settings.KAFKA_FAKE_WORKER
+
+
+async def setup_kafka_service(settings: 'Settings') -> None:
+    producer_service = get_producer_service()
+    await producer_service.start()
+
+    dispatcher = get_result_dispatcher()
+    await dispatcher.start()
+
+    if settings.KAFKA_ADMISSION_ENABLED:
+        admission_controller = get_admission_controller()
+        await admission_controller.start()
+
+    if is_fake_worker_enabled(settings):
+        fake_worker = get_fake_worker()
+        await fake_worker.start()
+
+        logger.warning(f'Kafka is replaced with the in-process broker: {settings.KAFKA_SERVICE=}')
+
+    logger.debug('setup_kafka_service() attached')
+
+
+async def shutdown_kafka_service(settings: 'Settings') -> None:
+    if is_fake_worker_enabled(settings):
+        fake_worker = get_fake_worker()
+        await fake_worker.stop()
+
+    if settings.KAFKA_ADMISSION_ENABLED:
+        admission_controller = get_admission_controller()
+        await admission_controller.stop()
+
+    generation_cache = get_generation_cache()
+    await generation_cache.stop()
+
+    dispatcher = get_result_dispatcher()
+    await dispatcher.stop()
+
+    producer_service = get_producer_service()
+    await producer_service.stop(timeout=settings.KAFKA_FLUSH_TIMEOUT)
+
+
+def send_generation_task(
+    task_id: int,
+    model: str,
+    prompt: str,
+    gender: str,
+    age: str,
+    images_count: int,
+    is_awaited: bool = False,
+) -> 'asyncio.Future[ImageTask]':
+    """
+    Produce image generation task to the kafka, must be called on the running event loop
+    after setup_kafka_service (the returned future has to be awaited for the acknowledgment)
 
     :param task_id: Task identifier
     :param model: Model name
@@ -50,9 +242,13 @@ def send_generation_task(task_id: int, model: str, prompt: str, gender: str, age
     :param gender: Gender (like male, female etc.)
     :param age: Age range (string like "20-24")
     :param images_count: Count of images for generation
-    :return: Image generation task object
+    :param is_awaited: Whether the caller will wait for the result (wait_generation_result etc.),
+    the results of other tasks are not kept
+    :return: Future resolved with the image generation task once the broker acknowledged it
     """
 
+    _admit(1, is_awaited=is_awaited)
+
     image_task = ImageTask(
         id=task_id,
         model=model,
@@ -62,78 +258,229 @@ def send_generation_task(task_id: int, model: str, prompt: str, gender: str, age
         images_count=images_count,
     )
 
-    producer = get_kafka_producer()
-    producer.produce('sd-tasks', value=image_task.model_dump_json())
+    delivery = _produce_task(image_task, is_awaited=is_awaited)
 
     logger.info(f'Produced image generation task: {image_task=}')
 
-    return image_task
+    return delivery
 
 
-async def get_generated_images(task_id: int, timeout: int = 180) -> list[Media]:
+async def send_generation_tasks(
+    tasks: Iterable[tuple[int, str, str, str, str, int]],
+    is_awaited: bool = False,
+) -> tuple[list[ImageTask], list[tuple[ImageTask, Exception]]]:
     """
-    Wait kafka for generation response
+    Produce many image generation tasks to the kafka as one burst
 
-    :param task_id: Task identifier
-    :param timeout: Wait timeout
-    :return: List of media objects
+    :param tasks: Tuples of arguments in the order of send_generation_task
+    (task identifier, model, prompt, gender, age, count of images)
+    :param is_awaited: Whether the caller will wait for the results
+    :return: Image generation tasks acknowledged by the broker and the rejected ones with their errors
     """
 
-    consumer = get_kafka_consumer('sd-results')
-    now = time.time()
-    result = None
+    image_tasks = _image_tasks_adapter.validate_python([dict(zip(_IMAGE_TASK_FIELDS, x)) for x in tasks])
+
+    _admit(len(image_tasks), is_awaited=is_awaited)
+
+    deliveries = [_produce_task(x, is_awaited=is_awaited) for x in image_tasks]
+    results = await asyncio.gather(*deliveries, return_exceptions=True)
+
+    delivered = []
+    failed = []
+
+    for image_task, result in zip(image_tasks, results):
+        if isinstance(result, Exception):
+            failed.append((image_task, result))
+        else:
+            delivered.append(result)
+
+    if failed:
+        logger.error(f'Kafka did not accept {len(failed)} of {len(image_tasks)} tasks: {failed[0][1]}')
+
+    logger.info(f'Produced {len(delivered)} image generation tasks')
+
+    return delivered, failed
+
+
+def _admit(count: int, is_awaited: bool = False) -> None:
+    """
+    Raises QueueThrottled or QueueOverloaded if the queue can't take new tasks
+
+    :param count: Number of new tasks
+    :param is_awaited: Whether the caller will wait for the results
+    :return:
+    """
+
+    settings = get_application_settings()
+
+    if settings.KAFKA_ADMISSION_ENABLED and get_result_dispatcher().is_running:
+        get_admission_controller().check(count, is_awaited=is_awaited)
+
+
+def _produce_task(image_task: ImageTask, attempt: int = 1, is_awaited: bool = False) -> 'asyncio.Future[ImageTask]':
+    """
+    Enqueues the encoded task, the waiter of the awaited task is registered first,
+    so its result can't arrive before the caller starts waiting (only stream() removes the waiter)
+
+    :param image_task: Image generation task object
+    :param attempt: Number of the attempt (greater than 1 if the task is retried)
+    :param is_awaited: Whether the caller will wait for the result
+    :return: Future resolved with the image generation task
+    """
+
+    settings = get_application_settings()
+    dispatcher = get_result_dispatcher()
+
+    value = encode(image_task, wire_format=settings.KAFKA_WIRE_FORMAT)
+    headers = {
+        **build_headers(image_task, wire_format=settings.KAFKA_WIRE_FORMAT),
+        'reply-key': get_routing_key(),
+        'attempt': str(attempt),
+    }
+
+    if is_awaited and dispatcher.is_running:
+        dispatcher.expect(image_task.id)
+        dispatcher.track(image_task.id)
+
+    producer_service = get_producer_service()
+
+    try:
+        delivery = producer_service.produce(
+            settings.KAFKA_TASKS_TOPIC,
+            value=value,
+            key=str(image_task.id),
+            headers=headers,
+        )
+    except Exception:
+        dispatcher.discard(image_task.id)
+        raise
+
+    return _acknowledge_task(delivery, image_task)
+
+
+def _acknowledge_task(delivery: asyncio.Future, image_task: ImageTask) -> 'asyncio.Future[ImageTask]':
+    """
+    Chains the delivery report of the task to the future of the task itself
 
-    while time.time() - now <= timeout:
-        message = consumer.poll(timeout=1)
+    :param delivery: Delivery future
+    :param image_task: Image generation task object
+    :return: Future resolved with the image generation task
+    """
 
-        if message is None:
-            continue
+    acknowledgment = asyncio.get_running_loop().create_future()
 
-        if message.error():
-            logger.error(f'Kafka message error: {str(message.error())}')
-            continue
+    def on_delivery(future: asyncio.Future) -> None:
+        # The caller which stopped waiting for the acknowledgment won't wait for the result either
+        if acknowledgment.cancelled():
+            get_result_dispatcher().discard(image_task.id)
+            return
 
-        value = message.value().decode('utf-8')
+        if acknowledgment.done():
+            return
 
-        logger.info(f'Got message from kafka: {value=}')
+        if future.exception() is not None:
+            get_result_dispatcher().discard(image_task.id)
+            acknowledgment.set_exception(future.exception())
+        else:
+            acknowledgment.set_result(image_task)
 
-        try:
-            result = ImageResult.model_validate_json(value)
-        except PydanticUserError:
-            logger.error(f'Can\'t get image result value from: {value=}')
-            continue
+    delivery.add_done_callback(on_delivery)
 
-        if result.id != task_id:
-            continue
+    return acknowledgment
 
-        break
 
-    consumer.close()
+async def wait_generation_result(task_id: int, timeout: int = 180) -> ImageResult:
+    """
+    Wait kafka for successful generation result
+
+    :param task_id: Task identifier
+    :param timeout: Wait timeout
+    :return: Image generation result
+    """
+
+    dispatcher = get_result_dispatcher()
+    result = await dispatcher.wait(task_id, timeout=timeout)
 
     if not result or result.status != 'success' or not result.images:
         logger.error(f'Error on the kafka result: {result=}')
         raise KafkaError(detail=result.message if result and result.message else 'The queue did not respond')
 
-    session = get_session_maker()
+    return result
+
+
+async def stream_generation_results(task_id: int, timeout: int = 180) -> AsyncIterator[ImageResult]:
+    """
+    Yields generation results as soon as each image is ready
+
+    :param task_id: Task identifier
+    :param timeout: Wait timeout for the final result
+    :return: Partial results followed by the final successful result
+    """
+
+    dispatcher = get_result_dispatcher()
+    result = None
+
+    async for result in dispatcher.stream(task_id, timeout=timeout):
+        if not is_partial(result):
+            break
+
+        yield result
+
+    if not result or is_partial(result) or result.status != 'success':
+        logger.error(f'Error on the kafka result: {result=}')
+        raise KafkaError(detail=result.message if result and result.message else 'The queue did not respond')
+
+    yield result
+
+
+async def store_generated_images(result: ImageResult) -> list[Media]:
+    """
+    Saves images of the generation result as media objects
+
+    :param result: Image generation result
+    :return: List of media objects
+    """
+
     settings = get_application_settings()
-    media_list = []
 
-    for image in result.images:
-        file_name = image.split('/')[-1]
-        full_path = settings.S3_STORAGE_URL + image
+    return await create_media_list([(x.split('/')[-1], settings.S3_STORAGE_URL + x) for x in result.images])
+
 
-        media = Media(name=file_name, url=full_path)
-        media_list.append(media)
+async def get_generated_images(task_id: int, timeout: int = 180) -> list[Media]:
+    """
+    Wait kafka for generation response
 
-        session.add(media)
+    :param task_id: Task identifier
+    :param timeout: Wait timeout
+    :return: List of media objects
+    """
 
-    await session.commit()
-    await session.close()
+    result = await wait_generation_result(task_id, timeout=timeout)
 
-    return media_list
+    return await store_generated_images(result)
 
 
 __all__ = (
+    'AsyncConsumer',
+    'GenerationCache',
+    'get_generation_cache',
+    'ProducerService',
+    'get_producer_service',
+    'get_result_dispatcher',
+    'RetryScheduler',
+    'get_retry_scheduler',
+    'AdmissionController',
+    'get_admission_controller',
+    'MemoryBroker',
+    'get_memory_broker',
+    'FakeWorker',
+    'get_fake_worker',
+    'setup_kafka_service',
+    'shutdown_kafka_service',
     'send_generation_task',
+    'send_generation_tasks',
+    'wait_generation_result',
+    'stream_generation_results',
+    'store_generated_images',
     'get_generated_images',
 )
@@ -0,0 +1,224 @@
+from confluent_kafka import TopicPartition
+
+from .dispatcher import ResultDispatcher
+from .exceptions import QueueThrottled, QueueOverloaded
+
+from loguru import logger
+
+from typing import TYPE_CHECKING
+
+import asyncio, math, time
+
+if TYPE_CHECKING:
+    from confluent_kafka import Consumer
+
+
+class AdmissionController:
+    """ Rejects new generation tasks which can not be finished before their waiters give up """
+
+    _dispatcher: ResultDispatcher
+    _consumer: 'Consumer'
+    _topic: str
+    _max_in_flight: int
+    _max_lag: int
+    _max_wait: float
+    _interval: float
+    _max_retry_after: int
+    _smoothing: float
+    _lag: int | None
+    _lag_updated_at: float
+    _drain_rate: float
+    _completion_rate: float
+    _counters: dict[str, int]
+    _monitor: asyncio.Task | None = None
+
+    def __init__(
+        self,
+        dispatcher: ResultDispatcher,
+        consumer: 'Consumer',
+        topic: str,
+        max_in_flight: int = 256,
+        max_lag: int = 1000,
+        max_wait: float = 120,
+        interval: float = 1,
+        max_retry_after: int = 60,
+        smoothing: float = 0.3,
+    ) -> None:
+        """
+        In-flight tasks of this process are limited by the soft watermark (429),
+        the backlog of the workers group is limited by the hard one (503)
+
+        :param dispatcher: Dispatcher which counts the tasks awaited by this process
+        :param consumer: Consumer in the group of the workers, used only to read offsets
+        :param topic: Topic name of the tasks
+        :param max_in_flight: Maximum number of tasks awaited by this process
+        :param max_lag: Maximum number of tasks not yet taken by the workers
+        :param max_wait: Maximum estimated time in the queue (in seconds)
+        :param interval: Interval between measurements (in seconds)
+        :param max_retry_after: Upper bound of the Retry-After estimate (in seconds)
+        :param smoothing: Weight of the last measurement in the moving average of the throughput
+        """
+
+        self._dispatcher = dispatcher
+        self._consumer = consumer
+        self._topic = topic
+        self._max_in_flight = max_in_flight
+        self._max_lag = max_lag
+        self._max_wait = max_wait
+        self._interval = interval
+        self._max_retry_after = max_retry_after
+        self._smoothing = smoothing
+        self._lag = None
+        self._lag_updated_at = 0
+        self._drain_rate = 0
+        self._completion_rate = 0
+        self._counters = {'admitted': 0, 'throttled': 0, 'overloaded': 0}
+
+    @property
+    def stats(self) -> dict[str, int | float | None]:
+        return {
+            **self._counters,
+            'in_flight': self._dispatcher.in_flight,
+            'lag': self._lag,
+            'drain_rate': round(self._drain_rate, 2),
+            'completion_rate': round(self._completion_rate, 2),
+        }
+
+    async def start(self) -> None:
+        """ Starts measuring the backlog and the throughput """
+
+        self._monitor = asyncio.create_task(self._measure())
+
+    async def stop(self) -> None:
+        """ Stops measuring and closes the consumer """
+
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+
+        await asyncio.to_thread(self._consumer.close)
+
+    def check(self, count: int = 1, is_awaited: bool = True) -> None:
+        """
+        Admits new tasks or raises the error with the Retry-After estimate,
+        the tasks which are not awaited yet are counted once somebody streams their results,
+        so admitting them requires the room for one more task only
+
+        :param count: Number of new tasks
+        :param is_awaited: Whether the tasks are counted in flight from their production
+        :return:
+        """
+
+        in_flight = self._dispatcher.in_flight + (count if is_awaited else 1)
+
+        if in_flight > self._max_in_flight:
+            self._counters['throttled'] += count
+            retry_after = self._get_retry_after(in_flight - self._max_in_flight, self._completion_rate)
+
+            logger.warning(f'Generation tasks are throttled: {in_flight=}, {retry_after=}')
+            raise QueueThrottled(retry_after=retry_after)
+
+        lag = self._get_lag()
+
+        if lag is not None:
+            lag += count
+            wait = lag / self._drain_rate if self._drain_rate > 0 else 0
+
+            if lag > self._max_lag or wait > self._max_wait:
+                self._counters['overloaded'] += count
+                excess = max(lag - self._max_lag, lag - self._max_wait * self._drain_rate, 1)
+                retry_after = self._get_retry_after(excess, self._drain_rate)
+
+                logger.warning(f'Generation queue is overloaded: {lag=}, {wait=:.1f}, {retry_after=}')
+                raise QueueOverloaded(retry_after=retry_after)
+
+        self._counters['admitted'] += count
+
+    def _get_lag(self) -> int | None:
+        """
+        Returns the last measured backlog if it is fresh enough to rely on
+
+        :return: Number of tasks not yet taken by the workers
+        """
+
+        if time.monotonic() - self._lag_updated_at > self._interval * 5:
+            return None
+
+        return self._lag
+
+    def _get_retry_after(self, excess: float, rate: float) -> int:
+        """
+        Estimates when the excess will be processed
+
+        :param excess: Number of tasks over the watermark
+        :param rate: Measured throughput (tasks per second)
+        :return: Delay in whole seconds (one interval until the first measurement)
+        """
+
+        if not self._lag_updated_at:
+            return max(1, math.ceil(self._interval))
+
+        if rate <= 0:
+            return self._max_retry_after
+
+        return max(1, min(self._max_retry_after, math.ceil(excess / rate)))
+
+    def _read_offsets(self) -> tuple[int, int]:
+        """
+        Reads the backlog of the workers group on the polling thread
+
+        :return: Sum of the lag and sum of the committed offsets over all partitions
+        """
+
+        metadata = self._consumer.list_topics(self._topic, timeout=self._interval)
+        partitions = [TopicPartition(self._topic, x) for x in metadata.topics[self._topic].partitions]
+
+        lag = committed = 0
+
+        for partition in self._consumer.committed(partitions, timeout=self._interval):
+            low, high = self._consumer.get_watermark_offsets(partition, timeout=self._interval, cached=False)
+            offset = partition.offset if partition.offset >= 0 else low
+
+            lag += max(high - offset, 0)
+            committed += offset
+
+        return lag, committed
+
+    def _update_rate(self, rate: float, value: float) -> float:
+        return value if rate <= 0 else rate + self._smoothing * (value - rate)
+
+    async def _measure(self) -> None:
+        """ Measures the backlog and the throughput until the controller is stopped """
+
+        last_committed = None
+        last_completed = self._dispatcher.completed
+        last_time = time.monotonic()
+
+        while True:
+            await asyncio.sleep(self._interval)
+
+            try:
+                lag, committed = await asyncio.to_thread(self._read_offsets)
+            except Exception as e:
+                logger.error(f'Can\'t measure the generation queue: {e}')
+                continue
+
+            now = time.monotonic()
+            elapsed = now - last_time
+            completed = self._dispatcher.completed
+
+            if last_committed is not None:
+                self._drain_rate = self._update_rate(self._drain_rate, (committed - last_committed) / elapsed)
+
+            self._completion_rate = self._update_rate(self._completion_rate, (completed - last_completed) / elapsed)
+
+            self._lag = lag
+            self._lag_updated_at = now
+
+            last_committed, last_completed, last_time = committed, completed, now
+
+
+__all__ = (
+    'AdmissionController',
+)
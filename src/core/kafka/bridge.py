@@ -0,0 +1,200 @@
+from loguru import logger
+
+from typing import Callable, TYPE_CHECKING
+
+import asyncio, threading
+
+if TYPE_CHECKING:
+    from confluent_kafka import Consumer, Message
+
+
+class AsyncConsumer:
+    """ Asyncio adapter for the blocking confluent-kafka consumer """
+
+    _consumer: 'Consumer'
+    _on_start: Callable[['Consumer'], None] | None
+    _batch_size: int
+    _poll_timeout: float
+    _loop: asyncio.AbstractEventLoop
+    _queue: asyncio.Queue
+    _pending: threading.BoundedSemaphore
+    _stopped: threading.Event
+    _thread: threading.Thread | None = None
+
+    def __init__(
+        self,
+        consumer: 'Consumer',
+        on_start: Callable[['Consumer'], None] = None,
+        batch_size: int = 100,
+        poll_timeout: float = 1,
+        max_pending: int = 16,
+    ) -> None:
+        """
+        Polling runs on a dedicated thread which hands received messages
+        to the event loop, so awaiting messages never blocks the loop
+
+        :param consumer: Consumer instance
+        :param on_start: Subscribes or assigns the consumer on the polling thread
+        :param batch_size: Maximum number of messages received with one call
+        :param poll_timeout: Maximum time of the single consume call (in seconds)
+        :param max_pending: Maximum number of batches not yet taken by the event loop
+        """
+
+        self._consumer = consumer
+        self._on_start = on_start
+        self._batch_size = batch_size
+        self._poll_timeout = poll_timeout
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._stopped = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    async def start(self) -> None:
+        """ Starts the polling thread, raises the error of on_start if the consumer could not be started """
+
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._stopped.clear()
+
+        started = self._loop.create_future()
+
+        self._thread = threading.Thread(target=self._run, args=(started,), name='kafka-consumer', daemon=True)
+        self._thread.start()
+
+        try:
+            await started
+        except Exception:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+            raise
+
+    async def stop(self) -> None:
+        """ Stops the polling thread and closes the consumer """
+
+        self._stopped.set()
+
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    async def get(self) -> list['Message']:
+        """
+        Waits for the next batch of messages
+
+        :return: List of messages or empty list if the consumer was stopped
+        """
+
+        batch = await self._queue.get()
+
+        if batch is None:
+            self._queue.put_nowait(None)
+            return []
+
+        self._pending.release()
+
+        return batch
+
+    def commit(self, message: 'Message') -> None:
+        """
+        Commits the offset of the processed message without blocking the event loop
+
+        :param message: Processed message
+        :return:
+        """
+
+        self._consumer.commit(message=message, asynchronous=True)
+
+    def __aiter__(self) -> 'AsyncConsumer':
+        return self
+
+    async def __anext__(self) -> list['Message']:
+        batch = await self.get()
+
+        if not batch:
+            raise StopAsyncIteration
+
+        return batch
+
+    def _hand_over(self, batch: list['Message'] | None) -> bool:
+        """
+        Passes the batch to the event loop
+
+        :param batch: List of messages or None as the end of the stream
+        :return: Whether the batch was passed
+        """
+
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, batch)
+        except RuntimeError:
+            return False
+
+        return True
+
+    def _settle(self, future: asyncio.Future, error: Exception = None) -> None:
+        """
+        Resolves the future of the event loop from the polling thread
+
+        :param future: Future awaited by start()
+        :param error: Exception to raise or None if the consumer is started
+        :return:
+        """
+
+        def settle() -> None:
+            if future.done():
+                return
+
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+
+        self._loop.call_soon_threadsafe(settle)
+
+    def _run(self, started: asyncio.Future) -> None:
+        """
+        Consumes messages until the adapter is stopped
+
+        :param started: Future which receives the result of on_start
+        :return:
+        """
+
+        try:
+            if self._on_start is not None:
+                self._on_start(self._consumer)
+        except Exception as e:
+            logger.exception(f'Can\'t start kafka consumer: {e}')
+
+            self._stopped.set()
+            self._consumer.close()
+            self._settle(started, e)
+            return
+
+        self._settle(started)
+
+        try:
+            while not self._stopped.is_set():
+                if not self._pending.acquire(timeout=self._poll_timeout):
+                    continue
+
+                try:
+                    batch = self._consumer.consume(num_messages=self._batch_size, timeout=self._poll_timeout)
+                except Exception as e:
+                    logger.exception(f'Kafka consume error: {e}')
+                    batch = []
+
+                if not batch:
+                    self._pending.release()
+                    continue
+
+                if not self._hand_over(batch):
+                    break
+        finally:
+            self._consumer.close()
+            self._hand_over(None)
+
+
+__all__ = (
+    'AsyncConsumer',
+)
@@ -0,0 +1,240 @@
+from loguru import logger
+
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Awaitable, Callable, TYPE_CHECKING
+
+import asyncio, json, time
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+
+class GenerationCache:
+    """ Two-tier cache of generated media identifiers keyed by the generation parameters """
+
+    _redis: 'Redis'
+    _ttl: int
+    _size: int
+    _local: OrderedDict[str, tuple[float, list[int]]]
+    _inflight: dict[str, tuple[int, asyncio.Task]]
+    _counters: dict[str, int]
+
+    def __init__(self, redis: 'Redis', ttl: int = 3600, size: int = 1024) -> None:
+        """
+        The in-process LRU answers repeated requests of this worker,
+        Redis shares the results between all workers
+
+        :param redis: Redis client
+        :param ttl: Lifetime of the cached result (in seconds)
+        :param size: Maximum number of results in the in-process LRU
+        """
+
+        self._redis = redis
+        self._ttl = ttl
+        self._size = size
+        self._local = OrderedDict()
+        self._inflight = {}
+        self._counters = {'local_hits': 0, 'redis_hits': 0, 'joined': 0, 'misses': 0}
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {**self._counters, 'local_size': len(self._local), 'inflight': len(self._inflight)}
+
+    @staticmethod
+    def make_key(model: str, prompt: str, gender: str, age: str) -> str:
+        """
+        Builds the cache key of the generation parameters
+
+        :param model: Model name
+        :param prompt: Prompt name
+        :param gender: Gender (like male, female etc.)
+        :param age: Age range (string like "20-24")
+        :return: Cache key
+        """
+
+        digest = sha256(json.dumps([model, prompt, gender, age]).encode('utf-8')).hexdigest()
+
+        return f'generation:result:{digest}'
+
+    async def get(self, key: str, images_count: int) -> list[int] | None:
+        """
+        Returns cached media identifiers if there are enough of them
+
+        :param key: Cache key
+        :param images_count: Required count of images
+        :return: List of media identifiers
+        """
+
+        media_ids = self._get_local(key)
+
+        if media_ids is not None and len(media_ids) >= images_count:
+            self._counters['local_hits'] += 1
+            return media_ids[:images_count]
+
+        try:
+            value = await self._redis.get(key)
+        except Exception as e:
+            logger.error(f'Can\'t get generation result from the cache: {e}')
+            value = None
+
+        if value is not None:
+            media_ids = json.loads(value)
+            self._set_local(key, media_ids)
+
+            if len(media_ids) >= images_count:
+                self._counters['redis_hits'] += 1
+                return media_ids[:images_count]
+
+        return None
+
+    async def set(self, key: str, media_ids: list[int]) -> None:
+        """
+        Stores media identifiers of the finished generation
+
+        :param key: Cache key
+        :param media_ids: List of media identifiers
+        :return:
+        """
+
+        self._set_local(key, media_ids)
+
+        try:
+            await self._redis.set(key, json.dumps(media_ids), ex=self._ttl)
+        except Exception as e:
+            logger.error(f'Can\'t store generation result in the cache: {e}')
+
+    async def get_or_generate(
+        self,
+        key: str,
+        images_count: int,
+        generate: Callable[[], Awaitable[list[int]]],
+    ) -> list[int]:
+        """
+        Returns cached media identifiers or generates them, concurrent identical
+        requests of this worker wait for the single generation,
+        which keeps running if the request that started it is cancelled
+
+        :param key: Cache key
+        :param images_count: Required count of images
+        :param generate: Runs the generation and returns media identifiers
+        :return: List of media identifiers
+        """
+
+        media_ids = await self.get(key, images_count)
+
+        if media_ids is not None:
+            return media_ids
+
+        task = self.join(key, images_count) or self.share(key, images_count, generate)
+
+        return (await asyncio.shield(task))[:images_count]
+
+    def join(self, key: str, images_count: int) -> asyncio.Task | None:
+        """
+        Returns the running generation of the same parameters if it makes enough images
+
+        :param key: Cache key
+        :param images_count: Required count of images
+        :return: Task resolved with media identifiers or None if there is no such generation
+        """
+
+        inflight = self._inflight.get(key)
+
+        if inflight is None or inflight[0] < images_count:
+            return None
+
+        self._counters['joined'] += 1
+
+        return inflight[1]
+
+    def share(self, key: str, images_count: int, generate: Callable[[], Awaitable[list[int]]]) -> asyncio.Task:
+        """
+        Starts the generation which the identical requests join until it is finished,
+        its result is cached
+
+        :param key: Cache key
+        :param images_count: Count of images made by the generation
+        :param generate: Runs the generation and returns media identifiers
+        :return: Task resolved with media identifiers
+        """
+
+        self._counters['misses'] += 1
+
+        task = asyncio.create_task(self._generate(key, generate))
+        task.add_done_callback(lambda x: x.cancelled() or x.exception())
+        self._inflight[key] = (images_count, task)
+
+        return task
+
+    async def stop(self) -> None:
+        """ Cancels the running generations """
+
+        tasks = [x for _, x in self._inflight.values()]
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _generate(self, key: str, generate: Callable[[], Awaitable[list[int]]]) -> list[int]:
+        """
+        Runs the generation shared by the identical requests and caches its result
+
+        :param key: Cache key
+        :param generate: Runs the generation and returns media identifiers
+        :return: List of media identifiers
+        """
+
+        try:
+            media_ids = await generate()
+        finally:
+            if self._inflight.get(key, (None, None))[1] is asyncio.current_task():
+                del self._inflight[key]
+
+        await self.set(key, media_ids)
+
+        return media_ids
+
+    def _get_local(self, key: str) -> list[int] | None:
+        """
+        Returns media identifiers from the in-process LRU
+
+        :param key: Cache key
+        :return: List of media identifiers
+        """
+
+        item = self._local.get(key)
+
+        if item is None:
+            return None
+
+        expires_at, media_ids = item
+
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+
+        self._local.move_to_end(key)
+
+        return media_ids
+
+    def _set_local(self, key: str, media_ids: list[int]) -> None:
+        """
+        Stores media identifiers in the in-process LRU
+
+        :param key: Cache key
+        :param media_ids: List of media identifiers
+        :return:
+        """
+
+        self._local[key] = (time.monotonic() + self._ttl, media_ids)
+        self._local.move_to_end(key)
+
+        while len(self._local) > self._size:
+            self._local.popitem(last=False)
+
+
+__all__ = (
+    'GenerationCache',
+)
@@ -0,0 +1,235 @@
+from .schemas import ImageTask, ImageResult
+
+from typing import TypeVar
+
+import struct
+
+
+JSON_CONTENT_TYPE = 'application/json'
+BINARY_CONTENT_TYPE = 'application/x-sd-binary'
+
+BINARY_MAGIC = b'SD'
+BINARY_VERSION = 1
+
+_KIND_TASK = 1
+_KIND_RESULT = 2
+
+_header = struct.Struct('>2sBBq')
+# Magic, version, kind of the payload and task identifier
+
+_uint32 = struct.Struct('>I')
+
+_result_numbers = struct.Struct('>III')
+# Count of images, attempt number and length of the images list
+
+Schema = TypeVar('Schema', ImageTask, ImageResult)
+
+
+def get_header(headers: list[tuple[str, bytes]] | None, name: str) -> bytes | None:
+    """
+    Returns the value of the kafka message header
+
+    :param headers: Kafka message headers
+    :param name: Header name
+    :return: Header value
+    """
+
+    for key, value in headers or ():
+        if key == name:
+            return value
+
+    return None
+
+
+def build_headers(task: ImageTask, wire_format: str) -> dict[str, str]:
+    """
+    Builds headers which describe the encoded message
+
+    :param task: Image generation task or result
+    :param wire_format: Encoding format (json or binary)
+    :return: Kafka message headers
+    """
+
+    content_type = BINARY_CONTENT_TYPE if wire_format == 'binary' else JSON_CONTENT_TYPE
+
+    return {
+        'content-type': content_type,
+        'task-id': str(task.id),
+    }
+
+
+def encode(task: ImageTask, wire_format: str = 'json') -> bytes:
+    """
+    Encodes the task or the result for sending to the kafka
+
+    :param task: Image generation task or result
+    :param wire_format: Encoding format (json or binary)
+    :return: Encoded message value
+    """
+
+    if wire_format != 'binary':
+        return task.__pydantic_serializer__.to_json(task)
+
+    if isinstance(task, ImageResult):
+        kind = _KIND_RESULT
+        strings = [
+            task.model, task.prompt, task.gender, task.age,
+            task.info.last_attempt_error, task.status, task.message, *task.images,
+        ]
+        numbers = {'images_count': task.images_count, 'info.attempt': task.info.attempt, 'images': len(task.images)}
+    else:
+        kind = _KIND_TASK
+        strings = [task.model, task.prompt, task.gender, task.age]
+        numbers = {'images_count': task.images_count}
+
+    buffer = bytearray(_pack(_header, 'id', BINARY_MAGIC, BINARY_VERSION, kind, task.id))
+
+    for name, number in numbers.items():
+        buffer += _pack(_uint32, name, number)
+
+    for string in strings:
+        encoded = string.encode('utf-8')
+
+        buffer += _uint32.pack(len(encoded))
+        buffer += encoded
+
+    return bytes(buffer)
+
+
+def _pack(packer: struct.Struct, name: str, *values) -> bytes:
+    """
+    Packs the numbers of the field, the value out of the range of the binary format is rejected
+
+    :param packer: Struct of the field
+    :param name: Field name, used in the error
+    :param values: Packed values
+    :return: Packed bytes
+    """
+
+    try:
+        return packer.pack(*values)
+    except struct.error as e:
+        raise ValueError(f'The field {name} can\'t be encoded in the binary format: {values[-1]!r} ({e})') from e
+
+
+def decode(value: bytes, headers: list[tuple[str, bytes]] | None, schema: type[Schema]) -> Schema:
+    """
+    Decodes the message in the format negotiated by its headers
+
+    :param value: Encoded message value
+    :param headers: Kafka message headers
+    :param schema: Expected schema (ImageTask or ImageResult)
+    :return: Decoded task or result
+    """
+
+    if not _is_binary(value, headers):
+        return schema.model_validate_json(value)
+
+    try:
+        return _decode_binary(value, schema)
+    except struct.error as e:
+        raise ValueError(f'Malformed binary message: {e}') from e
+
+
+def _decode_binary(value: bytes, schema: type[Schema]) -> Schema:
+    """
+    Decodes the message in the binary format
+
+    :param value: Encoded message value
+    :param schema: Expected schema (ImageTask or ImageResult)
+    :return: Decoded task or result
+    """
+
+    magic, version, kind, task_id = _header.unpack_from(value)
+
+    if version != BINARY_VERSION:
+        raise ValueError(f'Unsupported binary schema version: {version}')
+
+    if kind == _KIND_RESULT:
+        images_count, attempt, images_length = _result_numbers.unpack_from(value, _header.size)
+        offset = _header.size + _result_numbers.size
+        strings_count = 7 + images_length
+    else:
+        images_count, = _uint32.unpack_from(value, _header.size)
+        offset = _header.size + _uint32.size
+        strings_count = 4
+
+    strings = []
+
+    for _ in range(strings_count):
+        length, = _uint32.unpack_from(value, offset)
+        offset += _uint32.size
+
+        strings.append(value[offset:offset + length].decode('utf-8'))
+        offset += length
+
+    fields = {
+        'id': task_id,
+        'model': strings[0],
+        'prompt': strings[1],
+        'gender': strings[2],
+        'age': strings[3],
+        'images_count': images_count,
+    }
+
+    if schema is ImageTask:
+        return ImageTask.model_validate(fields)
+
+    if kind != _KIND_RESULT:
+        raise ValueError('The binary message does not contain the generation result')
+
+    return ImageResult.model_validate({
+        **fields,
+        'info': {'attempt': attempt, 'last_attempt_error': strings[4]},
+        'images': strings[7:],
+        'status': strings[5],
+        'message': strings[6],
+    })
+
+
+def peek_task_id(value: bytes, headers: list[tuple[str, bytes]] | None) -> int | None:
+    """
+    Reads the task identifier without decoding the whole message
+
+    :param value: Encoded message value
+    :param headers: Kafka message headers
+    :return: Task identifier or None if it can be read only from the payload
+    """
+
+    task_id = get_header(headers, 'task-id')
+
+    if task_id is not None:
+        return int(task_id)
+
+    if _is_binary(value, headers) and len(value) >= _header.size:
+        return _header.unpack_from(value)[3]
+
+    return None
+
+
+def _is_binary(value: bytes, headers: list[tuple[str, bytes]] | None) -> bool:
+    """
+    Checks whether the message is encoded in the binary format
+
+    :param value: Encoded message value
+    :param headers: Kafka message headers
+    :return: Is the message binary
+    """
+
+    content_type = get_header(headers, 'content-type')
+
+    if content_type is not None:
+        return content_type.decode('utf-8') == BINARY_CONTENT_TYPE
+
+    return value[:2] == BINARY_MAGIC
+
+
+__all__ = (
+    'JSON_CONTENT_TYPE',
+    'BINARY_CONTENT_TYPE',
+    'get_header',
+    'build_headers',
+    'encode',
+    'decode',
+    'peek_task_id',
+)
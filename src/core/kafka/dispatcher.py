@@ -0,0 +1,322 @@
+from pydantic import ValidationError
+
+from .bridge import AsyncConsumer
+from .retry import RetryScheduler
+from .codec import decode, peek_task_id
+from .schemas import ImageResult
+
+from loguru import logger
+
+from collections import OrderedDict
+from typing import AsyncIterator, Coroutine, TYPE_CHECKING
+
+import asyncio, time
+
+if TYPE_CHECKING:
+    from confluent_kafka import Message
+
+
+def is_partial(result: ImageResult) -> bool:
+    """
+    Checks whether the result carries only a part of the images and more results will follow
+
+    :param result: Image generation result
+    :return: Is the result partial
+    """
+
+    return result.status == 'partial'
+
+
+class ResultDispatcher:
+    """ Routes generation results from the shared consumer to the awaiting requests """
+
+    _consumer: AsyncConsumer
+    _waiters: dict[int, asyncio.Queue]
+    _in_flight: set[int]
+    _watchers: set[asyncio.Task]
+    _expired: OrderedDict[int, None]
+    _expired_size: int
+    _retry_scheduler: RetryScheduler | None = None
+    _completed: int = 0
+    _listener: asyncio.Task | None = None
+    _is_running: bool = False
+
+    def __init__(
+        self,
+        consumer: AsyncConsumer,
+        expired_size: int = 1024,
+        retry_scheduler: RetryScheduler = None,
+    ) -> None:
+        """
+        One dispatcher owns the results topic for the whole worker process,
+        so waiting for a result does not cost a separate consumer
+
+        :param consumer: Asynchronous consumer of the results topic
+        :param expired_size: How many timed out task identifiers to remember
+        :param retry_scheduler: Produces failed tasks again while the result is awaited
+        """
+
+        self._consumer = consumer
+        self._waiters = {}
+        self._in_flight = set()
+        self._watchers = set()
+        self._expired = OrderedDict()
+        self._expired_size = expired_size
+        self._retry_scheduler = retry_scheduler
+
+    @property
+    def is_running(self) -> bool:
+        return self._is_running
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    @property
+    def completed(self) -> int:
+        return self._completed
+
+    async def start(self) -> None:
+        """ Starts listening to the results topic """
+
+        await self._consumer.start()
+
+        self._is_running = True
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """ Stops listening and closes the consumer """
+
+        self._is_running = False
+
+        for watcher in self._watchers:
+            watcher.cancel()
+
+        await asyncio.gather(*self._watchers, return_exceptions=True)
+        await self._consumer.stop()
+
+        if self._listener is not None:
+            await self._listener
+            self._listener = None
+
+        for queue in self._waiters.values():
+            queue.put_nowait(None)
+
+        self._waiters.clear()
+        self._in_flight.clear()
+
+    def expect(self, task_id: int) -> asyncio.Queue:
+        """
+        Registers the waiter for the specified task before its results arrive
+
+        :param task_id: Task identifier
+        :return: Queue which will receive the partial and the final generation results
+        """
+
+        queue = self._waiters.get(task_id)
+
+        if queue is None:
+            queue = asyncio.Queue()
+            self._waiters[task_id] = queue
+
+        return queue
+
+    def track(self, task_id: int) -> None:
+        """
+        Counts the task in flight until its waiter is removed,
+        the task is counted from its production if it is awaited and from the start of stream() otherwise
+
+        :param task_id: Task identifier
+        :return:
+        """
+
+        self._in_flight.add(task_id)
+
+    def watch(self, coroutine: Coroutine) -> asyncio.Task:
+        """
+        Runs the coroutine which consumes results of the produced task in the background,
+        it is cancelled when the dispatcher stops
+
+        :param coroutine: Coroutine which streams the results
+        :return: Task of the coroutine
+        """
+
+        task = asyncio.create_task(coroutine)
+        task.add_done_callback(self._watchers.discard)
+
+        self._watchers.add(task)
+
+        return task
+
+    def discard(self, task_id: int) -> None:
+        """
+        Removes the waiter of the task which will never get the result
+
+        :param task_id: Task identifier
+        :return:
+        """
+
+        self._in_flight.discard(task_id)
+        queue = self._waiters.pop(task_id, None)
+
+        if queue is not None:
+            queue.put_nowait(None)
+
+    async def stream(self, task_id: int, timeout: float) -> AsyncIterator[ImageResult]:
+        """
+        Yields results of the specified task as they arrive, the last one is final.
+        Images are counted by their index, so the retried attempt yields only the images
+        the failed one did not deliver, and the final result holds one image per index
+
+        :param task_id: Task identifier
+        :param timeout: Wait timeout for the final result
+        :return: Partial results followed by the final result
+        """
+
+        queue = self.expect(task_id)
+        self.track(task_id)
+
+        deadline = time.monotonic() + timeout
+        attempt = 1
+        delivered = []
+        received = 0
+
+        try:
+            while True:
+                try:
+                    result = await asyncio.wait_for(queue.get(), timeout=max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    self._expire(task_id)
+                    return
+
+                if result is None:
+                    return
+
+                if not is_partial(result) and self._retry_scheduler is not None:
+                    if result.status != 'success':
+                        if await self._retry_scheduler.retry(result, attempt, deadline):
+                            attempt += 1
+                            received = 0
+                            continue
+                    elif attempt > 1:
+                        self._retry_scheduler.record_recovered()
+
+                if is_partial(result):
+                    images = result.images[max(len(delivered) - received, 0):]
+                    received += len(result.images)
+
+                    if not images:
+                        continue
+
+                    delivered.extend(images)
+                    result = result.model_copy(update={'images': images})
+                elif attempt > 1 and result.images:
+                    result = result.model_copy(update={'images': delivered + result.images[len(delivered):]})
+
+                yield result
+
+                if not is_partial(result):
+                    return
+        finally:
+            if self._waiters.get(task_id) is queue:
+                del self._waiters[task_id]
+                self._in_flight.discard(task_id)
+
+    async def wait(self, task_id: int, timeout: float) -> ImageResult | None:
+        """
+        Waits for the final result of the specified task
+
+        :param task_id: Task identifier
+        :param timeout: Wait timeout
+        :return: Generation result with all images or None if it did not arrive in time
+        """
+
+        images = []
+
+        async for result in self.stream(task_id, timeout=timeout):
+            if is_partial(result):
+                images.extend(result.images)
+                continue
+
+            if not result.images and images:
+                result = result.model_copy(update={'images': images})
+
+            return result
+
+        return None
+
+    def _expire(self, task_id: int) -> None:
+        """
+        Remembers the timed out task, so its late result can be recognized
+
+        :param task_id: Task identifier
+        :return:
+        """
+
+        self._expired[task_id] = None
+        self._expired.move_to_end(task_id)
+
+        while len(self._expired) > self._expired_size:
+            self._expired.popitem(last=False)
+
+    def _dispatch(self, message: 'Message') -> None:
+        """
+        Passes the received result to its waiter
+
+        :param message: Kafka message
+        :return:
+        """
+
+        if message.error():
+            logger.error(f'Kafka message error: {str(message.error())}')
+            return
+
+        value = message.value()
+        headers = message.headers()
+
+        if value is None:
+            return
+
+        try:
+            task_id = peek_task_id(value, headers)
+        except ValueError:
+            task_id = None
+
+        if task_id is not None and task_id not in self._waiters and task_id not in self._expired:
+            return
+
+        try:
+            result = decode(value, headers, ImageResult)
+        except (ValidationError, ValueError):
+            logger.error(f'Can\'t get image result value from: {value=}')
+            return
+
+        queue = self._waiters.get(result.id)
+
+        if queue is not None:
+            logger.info(f'Got image generation result: {result=}')
+            queue.put_nowait(result)
+
+            if not is_partial(result):
+                self._completed += 1
+        elif result.id in self._expired:
+            if not is_partial(result):
+                del self._expired[result.id]
+
+            logger.warning(f'Dropped late image generation result: {result=}')
+
+    async def _listen(self) -> None:
+        """ Reads the results topic until the consumer is stopped """
+
+        async for batch in self._consumer:
+            for message in batch:
+                try:
+                    self._dispatch(message)
+                except Exception as e:
+                    logger.exception(f'Can\'t dispatch image generation result: {e}')
+
+
+__all__ = (
+    'is_partial',
+    'ResultDispatcher',
+)
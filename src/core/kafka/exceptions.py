@@ -1,11 +1,33 @@
 from core.exceptions import APIError
 
+from fastapi import status
+
 
 class KafkaError(APIError):
     status_code = 400
     code = 'queue.error'
 
 
+class QueueThrottled(KafkaError):
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    detail = 'Too many generation tasks are in progress, try again later'
+    code = 'queue.throttled'
+
+    def __init__(self, retry_after: int, **kwargs) -> None:
+        super().__init__(headers={'Retry-After': str(retry_after)}, **kwargs)
+
+
+class QueueOverloaded(KafkaError):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    detail = 'The generation queue is overloaded, try again later'
+    code = 'queue.overloaded'
+
+    def __init__(self, retry_after: int, **kwargs) -> None:
+        super().__init__(headers={'Retry-After': str(retry_after)}, **kwargs)
+
+
 __all__ = (
     'KafkaError',
+    'QueueThrottled',
+    'QueueOverloaded',
 )
@@ -0,0 +1,637 @@
+from confluent_kafka import TopicPartition, OFFSET_BEGINNING, OFFSET_END, OFFSET_STORED, OFFSET_INVALID
+from confluent_kafka.admin import ClusterMetadata, TopicMetadata, PartitionMetadata
+
+from .routing import get_partition
+
+from typing import Callable
+
+import random, threading, time
+
+
+MEMORY_SCHEME = 'memory://'
+
+
+def is_memory_transport(service: str) -> bool:
+    """
+    Checks whether the kafka service address points to the in-process broker
+
+    :param service: Value of the KAFKA_SERVICE setting
+    :return: Is the in-process broker requested
+    """
+
+    return service.startswith(MEMORY_SCHEME)
+
+
+def _to_bytes(value: str | bytes | None) -> bytes | None:
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+class MemoryMessage:
+    """ Message of the in-process broker with the interface of confluent-kafka message """
+
+    __slots__ = ('_topic', '_partition', '_offset', '_key', '_value', '_headers', '_timestamp')
+
+    def __init__(
+        self,
+        topic: str,
+        partition: int,
+        offset: int,
+        key: bytes | None,
+        value: bytes | None,
+        headers: list[tuple[str, bytes]] | None,
+    ) -> None:
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._headers = headers
+        self._timestamp = int(time.time() * 1000)
+
+    def topic(self) -> str:
+        return self._topic
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+    def key(self) -> bytes | None:
+        return self._key
+
+    def value(self) -> bytes | None:
+        return self._value
+
+    def headers(self) -> list[tuple[str, bytes]] | None:
+        return self._headers
+
+    def timestamp(self) -> tuple[int, int]:
+        return 1, self._timestamp
+
+    def error(self) -> None:
+        return None
+
+    def __len__(self) -> int:
+        return len(self._value or b'')
+
+
+class MemoryBroker:
+    """ In-process broker with topics, partitions, consumer groups and committed offsets """
+
+    _partitions: int
+    _condition: threading.Condition
+    _topics: dict[str, list[list[MemoryMessage]]]
+    _committed: dict[tuple[str, str, int], int]
+    _groups: dict[str, list['MemoryConsumer']]
+    _generation: int
+    _sequence: int
+
+    def __init__(self, partitions: int = 4) -> None:
+        """
+        Stands in for the kafka cluster in development and benchmarks,
+        topics are created on the first use like with auto.create.topics.enable
+
+        :param partitions: Number of partitions of the automatically created topic
+        """
+
+        self._partitions = partitions
+        self._condition = threading.Condition()
+        self._topics = {}
+        self._committed = {}
+        self._groups = {}
+        self._generation = 0
+        self._sequence = 0
+
+    @property
+    def topics(self) -> list[str]:
+        with self._condition:
+            return list(self._topics)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence
+
+    def create_topic(self, topic: str, partitions: int = None) -> int:
+        """
+        Creates the topic if it does not exist
+
+        :param topic: Topic name
+        :param partitions: Number of partitions
+        :return: Number of partitions of the topic
+        """
+
+        with self._condition:
+            if topic not in self._topics:
+                self._topics[topic] = [[] for _ in range(partitions or self._partitions)]
+
+            return len(self._topics[topic])
+
+    def append(
+        self,
+        topic: str,
+        value: bytes | None,
+        key: bytes | None,
+        headers: list[tuple[str, bytes]] | None,
+        partition: int = -1,
+    ) -> MemoryMessage:
+        """
+        Appends the message to the partition log
+
+        :param topic: Topic name
+        :param value: Message value
+        :param key: Message key
+        :param headers: Message headers
+        :param partition: Partition number or -1 to choose it by the key
+        :return: Stored message
+        """
+
+        partitions_count = self.create_topic(topic)
+
+        if partition < 0:
+            partition = get_partition(key, partitions_count) if key else random.randrange(partitions_count)
+
+        with self._condition:
+            log = self._topics[topic][partition]
+            message = MemoryMessage(topic, partition, len(log), key, value, headers)
+
+            log.append(message)
+            self._sequence += 1
+            self._condition.notify_all()
+
+        return message
+
+    def fetch(self, topic: str, partition: int, offset: int, limit: int) -> list[MemoryMessage]:
+        """
+        Reads messages of the partition starting from the offset
+
+        :param topic: Topic name
+        :param partition: Partition number
+        :param offset: First offset to read
+        :param limit: Maximum number of messages
+        :return: List of messages
+        """
+
+        with self._condition:
+            return self._topics[topic][partition][offset:offset + limit]
+
+    def get_watermarks(self, topic: str, partition: int) -> tuple[int, int]:
+        """
+        Returns the low and the high offsets of the partition
+
+        :param topic: Topic name
+        :param partition: Partition number
+        :return: Low and high watermarks
+        """
+
+        self.create_topic(topic)
+
+        with self._condition:
+            return 0, len(self._topics[topic][partition])
+
+    def wait(self, sequence: int, timeout: float) -> None:
+        """
+        Blocks until a new message is appended or the assignment changes
+
+        :param sequence: Value of the sequence seen by the caller
+        :param timeout: Maximum waiting time (in seconds)
+        :return:
+        """
+
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence != sequence, timeout)
+
+    def commit(self, group: str, topic: str, partition: int, offset: int) -> None:
+        with self._condition:
+            self._committed[(group, topic, partition)] = offset
+
+    def get_committed(self, group: str, topic: str, partition: int) -> int | None:
+        with self._condition:
+            return self._committed.get((group, topic, partition))
+
+    def join(self, group: str, consumer: 'MemoryConsumer') -> None:
+        """
+        Adds the consumer to the group and rebalances its partitions
+
+        :param group: Consumer group identifier
+        :param consumer: Subscribed consumer
+        :return:
+        """
+
+        with self._condition:
+            members = self._groups.setdefault(group, [])
+
+            if consumer not in members:
+                members.append(consumer)
+
+            self._generation += 1
+            self._sequence += 1
+            self._condition.notify_all()
+
+    def leave(self, group: str, consumer: 'MemoryConsumer') -> None:
+        """
+        Removes the consumer from the group and rebalances its partitions
+
+        :param group: Consumer group identifier
+        :param consumer: Subscribed consumer
+        :return:
+        """
+
+        with self._condition:
+            members = self._groups.get(group, [])
+
+            if consumer in members:
+                members.remove(consumer)
+
+            self._generation += 1
+            self._sequence += 1
+            self._condition.notify_all()
+
+    def get_assignment(self, group: str, consumer: 'MemoryConsumer') -> list[tuple[str, int]]:
+        """
+        Distributes partitions of the subscribed topics between group members in round-robin
+
+        :param group: Consumer group identifier
+        :param consumer: Subscribed consumer
+        :return: List of topic and partition pairs owned by the consumer
+        """
+
+        with self._condition:
+            members = self._groups.get(group, [])
+
+            if consumer not in members:
+                return []
+
+            assignment = []
+            topics = sorted({x for member in members for x in member.subscription})
+
+            for topic in topics:
+                subscribers = [x for x in members if topic in x.subscription]
+                index = subscribers.index(consumer) if consumer in subscribers else -1
+
+                if index < 0:
+                    continue
+
+                for partition in range(index, len(self._topics[topic]), len(subscribers)):
+                    assignment.append((topic, partition))
+
+            return assignment
+
+
+class MemoryProducer:
+    """ Producer of the in-process broker with the interface of confluent-kafka producer """
+
+    _broker: MemoryBroker
+    _max_messages: int
+    _condition: threading.Condition
+    _reports: list[tuple[Callable, MemoryMessage]]
+
+    def __init__(self, broker: MemoryBroker, config: dict = None) -> None:
+        """
+        Messages are stored immediately, delivery reports are served by poll and flush
+
+        :param broker: In-process broker
+        :param config: Producer configuration (only queue.buffering.max.messages is used)
+        """
+
+        config = config or {}
+
+        self._broker = broker
+        self._max_messages = config.get('queue.buffering.max.messages', 100000)
+        self._condition = threading.Condition()
+        self._reports = []
+
+    def produce(
+        self,
+        topic: str,
+        value: str | bytes = None,
+        key: str | bytes = None,
+        partition: int = -1,
+        on_delivery: Callable = None,
+        headers: dict[str, str | bytes] | list[tuple[str, str | bytes]] = None,
+        **kwargs,
+    ) -> None:
+        """
+        Stores the message in the broker and queues its delivery report
+
+        :param topic: Topic name
+        :param value: Message value
+        :param key: Message key
+        :param partition: Partition number or -1 to choose it by the key
+        :param on_delivery: Delivery report callback
+        :param headers: Message headers
+        :return:
+        """
+
+        on_delivery = on_delivery or kwargs.get('callback')
+
+        with self._condition:
+            if len(self._reports) >= self._max_messages:
+                raise BufferError('Local: Queue full')
+
+        if isinstance(headers, dict):
+            headers = list(headers.items())
+
+        message = self._broker.append(
+            topic,
+            value=_to_bytes(value),
+            key=_to_bytes(key),
+            headers=[(name, _to_bytes(x)) for name, x in headers] if headers else None,
+            partition=partition,
+        )
+
+        with self._condition:
+            self._reports.append((on_delivery, message))
+            self._condition.notify_all()
+
+    def poll(self, timeout: float = -1) -> int:
+        """
+        Serves queued delivery reports
+
+        :param timeout: Maximum time to wait for reports (in seconds)
+        :return: Number of served reports
+        """
+
+        with self._condition:
+            if not self._reports and timeout != 0:
+                self._condition.wait(None if timeout < 0 else timeout)
+
+            reports, self._reports = self._reports, []
+
+        for on_delivery, message in reports:
+            if on_delivery is not None:
+                on_delivery(None, message)
+
+        return len(reports)
+
+    def flush(self, timeout: float = -1) -> int:
+        """
+        Serves all queued delivery reports
+
+        :param timeout: Maximum flush time (in seconds)
+        :return: Number of messages still in the queue
+        """
+
+        self.poll(0)
+
+        return len(self)
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._reports)
+
+
+class MemoryConsumer:
+    """ Consumer of the in-process broker with the interface of confluent-kafka consumer """
+
+    subscription: tuple[str, ...]
+
+    _broker: MemoryBroker
+    _group: str
+    _offset_reset: str
+    _auto_commit: bool
+    _positions: dict[tuple[str, int], int]
+    _assigned: bool
+    _generation: int
+    _closed: bool
+
+    def __init__(self, broker: MemoryBroker, config: dict) -> None:
+        """
+        Subscribed consumers of one group share partitions, assigned consumers read
+        the given partitions regardless of the group
+
+        :param broker: In-process broker
+        :param config: Consumer configuration (group.id, auto.offset.reset and enable.auto.commit are used)
+        """
+
+        self.subscription = ()
+
+        self._broker = broker
+        self._group = config['group.id']
+        self._offset_reset = config.get('auto.offset.reset', 'latest')
+        self._auto_commit = config.get('enable.auto.commit', True)
+        self._positions = {}
+        self._assigned = False
+        self._generation = -1
+        self._closed = False
+
+    def subscribe(self, topics: list[str], **kwargs) -> None:
+        """
+        Joins the consumer group and reads partitions distributed by the broker
+
+        :param topics: Topic names
+        :return:
+        """
+
+        for topic in topics:
+            self._broker.create_topic(topic)
+
+        self.subscription = tuple(topics)
+        self._assigned = False
+        self._broker.join(self._group, self)
+
+    def unsubscribe(self) -> None:
+        self.subscription = ()
+        self._broker.leave(self._group, self)
+
+    def assign(self, partitions: list[TopicPartition]) -> None:
+        """
+        Reads the given partitions without the group rebalancing
+
+        :param partitions: Partitions with the start offsets
+        :return:
+        """
+
+        self._assigned = True
+        self._positions = {}
+
+        for x in partitions:
+            self._broker.create_topic(x.topic)
+            self._positions[(x.topic, x.partition)] = self._resolve_offset(x.topic, x.partition, x.offset)
+
+    def assignment(self) -> list[TopicPartition]:
+        return [TopicPartition(topic, partition) for topic, partition in self._positions]
+
+    def list_topics(self, topic: str = None, timeout: float = -1) -> ClusterMetadata:
+        """
+        Returns the metadata of the topic, it is created if it does not exist
+
+        :param topic: Topic name
+        :param timeout: Not used
+        :return: Cluster metadata
+        """
+
+        metadata = ClusterMetadata()
+
+        for name in [topic] if topic else self._broker.topics:
+            topic_metadata = TopicMetadata()
+            topic_metadata.topic = name
+
+            for partition_id in range(self._broker.create_topic(name)):
+                partition_metadata = PartitionMetadata()
+                partition_metadata.id = partition_id
+                topic_metadata.partitions[partition_id] = partition_metadata
+
+            metadata.topics[name] = topic_metadata
+
+        return metadata
+
+    def get_watermark_offsets(self, partition: TopicPartition, **kwargs) -> tuple[int, int]:
+        return self._broker.get_watermarks(partition.topic, partition.partition)
+
+    def committed(self, partitions: list[TopicPartition], timeout: float = -1) -> list[TopicPartition]:
+        """
+        Returns the offsets committed by the group of this consumer
+
+        :param partitions: Partitions to look up
+        :param timeout: Not used
+        :return: Partitions with the committed offsets or OFFSET_INVALID
+        """
+
+        result = []
+
+        for x in partitions:
+            offset = self._broker.get_committed(self._group, x.topic, x.partition)
+            result.append(TopicPartition(x.topic, x.partition, OFFSET_INVALID if offset is None else offset))
+
+        return result
+
+    def position(self, partitions: list[TopicPartition]) -> list[TopicPartition]:
+        return [TopicPartition(x.topic, x.partition, self._positions.get((x.topic, x.partition), OFFSET_INVALID)) for x in partitions]
+
+    def consume(self, num_messages: int = 1, timeout: float = -1) -> list[MemoryMessage]:
+        """
+        Reads messages from the assigned partitions
+
+        :param num_messages: Maximum number of messages
+        :param timeout: Maximum time to wait for messages (in seconds)
+        :return: List of messages
+        """
+
+        deadline = time.monotonic() + (timeout if timeout >= 0 else float('inf'))
+
+        while not self._closed:
+            sequence = self._broker.sequence
+            self._rebalance()
+
+            messages = []
+
+            for (topic, partition), offset in self._positions.items():
+                batch = self._broker.fetch(topic, partition, offset, num_messages - len(messages))
+
+                if batch:
+                    messages.extend(batch)
+                    self._positions[(topic, partition)] = batch[-1].offset() + 1
+
+                if len(messages) >= num_messages:
+                    break
+
+            if messages:
+                if self._auto_commit:
+                    self.commit()
+
+                return messages
+
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                break
+
+            self._broker.wait(sequence, remaining)
+
+        return []
+
+    def poll(self, timeout: float = -1) -> MemoryMessage | None:
+        messages = self.consume(num_messages=1, timeout=timeout)
+
+        return messages[0] if messages else None
+
+    def commit(self, message: MemoryMessage = None, **kwargs) -> None:
+        """
+        Commits the offset of the message or the current positions
+
+        :param message: Last processed message
+        :return:
+        """
+
+        if message is not None:
+            self._broker.commit(self._group, message.topic(), message.partition(), message.offset() + 1)
+            return
+
+        for (topic, partition), offset in self._positions.items():
+            self._broker.commit(self._group, topic, partition, offset)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+
+        if self._auto_commit:
+            self.commit()
+
+        if self.subscription:
+            self.unsubscribe()
+
+        self._closed = True
+
+    def _resolve_offset(self, topic: str, partition: int, offset: int) -> int:
+        """
+        Turns the logical offset into the position in the partition log
+
+        :param topic: Topic name
+        :param partition: Partition number
+        :param offset: Offset or one of OFFSET_* constants
+        :return: Position in the partition log
+        """
+
+        if offset >= 0:
+            return offset
+
+        low, high = self._broker.get_watermarks(topic, partition)
+
+        if offset == OFFSET_BEGINNING:
+            return low
+        if offset == OFFSET_END:
+            return high
+
+        committed = self._broker.get_committed(self._group, topic, partition)
+
+        if committed is not None:
+            return committed
+
+        return low if self._offset_reset in ('earliest', 'smallest', 'beginning') else high
+
+    def _rebalance(self) -> None:
+        """ Picks up the partitions the broker assigned to this group member """
+
+        if self._assigned or self._generation == self._broker.generation:
+            return
+
+        self._generation = self._broker.generation
+
+        assignment = self._broker.get_assignment(self._group, self)
+        positions = {}
+
+        for topic, partition in assignment:
+            if (topic, partition) in self._positions:
+                positions[(topic, partition)] = self._positions[(topic, partition)]
+            else:
+                positions[(topic, partition)] = self._resolve_offset(topic, partition, OFFSET_STORED)
+
+        if self._auto_commit:
+            self.commit()
+
+        self._positions = positions
+
+
+__all__ = (
+    'MEMORY_SCHEME',
+    'is_memory_transport',
+    'MemoryMessage',
+    'MemoryBroker',
+    'MemoryProducer',
+    'MemoryConsumer',
+)
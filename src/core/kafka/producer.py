@@ -0,0 +1,181 @@
+from .exceptions import KafkaError
+
+from loguru import logger
+
+from functools import partial
+from typing import TYPE_CHECKING
+
+import asyncio, threading, time
+
+if TYPE_CHECKING:
+    from confluent_kafka import Producer, Message, KafkaError as ConfluentKafkaError
+
+
+class ProducerService:
+    """ Managed producer which serves delivery reports in the background """
+
+    _producer: 'Producer'
+    _poll_timeout: float
+    _buffer_timeout: float
+    _retry_interval: float
+    _loop: asyncio.AbstractEventLoop
+    _stopped: threading.Event
+    _thread: threading.Thread | None = None
+
+    def __init__(
+        self,
+        producer: 'Producer',
+        poll_timeout: float = 0.1,
+        buffer_timeout: float = 5,
+        retry_interval: float = 0.05,
+    ) -> None:
+        """
+        Delivery reports are served on a dedicated thread and passed
+        to the event loop, so every produced message gets its acknowledgment
+
+        :param producer: Configured producer
+        :param poll_timeout: Maximum time of the single poll call (in seconds)
+        :param buffer_timeout: How long to wait for free space in the local queue (in seconds)
+        :param retry_interval: Interval between attempts to enqueue the message (in seconds)
+        """
+
+        self._producer = producer
+        self._poll_timeout = poll_timeout
+        self._buffer_timeout = buffer_timeout
+        self._retry_interval = retry_interval
+        self._stopped = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    async def start(self) -> None:
+        """ Starts serving delivery reports """
+
+        self._loop = asyncio.get_running_loop()
+        self._stopped.clear()
+
+        self._thread = threading.Thread(target=self._run, name='kafka-producer', daemon=True)
+        self._thread.start()
+
+    async def stop(self, timeout: float) -> int:
+        """
+        Stops serving delivery reports and flushes the local queue
+
+        :param timeout: Maximum flush time (in seconds)
+        :return: Number of messages which were not delivered in time
+        """
+
+        self._stopped.set()
+
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+        remaining = await asyncio.to_thread(self._producer.flush, timeout)
+
+        if remaining > 0:
+            logger.warning(f'Kafka producer was not flushed in time, {remaining} messages are lost')
+
+        return remaining
+
+    def produce(
+        self,
+        topic: str,
+        value: str | bytes,
+        key: str | bytes = None,
+        headers: dict[str, str | bytes] = None,
+    ) -> asyncio.Future:
+        """
+        Enqueues the message for delivery, the service must be started
+
+        :param topic: Topic name
+        :param value: Message value
+        :param key: Message key
+        :param headers: Message headers
+        :return: Future resolved with the delivered message
+        """
+
+        if not self.is_running:
+            raise RuntimeError('producer is not started')
+
+        future = self._loop.create_future()
+        deadline = time.monotonic() + self._buffer_timeout
+
+        self._produce(future, deadline, topic=topic, value=value, key=key, headers=headers)
+
+        return future
+
+    def _produce(self, future: asyncio.Future, deadline: float, **kwargs) -> None:
+        """
+        Tries to enqueue the message and retries later if the local queue is full
+
+        :param future: Delivery future
+        :param deadline: Time after which the message is rejected
+        :param kwargs: Message arguments
+        :return:
+        """
+
+        if future.done():
+            return
+
+        try:
+            self._producer.produce(on_delivery=lambda e, m: self._on_delivery(future, e, m), **kwargs)
+        except BufferError:
+            if time.monotonic() >= deadline:
+                future.set_exception(KafkaError(detail='The queue is overloaded'))
+                return
+
+            self._loop.call_later(self._retry_interval, partial(self._produce, future, deadline, **kwargs))
+        except Exception as e:
+            logger.exception(f'Can\'t produce kafka message: {e}')
+            future.set_exception(KafkaError(detail='The queue is unavailable'))
+
+    def _on_delivery(self, future: asyncio.Future, error: 'ConfluentKafkaError', message: 'Message') -> None:
+        """
+        Passes the delivery report to the event loop
+
+        :param future: Delivery future
+        :param error: Delivery error
+        :param message: Delivered message
+        :return:
+        """
+
+        try:
+            self._loop.call_soon_threadsafe(self._resolve, future, error, message)
+        except RuntimeError:
+            logger.warning(f'Kafka delivery report after the event loop was closed: {error=}')
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, error: 'ConfluentKafkaError', message: 'Message') -> None:
+        """
+        Resolves the delivery future
+
+        :param future: Delivery future
+        :param error: Delivery error
+        :param message: Delivered message
+        :return:
+        """
+
+        if future.done():
+            return
+
+        if error is not None:
+            logger.error(f'Kafka message delivery error: {str(error)}')
+            future.set_exception(KafkaError(detail='The queue did not accept the task'))
+        else:
+            future.set_result(message)
+
+    def _run(self) -> None:
+        """ Serves delivery reports until the service is stopped """
+
+        while not self._stopped.is_set():
+            try:
+                self._producer.poll(self._poll_timeout)
+            except Exception as e:
+                logger.exception(f'Kafka producer poll error: {e}')
+
+
+__all__ = (
+    'ProducerService',
+)
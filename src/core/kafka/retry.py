@@ -0,0 +1,144 @@
+from .exceptions import KafkaError
+from .producer import ProducerService
+from .codec import build_headers, encode
+from .schemas import ImageTask, ImageResult
+
+from loguru import logger
+
+from typing import Awaitable, Callable
+
+import asyncio, random, time
+
+
+class RetryScheduler:
+    """ Re-produces failed generation tasks and moves exhausted ones to the dead-letter topic """
+
+    _produce_task: Callable[[ImageTask, int], Awaitable[ImageTask]]
+    _producer_service: ProducerService
+    _dlq_topic: str
+    _wire_format: str
+    _max_attempts: int
+    _base_delay: float
+    _max_delay: float
+    _counters: dict[str, int]
+
+    def __init__(
+        self,
+        produce_task: Callable[[ImageTask, int], Awaitable[ImageTask]],
+        producer_service: ProducerService,
+        dlq_topic: str,
+        wire_format: str = 'json',
+        max_attempts: int = 3,
+        base_delay: float = 1,
+        max_delay: float = 30,
+    ) -> None:
+        """
+        Transient failures of the GPU worker are retried on the server,
+        so the user gets the images instead of the error
+
+        :param produce_task: Produces the task with the given attempt number
+        :param producer_service: Producer of the dead-letter messages
+        :param dlq_topic: Topic name of the exhausted tasks
+        :param wire_format: Encoding format of the dead-letter messages
+        :param max_attempts: Maximum number of attempts including the first one
+        :param base_delay: Delay before the second attempt (in seconds)
+        :param max_delay: Maximum delay between attempts (in seconds)
+        """
+
+        self._produce_task = produce_task
+        self._producer_service = producer_service
+        self._dlq_topic = dlq_topic
+        self._wire_format = wire_format
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._counters = {'retried': 0, 'recovered': 0, 'dead_lettered': 0}
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return self._counters.copy()
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        Returns the exponential delay with equal jitter, so retries of the failed batch spread out
+
+        :param attempt: Number of the failed attempt
+        :return: Delay before the next attempt (in seconds)
+        """
+
+        delay = min(self._max_delay, self._base_delay * 2 ** (attempt - 1))
+
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def retry(self, result: ImageResult, attempt: int, deadline: float) -> bool:
+        """
+        Waits for the backoff delay and produces the task again
+
+        :param result: Failed generation result
+        :param attempt: Number of the failed attempt
+        :param deadline: Time after which nobody waits for the result
+        :return: Whether the task was produced again
+        """
+
+        if attempt >= self._max_attempts:
+            self.dead_letter(result, attempt, reason='exhausted')
+            return False
+
+        delay = self.get_delay(attempt)
+
+        if time.monotonic() + delay >= deadline:
+            self.dead_letter(result, attempt, reason='timeout')
+            return False
+
+        logger.warning(f'Retrying image generation task in {delay:.1f}s: {result.id=}, {attempt=}, {result.message=}')
+
+        await asyncio.sleep(delay)
+
+        task = ImageTask.model_validate(result.model_dump(include=set(ImageTask.model_fields)))
+
+        try:
+            await self._produce_task(task, attempt + 1)
+        except KafkaError as e:
+            logger.error(f'Can\'t retry image generation task: {result.id=}, {e.detail=}')
+            self.dead_letter(result, attempt, reason='unavailable')
+            return False
+
+        self._counters['retried'] += 1
+
+        return True
+
+    def record_recovered(self) -> None:
+        """ Counts the task which succeeded after a retry """
+
+        self._counters['recovered'] += 1
+
+    def dead_letter(self, result: ImageResult, attempt: int, reason: str) -> None:
+        """
+        Produces the failed result to the dead-letter topic
+
+        :param result: Failed generation result
+        :param attempt: Number of the last attempt
+        :param reason: Why the task is not retried anymore
+        :return:
+        """
+
+        self._counters['dead_lettered'] += 1
+
+        logger.error(f'Image generation task moved to the dead-letter topic: {result.id=}, {attempt=}, {reason=}')
+
+        delivery = self._producer_service.produce(
+            self._dlq_topic,
+            value=encode(result, wire_format=self._wire_format),
+            key=str(result.id),
+            headers={
+                **build_headers(result, wire_format=self._wire_format),
+                'attempt': str(attempt),
+                'reason': reason,
+            },
+        )
+        delivery.add_done_callback(lambda x: x.cancelled() or x.exception())
+
+
+__all__ = (
+    'RetryScheduler',
+)
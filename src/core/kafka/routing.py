@@ -0,0 +1,78 @@
+from functools import lru_cache
+
+import os, socket
+
+
+_MURMUR2_SEED = 0x9747b28c
+_MURMUR2_M = 0x5bd1e995
+_MASK = 0xffffffff
+
+
+@lru_cache
+def get_routing_key() -> str:
+    """
+    Returns the key which routes generation results back to this worker process
+
+    :return: Routing key
+    """
+
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def murmur2(data: bytes) -> int:
+    """
+    Murmur2 hash compatible with the default partitioner of the Java Kafka client
+
+    :param data: Key bytes
+    :return: Unsigned 32-bit hash
+    """
+
+    length = len(data)
+    h = (_MURMUR2_SEED ^ length) & _MASK
+
+    for i in range(0, length - length % 4, 4):
+        k = int.from_bytes(data[i:i + 4], 'little')
+        k = (k * _MURMUR2_M) & _MASK
+        k ^= k >> 24
+        k = (k * _MURMUR2_M) & _MASK
+        h = (h * _MURMUR2_M) & _MASK
+        h ^= k
+
+    tail = length & ~3
+    remainder = length % 4
+
+    if remainder == 3:
+        h ^= data[tail + 2] << 16
+    if remainder >= 2:
+        h ^= data[tail + 1] << 8
+    if remainder >= 1:
+        h ^= data[tail]
+        h = (h * _MURMUR2_M) & _MASK
+
+    h ^= h >> 13
+    h = (h * _MURMUR2_M) & _MASK
+    h ^= h >> 15
+
+    return h
+
+
+def get_partition(key: str | bytes, partitions_count: int) -> int:
+    """
+    Returns the partition of the keyed message the same way the murmur2 partitioner does
+
+    :param key: Message key
+    :param partitions_count: Number of partitions in the topic
+    :return: Partition number
+    """
+
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+
+    return (murmur2(key) & 0x7fffffff) % partitions_count
+
+
+__all__ = (
+    'get_routing_key',
+    'murmur2',
+    'get_partition',
+)
@@ -0,0 +1,165 @@
+from pydantic import ValidationError
+
+from .bridge import AsyncConsumer
+from .producer import ProducerService
+from .codec import BINARY_CONTENT_TYPE, get_header, build_headers, encode, decode
+from .schemas import ImageTask, ImageResult, ImageAttemptInfo
+
+from loguru import logger
+
+from typing import TYPE_CHECKING
+
+import asyncio, random
+
+if TYPE_CHECKING:
+    from confluent_kafka import Message
+
+
+class FakeWorker:
+    """ Stand-in of the stable diffusion worker which answers tasks with fake images """
+
+    _consumer: AsyncConsumer
+    _producer_service: ProducerService
+    _results_topic: str
+    _latency: float
+    _failure_rate: float
+    _semaphore: asyncio.Semaphore
+    _tasks: set[asyncio.Task]
+    _listener: asyncio.Task | None = None
+
+    def __init__(
+        self,
+        consumer: AsyncConsumer,
+        producer_service: ProducerService,
+        results_topic: str,
+        latency: float = 1,
+        failure_rate: float = 0,
+        concurrency: int = 4,
+    ) -> None:
+        """
+        Follows the protocol of the real worker: one partial result per image,
+        then the final result keyed by the reply-key header of the task
+
+        :param consumer: Asynchronous consumer of the tasks topic
+        :param producer_service: Producer of the results
+        :param results_topic: Topic name of the results
+        :param latency: Generation time of one image (in seconds)
+        :param failure_rate: Share of the tasks which fail (from 0 to 1)
+        :param concurrency: Number of tasks generated at the same time
+        """
+
+        self._consumer = consumer
+        self._producer_service = producer_service
+        self._results_topic = results_topic
+        self._latency = latency
+        self._failure_rate = failure_rate
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+
+    async def start(self) -> None:
+        """ Starts consuming the tasks topic """
+
+        await self._consumer.start()
+
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """ Stops consuming and cancels unfinished generations """
+
+        await self._consumer.stop()
+
+        if self._listener is not None:
+            await self._listener
+            self._listener = None
+
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _listen(self) -> None:
+        """ Reads the tasks topic until the consumer is stopped """
+
+        async for batch in self._consumer:
+            for message in batch:
+                task = asyncio.create_task(self._process(message))
+
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                task.add_done_callback(lambda _, x=message: self._commit(x))
+
+    async def _process(self, message: 'Message') -> None:
+        """
+        Generates fake images for the task and produces its results
+
+        :param message: Kafka message with the task
+        :return:
+        """
+
+        headers = message.headers()
+        content_type = get_header(headers, 'content-type')
+        wire_format = 'binary' if content_type and content_type.decode('utf-8') == BINARY_CONTENT_TYPE else 'json'
+
+        try:
+            task = decode(message.value(), headers, ImageTask)
+        except (ValidationError, ValueError):
+            logger.error(f'Fake worker got a malformed task: {message.value()=}')
+            return
+
+        reply_key = get_header(headers, 'reply-key') or message.key()
+
+        async with self._semaphore:
+            if random.random() < self._failure_rate:
+                await asyncio.sleep(self._latency)
+                self._send(self._make_result(task, [], 'failed', 'Fake worker failure'), reply_key, wire_format)
+                return
+
+            images = []
+
+            for index in range(task.images_count):
+                await asyncio.sleep(self._latency)
+
+                image = f'generated/{task.id}-{index}.png'
+                images.append(image)
+
+                self._send(self._make_result(task, [image], 'partial'), reply_key, wire_format)
+
+            self._send(self._make_result(task, images, 'success'), reply_key, wire_format)
+
+    def _commit(self, message: 'Message') -> None:
+        try:
+            self._consumer.commit(message)
+        except Exception as e:
+            logger.error(f'Fake worker can\'t commit the task: {e}')
+
+    def _send(self, result: ImageResult, reply_key: bytes | None, wire_format: str) -> None:
+        """
+        Produces the result to the partition of the waiting backend worker
+
+        :param result: Image generation result
+        :param reply_key: Routing key of the backend worker
+        :param wire_format: Encoding format of the task
+        :return:
+        """
+
+        self._producer_service.produce(
+            self._results_topic,
+            value=encode(result, wire_format=wire_format),
+            key=reply_key,
+            headers=build_headers(result, wire_format=wire_format),
+        )
+
+    @staticmethod
+    def _make_result(task: ImageTask, images: list[str], status: str, error: str = '') -> ImageResult:
+        return ImageResult(
+            **task.model_dump(),
+            info=ImageAttemptInfo(attempt=1, last_attempt_error=error),
+            images=images,
+            status=status,
+            message=error,
+        )
+
+
+__all__ = (
+    'FakeWorker',
+)
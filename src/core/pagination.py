@@ -0,0 +1,138 @@
+from fastapi import Response, status
+
+from core.exceptions import APIError
+
+from typing import Iterable, TYPE_CHECKING
+
+import base64, binascii, re
+
+if TYPE_CHECKING:
+    from sqlalchemy import Select
+    from sqlalchemy.orm import InstrumentedAttribute
+
+
+CURSOR_PREFIX = 'id:'
+
+CURSOR_BEFORE_HEADER = 'X-Cursor-Before'
+CURSOR_AFTER_HEADER = 'X-Cursor-After'
+CURSOR_HEADERS = (CURSOR_BEFORE_HEADER, CURSOR_AFTER_HEADER)
+
+_cursor_pattern = re.compile(rf'{re.escape(CURSOR_PREFIX)}(\d+)', re.ASCII)
+
+
+class InvalidCursorError(APIError):
+    status_code = status.HTTP_400_BAD_REQUEST
+    field = 'cursor'
+    detail = 'The cursor is invalid'
+    code = 'cursor.invalid'
+
+
+def encode_cursor(identifier: int) -> str:
+    """
+    Builds the opaque cursor pointing at the object
+
+    :param identifier: Object identifier
+    :return: Cursor string
+    """
+
+    return base64.urlsafe_b64encode(f'{CURSOR_PREFIX}{identifier}'.encode('utf-8')).rstrip(b'=').decode('utf-8')
+
+
+def decode_cursor(cursor: str | None) -> int | None:
+    """
+    Reads the object identifier from the cursor
+
+    :param cursor: Cursor string received from the client
+    :return: Object identifier or None if there is no cursor
+    """
+
+    if cursor is None:
+        return None
+
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        raise InvalidCursorError()
+
+    # str.isdigit() would accept digits like "²" which int() rejects
+    match = _cursor_pattern.fullmatch(value)
+
+    if match is None:
+        raise InvalidCursorError()
+
+    return int(match.group(1))
+
+
+def set_cursor_headers(response: Response, identifiers: Iterable[int]) -> None:
+    """
+    Adds cursors of the older and the newer page to the response, browsers let scripts read them
+    only if they are listed in Access-Control-Expose-Headers (pass CURSOR_HEADERS to expose_headers of CORS)
+
+    :param response: Response of the list view
+    :param identifiers: Identifiers of the returned objects
+    :return:
+    """
+
+    identifiers = list(identifiers)
+
+    if not identifiers:
+        return
+
+    response.headers[CURSOR_BEFORE_HEADER] = encode_cursor(min(identifiers))
+    response.headers[CURSOR_AFTER_HEADER] = encode_cursor(max(identifiers))
+
+    exposed = [x.strip() for x in response.headers.get('Access-Control-Expose-Headers', '').split(',') if x.strip()]
+    response.headers['Access-Control-Expose-Headers'] = ', '.join(dict.fromkeys([*exposed, *CURSOR_HEADERS]))
+
+
+
+def paginate(
+    statement: 'Select',
+    identifier: 'InstrumentedAttribute[int]',
+    offset: int = None,
+    limit: int = None,
+    before: int = None,
+    after: int = None,
+) -> tuple['Select', bool]:
+    """
+    Orders the objects by identifier and applies the page, with the cursor
+    the page is a range read of the index instead of skipping the offset rows
+
+    :param statement: Select statement of the objects
+    :param identifier: Identifier column
+    :param offset: The number of objects to skip (deprecated)
+    :param limit: The maximum number of objects
+    :param before: Only objects with the lower identifier
+    :param after: Only objects with the higher identifier
+    :return: Statement and whether it returns the objects in ascending order
+    """
+
+    is_ascending = after is not None
+
+    if before is not None:
+        statement = statement.where(identifier < before)
+
+    if after is not None:
+        statement = statement.where(identifier > after)
+
+    statement = statement.order_by(identifier.asc() if is_ascending else identifier.desc())
+
+    if offset:
+        statement = statement.offset(offset)
+
+    if limit is not None and limit > 0:
+        statement = statement.limit(limit)
+
+    return statement, is_ascending
+
+
+__all__ = (
+    'CURSOR_BEFORE_HEADER',
+    'CURSOR_AFTER_HEADER',
+    'CURSOR_HEADERS',
+    'InvalidCursorError',
+    'encode_cursor',
+    'decode_cursor',
+    'set_cursor_headers',
+    'paginate',
+)
@@ -0,0 +1,217 @@
+from core.redis import get_redis
+from core.settings import get_application_settings
+
+from loguru import logger
+
+from functools import lru_cache
+from typing import Iterable, TYPE_CHECKING
+
+import asyncio, time, uuid
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+    from core.settings import Settings
+
+
+_release_script = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class PresenceService:
+    """ Online state kept in Redis keys which expire unless the owner refreshes them """
+
+    _redis: 'Redis'
+    _ttl: int
+    _interval: float
+    _owner: str
+    _local: dict[str, float]
+    _heartbeat: asyncio.Task | None = None
+
+    def __init__(self, redis: 'Redis', ttl: int = 30, interval: float = 10) -> None:
+        """
+        Keys of local connections are refreshed by one pipeline per interval,
+        the key of the crashed process expires after the ttl
+
+        :param redis: Redis client
+        :param ttl: Lifetime of the key without heartbeats (in seconds)
+        :param interval: Interval between heartbeats (in seconds)
+        """
+
+        self._redis = redis
+        self._ttl = ttl
+        self._interval = interval
+        self._owner = uuid.uuid4().hex
+        self._local = {}
+        self._release = redis.register_script(_release_script)
+
+    @staticmethod
+    def get_key(kind: str, identifier: int | str) -> str:
+        return f'presence:{kind}:{identifier}'
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {'local': len(self._local)}
+
+    async def start(self) -> None:
+        """ Starts the heartbeat """
+
+        self._heartbeat = asyncio.create_task(self._refresh())
+
+    async def stop(self) -> None:
+        """ Stops the heartbeat and removes keys of this process """
+
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+
+        for key in list(self._local):
+            await self._release(keys=[key], args=[self._owner])
+
+        self._local.clear()
+
+    async def connect(self, kind: str, identifier: int | str) -> None:
+        """
+        Marks the object connected to this process as online
+
+        :param kind: Object kind, like "user"
+        :param identifier: Object identifier
+        :return:
+        """
+
+        key = self.get_key(kind, identifier)
+
+        self._local[key] = time.monotonic()
+        await self._redis.set(key, self._owner, ex=self._ttl)
+
+    async def disconnect(self, kind: str, identifier: int | str) -> None:
+        """
+        Marks the object as offline unless the key was taken by another process meanwhile,
+        that process puts the key back with its next heartbeat anyway
+
+        :param kind: Object kind
+        :param identifier: Object identifier
+        :return:
+        """
+
+        key = self.get_key(kind, identifier)
+
+        if self._local.pop(key, None) is not None:
+            await self._release(keys=[key], args=[self._owner])
+
+    async def touch(self, kind: str, identifier: int | str) -> None:
+        """
+        Refreshes the key of the connected object on its ping if the heartbeat is late
+
+        :param kind: Object kind
+        :param identifier: Object identifier
+        :return:
+        """
+
+        key = self.get_key(kind, identifier)
+        refreshed_at = self._local.get(key)
+
+        if refreshed_at is None or time.monotonic() - refreshed_at < self._interval:
+            return
+
+        self._local[key] = time.monotonic()
+        await self._redis.set(key, self._owner, ex=self._ttl)
+
+    async def set_online(self, kind: str, identifier: int | str, ttl: int) -> None:
+        """
+        Marks the object without connection (like the avatar which has just replied) as online for a while
+
+        :param kind: Object kind
+        :param identifier: Object identifier
+        :param ttl: How long the object stays online (in seconds)
+        :return:
+        """
+
+        await self._redis.set(self.get_key(kind, identifier), self._owner, ex=ttl)
+
+    async def get_presence(self, kind: str, identifiers: Iterable[int | str]) -> dict[int | str, bool]:
+        """
+        Reads the online state of several objects with one request
+
+        :param kind: Object kind
+        :param identifiers: Object identifiers
+        :return: Online state by identifier
+        """
+
+        identifiers = list(dict.fromkeys(identifiers))
+
+        if not identifiers:
+            return {}
+
+        values = await self._redis.mget([self.get_key(kind, x) for x in identifiers])
+
+        return {identifier: value is not None for identifier, value in zip(identifiers, values)}
+
+    async def _refresh(self) -> None:
+        """ Refreshes keys of local connections until the service is stopped """
+
+        while True:
+            await asyncio.sleep(self._interval)
+
+            keys = list(self._local)
+
+            if not keys:
+                continue
+
+            try:
+                async with self._redis.pipeline(transaction=False) as pipeline:
+                    for key in keys:
+                        pipeline.set(key, self._owner, ex=self._ttl)
+
+                    await pipeline.execute()
+            except Exception as e:
+                logger.error(f'Can\'t refresh presence: {e}')
+                continue
+
+            now = time.monotonic()
+
+            for key in keys:
+                if key in self._local:
+                    self._local[key] = now
+
+
+@lru_cache
+def get_presence_service() -> PresenceService:
+    settings = get_application_settings()
+
+    return PresenceService(
+        redis=get_redis(),
+        ttl=settings.PRESENCE_TTL,
+        interval=settings.PRESENCE_INTERVAL,
+    )
+
+
+async def setup_presence_service(settings: 'Settings') -> None:
+    if not settings.PRESENCE_ENABLED:
+        return
+
+    presence_service = get_presence_service()
+    await presence_service.start()
+
+    logger.debug('setup_presence_service() attached')
+
+
+async def shutdown_presence_service(settings: 'Settings') -> None:
+    if not settings.PRESENCE_ENABLED:
+        return
+
+    presence_service = get_presence_service()
+    await presence_service.stop()
+
+
+__all__ = (
+    'PresenceService',
+    'get_presence_service',
+    'setup_presence_service',
+    'shutdown_presence_service',
+)
@@ -0,0 +1,214 @@
+from core.redis import get_redis
+from core.settings import get_application_settings
+from core.broadcaster import MemoryBroadcastBackend, is_memory_broadcast, get_memory_broadcast_backend
+from core.streams import EventEnvelope
+
+from loguru import logger
+
+from functools import lru_cache
+from typing import Awaitable, Callable, TYPE_CHECKING
+
+import asyncio
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+    from redis.asyncio.client import PubSub
+
+
+Handler = Callable[[str, EventEnvelope], Awaitable[None]]
+
+
+class ChannelMultiplexer:
+    """ Single Redis pub/sub connection of the worker process shared by all local subscribers """
+
+    _redis: 'Redis | MemoryBroadcastBackend'
+    _pattern: str | None
+    _poll_timeout: float
+    _reconnect_delay: float
+    _pubsub: 'PubSub'
+    _handlers: dict[str, set[Handler]]
+    _ready: asyncio.Event
+    _counters: dict[str, int]
+    _reader: asyncio.Task | None = None
+    _is_stopped: bool = False
+
+    def __init__(
+        self,
+        redis: 'Redis | MemoryBroadcastBackend',
+        pattern: str = None,
+        poll_timeout: float = 1,
+        reconnect_delay: float = 1,
+    ) -> None:
+        """
+        Channels are subscribed in Redis while at least one local handler needs them,
+        with the pattern the connection receives everything matching it and drops channels nobody listens to
+
+        :param redis: Redis client or the memory broadcast backend
+        :param pattern: Pattern subscribed once instead of the separate channel subscriptions
+        :param poll_timeout: Maximum time of the single read (in seconds)
+        :param reconnect_delay: Pause after the connection error (in seconds)
+        """
+
+        self._redis = redis
+        self._pattern = pattern
+        self._poll_timeout = poll_timeout
+        self._reconnect_delay = reconnect_delay
+        self._handlers = {}
+        self._ready = asyncio.Event()
+        self._counters = {'received': 0, 'dropped': 0}
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            **self._counters,
+            'channels': len(self._handlers),
+            'handlers': sum(len(x) for x in self._handlers.values()),
+        }
+
+    async def start(self) -> None:
+        """ Opens the pub/sub connection and starts the reader """
+
+        self._is_stopped = False
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+
+        if self._pattern is not None:
+            await self._pubsub.psubscribe(self._pattern)
+            self._ready.set()
+
+        self._reader = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """ Stops the reader and closes the pub/sub connection """
+
+        self._is_stopped = True
+        self._ready.set()
+
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+
+        self._handlers.clear()
+
+        await self._pubsub.aclose()
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        """
+        Adds the handler of the channel, the first one subscribes the channel in Redis
+
+        :param channel: Channel name
+        :param handler: Coroutine function which receives the channel name and the event
+        :return:
+        """
+
+        handlers = self._handlers.setdefault(channel, set())
+        is_first = not handlers
+
+        handlers.add(handler)
+
+        if is_first and self._pattern is None:
+            try:
+                await self._pubsub.subscribe(channel)
+            except Exception:
+                # The next subscriber must try again, so the failed channel is not kept as subscribed
+                if self._handlers.get(channel) is handlers:
+                    del self._handlers[channel]
+
+                raise
+
+            self._ready.set()
+
+    async def unsubscribe(self, channel: str, handler: Handler) -> None:
+        """
+        Removes the handler of the channel, the last one unsubscribes the channel in Redis
+
+        :param channel: Channel name
+        :param handler: Handler passed to subscribe
+        :return:
+        """
+
+        handlers = self._handlers.get(channel)
+
+        if handlers is None:
+            return
+
+        handlers.discard(handler)
+
+        if handlers:
+            return
+
+        del self._handlers[channel]
+
+        if self._pattern is None:
+            await self._pubsub.unsubscribe(channel)
+
+    async def _dispatch(self, message: dict) -> None:
+        """
+        Passes the received message to the local handlers of its channel, all of them share one envelope
+
+        :param message: Redis pub/sub message
+        :return:
+        """
+
+        channel = message['channel'].decode('utf-8')
+        handlers = self._handlers.get(channel)
+
+        self._counters['received'] += 1
+
+        if not handlers:
+            self._counters['dropped'] += 1
+            return
+
+        event = EventEnvelope(message['data'])
+
+        for handler in list(handlers):
+            try:
+                await handler(channel, event)
+            except Exception as e:
+                logger.exception(f'Can\'t handle pub/sub message: {channel=}, {e}')
+
+    async def _listen(self) -> None:
+        """ Reads the pub/sub connection until the multiplexer is stopped """
+
+        await self._ready.wait()
+
+        # The read timeout of redis can swallow the cancellation, so the flag stops the loop as well
+        while not self._is_stopped:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=self._poll_timeout)
+            except Exception as e:
+                logger.error(f'Redis pub/sub connection error: {e}')
+                await asyncio.sleep(self._reconnect_delay)
+                continue
+
+            if message is not None:
+                await self._dispatch(message)
+
+
+@lru_cache
+def get_channel_multiplexer() -> ChannelMultiplexer:
+    settings = get_application_settings()
+
+    redis = get_memory_broadcast_backend() if is_memory_broadcast() else get_redis()
+
+    return ChannelMultiplexer(redis=redis, pattern=settings.REDIS_PUBSUB_PATTERN)
+
+
+async def setup_pubsub_service(_) -> None:
+    multiplexer = get_channel_multiplexer()
+    await multiplexer.start()
+
+    logger.debug('setup_pubsub_service() attached')
+
+
+async def shutdown_pubsub_service(_) -> None:
+    multiplexer = get_channel_multiplexer()
+    await multiplexer.stop()
+
+
+__all__ = (
+    'ChannelMultiplexer',
+    'get_channel_multiplexer',
+    'setup_pubsub_service',
+    'shutdown_pubsub_service',
+)
@@ -0,0 +1,115 @@
+from core.redis import get_redis
+from core.settings import get_application_settings
+
+from loguru import logger
+
+from functools import lru_cache
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+
+_increment_script = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCR', KEYS[1])
+end
+return false
+"""
+
+
+class QuotaCounters:
+    """ Usage counters kept in Redis keys, the missing key is seeded from the database by the caller """
+
+    _redis: 'Redis'
+    _ttl: int
+
+    def __init__(self, redis: 'Redis', ttl: int = 604800) -> None:
+        """
+        The counter is only incremented while its key exists, so the key never holds a partial count
+        and the next read after a miss seeds it from the source of truth again
+
+        :param redis: Redis client
+        :param ttl: Lifetime of the counter without the period end (in seconds)
+        """
+
+        self._redis = redis
+        self._ttl = ttl
+        self._increment = redis.register_script(_increment_script)
+
+    @staticmethod
+    def get_key(name: str, *identifiers: int | str) -> str:
+        return ':'.join(['quota', name, *map(str, identifiers)])
+
+    async def get(self, key: str, seed: Callable[[], Awaitable[int]], expire_at: datetime = None) -> int:
+        """
+        Returns the counter value, the counter is seeded on a miss,
+        the usage is counted in the database while Redis is unavailable
+
+        :param key: Counter key
+        :param seed: Coroutine function counting the usage in the database
+        :param expire_at: End of the counted period (UTC), the counter lives the default ttl without it
+        :return: Counter value
+        """
+
+        try:
+            value = await self._redis.get(key)
+        except Exception as e:
+            logger.error(f'Can\'t read quota counter: {key=}, {e}')
+            return await seed()
+
+        if value is not None:
+            return int(value)
+
+        count = await seed()
+
+        if expire_at is not None:
+            expiration = {'exat': int(expire_at.replace(tzinfo=timezone.utc).timestamp())}
+        else:
+            expiration = {'ex': self._ttl}
+
+        try:
+            # The counter seeded by the concurrent request wins, it may already include increments
+            if await self._redis.set(key, count, nx=True, **expiration):
+                return count
+
+            value = await self._redis.get(key)
+        except Exception as e:
+            logger.error(f'Can\'t seed quota counter: {key=}, {e}')
+            return count
+
+        return int(value) if value is not None else count
+
+    async def increment(self, key: str) -> int | None:
+        """
+        Counts one more usage if the counter is seeded, the failure is only logged since the usage is already stored,
+        the missed usage is counted once the key expires and is seeded again
+
+        :param key: Counter key
+        :return: New counter value or None if the counter is not seeded or Redis is unavailable
+        """
+
+        try:
+            value = await self._increment(keys=[key])
+        except Exception as e:
+            logger.error(f'Can\'t increment quota counter: {key=}, {e}')
+            return None
+
+        return int(value) if value is not None else None
+
+
+@lru_cache
+def get_quota_counters() -> QuotaCounters:
+    settings = get_application_settings()
+
+    return QuotaCounters(
+        redis=get_redis(),
+        ttl=settings.QUOTA_COUNTERS_TTL,
+    )
+
+
+__all__ = (
+    'QuotaCounters',
+    'get_quota_counters',
+)
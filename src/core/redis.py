@@ -0,0 +1,32 @@
+from redis.asyncio import Redis
+
+from core.settings import get_application_settings
+
+from loguru import logger
+
+from functools import lru_cache
+
+
+@lru_cache
+def get_redis() -> Redis:
+    settings = get_application_settings()
+    return Redis.from_url(str(settings.REDIS_URL))
+
+
+async def setup_redis_service(_) -> None:
+    redis = get_redis()
+    await redis.ping()
+
+    logger.debug('setup_redis_service() attached')
+
+
+async def shutdown_redis_service(_) -> None:
+    redis = get_redis()
+    await redis.aclose()
+
+
+__all__ = (
+    'get_redis',
+    'setup_redis_service',
+    'shutdown_redis_service',
+)
@@ -5,12 +5,17 @@ from functools import lru_cache
 from .database import DatabaseSettings
 from .fastapi import FastAPISettings
 from .logger import LoggerSettings
+from .kafka import KafkaSettings
+from .messenger import MessengerSettings
 
 
-class Settings(DatabaseSettings, FastAPISettings, LoggerSettings):
+class Settings(DatabaseSettings, FastAPISettings, LoggerSettings, KafkaSettings, MessengerSettings):
     SECRET_KEY: SecretStr
 
     REDIS_URL: RedisDsn
+    REDIS_PUBSUB_PATTERN: str | None = None
+
+    BROADCAST_URL: str | None = None
 
     DEVICE_ID_SECRET_KEY: SecretStr
     DEVICE_ID_PUBLIC_KEY: SecretStr
@@ -26,8 +31,6 @@ class Settings(DatabaseSettings, FastAPISettings, LoggerSettings):
     OPENAI_API_KEY: str
     ADAPTY_SECRET_KEY: str
 
-    KAFKA_SERVICE: str
-
     class Config:
         validate_assignment = True
 
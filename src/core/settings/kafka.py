@@ -0,0 +1,55 @@
+from .base import BaseSettings
+
+from typing import Literal
+
+
+class KafkaSettings(BaseSettings):
+    KAFKA_SERVICE: str
+
+    KAFKA_TASKS_TOPIC: str = 'sd-tasks'
+    KAFKA_RESULTS_TOPIC: str = 'sd-results'
+    KAFKA_DLQ_TOPIC: str = 'sd-tasks-dlq'
+    KAFKA_WORKER_GROUP: str = 'sd-workers'
+
+    KAFKA_EXPIRED_WAITERS_SIZE: int = 1024
+
+    KAFKA_WIRE_FORMAT: Literal['json', 'binary'] = 'json'
+
+    KAFKA_PARTITIONED_RESULTS: bool = False
+    KAFKA_METADATA_TIMEOUT: float = 10
+
+    KAFKA_LINGER_MS: int = 5
+    KAFKA_BATCH_SIZE: int = 1048576
+    KAFKA_COMPRESSION_TYPE: str = 'lz4'
+    KAFKA_ACKS: str = 'all'
+    KAFKA_ENABLE_IDEMPOTENCE: bool = True
+    KAFKA_QUEUE_MAX_MESSAGES: int = 100000
+    KAFKA_BUFFER_TIMEOUT: float = 5
+    KAFKA_FLUSH_TIMEOUT: float = 10
+
+    KAFKA_RETRY_MAX_ATTEMPTS: int = 3
+    KAFKA_RETRY_BASE_DELAY: float = 1
+    KAFKA_RETRY_MAX_DELAY: float = 30
+
+    KAFKA_ADMISSION_ENABLED: bool = True
+    KAFKA_ADMISSION_MAX_IN_FLIGHT: int = 256
+    KAFKA_ADMISSION_MAX_LAG: int = 1000
+    KAFKA_ADMISSION_MAX_WAIT: float = 120
+    KAFKA_ADMISSION_INTERVAL: float = 1
+
+    KAFKA_MEMORY_PARTITIONS: int = 4
+    KAFKA_FAKE_WORKER: bool = True
+    KAFKA_FAKE_WORKER_LATENCY: float = 1
+    KAFKA_FAKE_WORKER_FAILURE_RATE: float = 0
+    KAFKA_FAKE_WORKER_CONCURRENCY: int = 4
+
+    GENERATION_CACHE_TTL: int = 3600
+    GENERATION_CACHE_SIZE: int = 1024
+
+    GENERATION_JOB_TTL: int = 86400
+    GENERATION_JOB_TIMEOUT: int = 600
+
+
+__all__ = (
+    'KafkaSettings',
+)
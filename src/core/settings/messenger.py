@@ -0,0 +1,34 @@
+from .base import BaseSettings
+
+from typing import Literal
+
+
+class MessengerSettings(BaseSettings):
+    WS_OUTBOUND_QUEUE_SIZE: int = 64
+    WS_SLOW_CONSUMER_POLICY: Literal['drop_oldest', 'coalesce', 'disconnect'] = 'drop_oldest'
+    WS_SEND_TIMEOUT: float = 10
+
+    WS_EVENT_STREAM: bool = False
+    WS_EVENT_STREAM_MAXLEN: int = 100
+    WS_EVENT_STREAM_TTL: int = 86400
+
+    WS_COALESCE_WINDOW: float = 3
+    WS_COALESCE_MAX_KEYS: int = 10000
+
+    PRESENCE_ENABLED: bool = True
+    PRESENCE_TTL: int = 30
+    PRESENCE_INTERVAL: float = 10
+    PRESENCE_AVATAR_TTL: int = 900
+
+    QUOTA_COUNTERS_TTL: int = 604800
+
+    ENTITLEMENT_CHANNEL: str = 'entitlements'
+    ENTITLEMENT_TTL: int = 60
+    ENTITLEMENT_NEGATIVE_TTL: int = 60
+    ENTITLEMENT_STALE_TTL: int = 120
+    ENTITLEMENT_LOCAL_MAX_SIZE: int = 10000
+
+
+__all__ = (
+    'MessengerSettings',
+)
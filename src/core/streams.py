@@ -0,0 +1,383 @@
+from core.redis import get_redis
+from core.broadcaster import get_broadcast, is_memory_broadcast
+from core.settings import get_application_settings
+
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+import json, re, time
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+    from core.schemas import BaseSchema
+
+
+EVENT_ID_PREFIX = b'{"event_id":"'
+
+TYPE_PREFIX = b'"type":"'
+
+_event_id_pattern = re.compile(r'^\d+-\d+$')
+
+_publish_script = """
+local event_id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'data', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('PUBLISH', ARGV[4], ARGV[5] .. event_id .. ARGV[6])
+return event_id
+"""
+
+_coalesce_script = """
+if redis.call('SET', KEYS[1], '1', 'NX', 'PX', ARGV[1]) then
+    redis.call('PUBLISH', ARGV[2], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+def is_event_id(value: str) -> bool:
+    return bool(_event_id_pattern.match(value))
+
+
+def parse_event_id(event_id: str) -> tuple[int, int]:
+    """
+    Turns the stream entry identifier into the comparable pair
+
+    :param event_id: Identifier like "1718000000000-0"
+    :return: Milliseconds and sequence number
+    """
+
+    milliseconds, sequence = event_id.split('-')
+
+    return int(milliseconds), int(sequence)
+
+
+def make_event_message(message: bytes, event_id: bytes) -> bytes:
+    """
+    Adds the event identifier as the first field of the encoded JSON object
+
+    :param message: Encoded non-empty JSON object
+    :param event_id: Stream entry identifier
+    :return: Encoded message with the event_id field
+    """
+
+    return EVENT_ID_PREFIX + event_id + b'",' + message[1:]
+
+
+class EventEnvelope:
+    """ Websocket event encoded once at the publish site and delivered to every socket as is """
+
+    data: bytes
+
+    _type: str | None = None
+    _text: str | None = None
+
+    def __init__(self, data: bytes, type: str = None) -> None:
+        """
+        The type tag and the event identifier are read from the beginning of the payload
+        without decoding the whole JSON, the text is decoded once for all sockets
+
+        :param data: Encoded JSON object
+        :param type: Event type if it is known already
+        """
+
+        self.data = data
+        self._type = type
+
+    @classmethod
+    def from_schema(cls, schema: 'BaseSchema') -> 'EventEnvelope':
+        """
+        Encodes the websocket schema
+
+        :param schema: Schema with the type field
+        :return: Event envelope
+        """
+
+        return cls(schema.__pydantic_serializer__.to_json(schema), type=getattr(schema, 'type', None))
+
+    @property
+    def type(self) -> str | None:
+        if self._type is None:
+            self._type = self._read_type()
+
+        return self._type
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.data.decode('utf-8')
+
+        return self._text
+
+    @property
+    def event_id(self) -> str | None:
+        """ Identifier added by make_event_message or None if the event is not durable """
+
+        if not self.data.startswith(EVENT_ID_PREFIX):
+            return None
+
+        end = self.data.find(b'"', len(EVENT_ID_PREFIX))
+
+        return self.data[len(EVENT_ID_PREFIX):end].decode('utf-8') if end > 0 else None
+
+    def _read_type(self) -> str | None:
+        """
+        Reads the type field which follows the event identifier in the messages of this app,
+        other payloads are decoded
+
+        :return: Event type
+        """
+
+        start = 1
+
+        if self.data.startswith(EVENT_ID_PREFIX):
+            start = self.data.find(b'",', len(EVENT_ID_PREFIX)) + 2
+
+        if self.data.startswith(TYPE_PREFIX, start):
+            start += len(TYPE_PREFIX)
+            end = self.data.find(b'"', start)
+
+            if end > 0 and self.data.find(b'\\', start, end) < 0:
+                return self.data[start:end].decode('utf-8')
+
+        try:
+            payload = json.loads(self.data)
+        except ValueError:
+            return None
+
+        return payload.get('type') if isinstance(payload, dict) else None
+
+
+class EventStream:
+    """ Capped Redis stream of the channel which keeps recent events for reconnecting clients """
+
+    _redis: 'Redis'
+    _maxlen: int
+    _ttl: int
+
+    def __init__(self, redis: 'Redis', maxlen: int = 100, ttl: int = 86400) -> None:
+        """
+        The event is appended to the stream and published to the channel by one script,
+        so identifiers of live events grow in the same order they are delivered
+
+        :param redis: Redis client
+        :param maxlen: Approximate number of events kept per channel
+        :param ttl: Lifetime of the stream after the last event (in seconds)
+        """
+
+        self._redis = redis
+        self._maxlen = maxlen
+        self._ttl = ttl
+        self._publish = redis.register_script(_publish_script)
+
+    @staticmethod
+    def get_key(channel: str) -> str:
+        return f'stream:{channel}'
+
+    async def publish(self, channel: str, event: EventEnvelope) -> str:
+        """
+        Stores the event and publishes it with its identifier
+
+        :param channel: Channel name
+        :param event: Encoded event
+        :return: Event identifier
+        """
+
+        prefix, suffix = make_event_message(event.data, b'\0').split(b'\0')
+
+        event_id = await self._publish(
+            keys=[self.get_key(channel)],
+            args=[self._maxlen, event.data, self._ttl, channel, prefix, suffix],
+        )
+
+        return event_id.decode('utf-8')
+
+    async def read(self, channel: str, after: str) -> tuple[list[EventEnvelope], bool]:
+        """
+        Returns events published after the specified one
+
+        :param channel: Channel name
+        :param after: Identifier of the last event received by the client
+        :return: Events with identifiers, whether some of the missed events may be trimmed or expired already
+        """
+
+        key = self.get_key(channel)
+
+        async with self._redis.pipeline(transaction=False) as pipeline:
+            pipeline.xrange(key, min='-', max='+', count=1)
+            pipeline.xrange(key, min=f'({after}', max='+', count=self._maxlen * 2)
+            first_entry, entries = await pipeline.execute()
+
+        # The expired stream has no entries at all, the events after the client's one may be lost with it
+        is_trimmed = not first_entry or parse_event_id(first_entry[0][0].decode('utf-8')) > parse_event_id(after)
+
+        events = [EventEnvelope(make_event_message(fields[b'data'], event_id)) for event_id, fields in entries]
+
+        return events, is_trimmed
+
+
+class EventCoalescer:
+    """ Drops repeated transient events (typing etc.) of the channel while the first one is still fresh """
+
+    _redis: 'Redis | None'
+    _window: float
+    _max_keys: int
+    _recent: dict[str, float]
+    _counters: dict[str, int]
+
+    def __init__(self, redis: 'Redis | None', window: float = 3, max_keys: int = 10000) -> None:
+        """
+        Repeats are dropped by this process without a round trip, the marker key in Redis
+        drops them across processes and expires by itself after the window
+
+        :param redis: Redis client or None to coalesce only within this process (memory broadcast)
+        :param window: Time during which the same event is published once (in seconds)
+        :param max_keys: Maximum number of keys remembered by this process
+        """
+
+        self._redis = redis
+        self._window = window
+        self._max_keys = max_keys
+        self._recent = {}
+        self._counters = {'published': 0, 'coalesced': 0}
+        self._publish = redis.register_script(_coalesce_script) if redis is not None else None
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {**self._counters, 'keys': len(self._recent)}
+
+    @staticmethod
+    def get_key(channel: str, key: str) -> str:
+        return f'coalesce:{channel}:{key}'
+
+    async def publish(self, channel: str, key: str, event: EventEnvelope) -> bool:
+        """
+        Publishes the event unless the event with the same key was published within the window
+
+        :param channel: Channel name
+        :param key: Key of identical events, like "typing:<avatar_id>"
+        :param event: Encoded event
+        :return: Whether the event was published
+        """
+
+        recent_key = self.get_key(channel, key)
+        now = time.monotonic()
+
+        self._forget_expired(now)
+
+        if self._recent.get(recent_key, 0) > now:
+            self._counters['coalesced'] += 1
+            return False
+
+        self._recent.pop(recent_key, None)
+        self._recent[recent_key] = now + self._window
+
+        try:
+            if self._publish is not None:
+                is_published = await self._publish(
+                    keys=[recent_key],
+                    args=[int(self._window * 1000), channel, event.data],
+                )
+            else:
+                await get_broadcast().publish(channel=channel, message=event.data)
+                is_published = True
+        except Exception:
+            self._recent.pop(recent_key, None)
+            raise
+
+        self._counters['published' if is_published else 'coalesced'] += 1
+
+        return bool(is_published)
+
+    def _forget_expired(self, now: float) -> None:
+        """
+        Removes keys of this process which are out of the window,
+        they are ordered by expiration time since the window is the same for all of them
+
+        :param now: Current monotonic time
+        :return:
+        """
+
+        while self._recent:
+            recent_key, expires_at = next(iter(self._recent.items()))
+
+            if expires_at > now and len(self._recent) < self._max_keys:
+                break
+
+            del self._recent[recent_key]
+
+
+def is_event_stream_enabled() -> bool:
+    """ The stream lives in Redis, so it is off with the memory broadcast """
+
+    settings = get_application_settings()
+
+    return settings.WS_EVENT_STREAM and not is_memory_broadcast()
+
+
+@lru_cache
+def get_event_stream() -> EventStream:
+    settings = get_application_settings()
+
+    return EventStream(
+        redis=get_redis(),
+        maxlen=settings.WS_EVENT_STREAM_MAXLEN,
+        ttl=settings.WS_EVENT_STREAM_TTL,
+    )
+
+
+@lru_cache
+def get_event_coalescer() -> EventCoalescer:
+    settings = get_application_settings()
+
+    return EventCoalescer(
+        redis=None if is_memory_broadcast() else get_redis(),
+        window=settings.WS_COALESCE_WINDOW,
+        max_keys=settings.WS_COALESCE_MAX_KEYS,
+    )
+
+
+async def publish_event(
+    channel: str,
+    event: EventEnvelope,
+    is_durable: bool = True,
+    coalesce_key: str = None,
+) -> None:
+    """
+    Publishes the event to the channel, durable events are kept in the stream if it is enabled
+
+    :param channel: Channel name
+    :param event: Encoded event
+    :param is_durable: Whether the reconnecting client should receive the event (False for typing etc.)
+    :param coalesce_key: Key of identical transient events which are published once within the window
+    :return:
+    """
+
+    settings = get_application_settings()
+
+    if coalesce_key is not None and settings.WS_COALESCE_WINDOW > 0:
+        event_coalescer = get_event_coalescer()
+        await event_coalescer.publish(channel, coalesce_key, event)
+        return
+
+    if is_durable and is_event_stream_enabled():
+        event_stream = get_event_stream()
+        await event_stream.publish(channel, event)
+        return
+
+    broadcast = get_broadcast()
+    await broadcast.publish(channel=channel, message=event.data)
+
+
+__all__ = (
+    'is_event_id',
+    'parse_event_id',
+    'make_event_message',
+    'EventEnvelope',
+    'EventStream',
+    'EventCoalescer',
+    'is_event_stream_enabled',
+    'get_event_stream',
+    'get_event_coalescer',
+    'publish_event',
+)
@@ -0,0 +1,15 @@
+from core.exceptions import APIError
+
+from fastapi import status
+
+
+class GenerationJobNotFound(APIError):
+    status_code = status.HTTP_404_NOT_FOUND
+    field = 'job_id'
+    detail = 'Generation job with specified identifier not found'
+    code = 'generation.not_found'
+
+
+__all__ = (
+    'GenerationJobNotFound',
+)
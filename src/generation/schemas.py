@@ -0,0 +1,54 @@
+from core.schemas import BaseSchema
+
+from media.schemas import MediaSchema
+
+from enum import Enum
+
+
+class GenerationJobStatus(str, Enum):
+    """ The state of the image generation job """
+
+    PENDING = 'pending'
+    SUCCESS = 'success'
+    FAILED = 'failed'
+
+
+class GenerationJobSchema(BaseSchema):
+    """ The scheme of the image generation job """
+
+    id: int
+    user_id: int
+    status: GenerationJobStatus
+    images_count: int
+    media: list[MediaSchema] = []
+    message: str | None = None
+
+
+class GenerationImageSchema(BaseSchema):
+    """ The scheme of the single image generated for the job """
+
+    job_id: int
+    media: MediaSchema
+
+
+class WSGenerationImageSchema(BaseSchema):
+    """ WebSocket generated image object """
+
+    type: str = 'generation_image'
+    content: GenerationImageSchema
+
+
+class WSGenerationSchema(BaseSchema):
+    """ WebSocket generation job object """
+
+    type: str = 'generation'
+    content: GenerationJobSchema
+
+
+__all__ = (
+    'GenerationJobStatus',
+    'GenerationJobSchema',
+    'GenerationImageSchema',
+    'WSGenerationImageSchema',
+    'WSGenerationSchema',
+)
@@ -0,0 +1,240 @@
+from core.redis import get_redis
+from core.settings import get_application_settings
+from core.streams import EventEnvelope, publish_event
+from core.kafka import send_generation_task, stream_generation_results, store_generated_images, get_generation_cache, \
+    get_result_dispatcher
+from core.kafka.exceptions import KafkaError
+
+from media.schemas import MediaSchema
+from media.services import get_media_by_ids
+
+from .schemas import (
+    GenerationJobStatus,
+    GenerationJobSchema,
+    GenerationImageSchema,
+    WSGenerationImageSchema,
+    WSGenerationSchema,
+)
+
+from loguru import logger
+
+import asyncio
+
+
+async def submit_generation_job(
+    user_id: int,
+    task_id: int,
+    model: str,
+    prompt: str,
+    gender: str,
+    age: str,
+    images_count: int,
+) -> GenerationJobSchema:
+    """
+    Sends the image generation task and returns without waiting for the images,
+    the job is completed at once if the images of the same parameters are cached,
+    and it follows the running job of the same parameters instead of sending another task
+
+    :param user_id: Identifier of the user who receives the images
+    :param task_id: Task identifier (becomes the job identifier)
+    :param model: Model name
+    :param prompt: Prompt name
+    :param gender: Gender (like male, female etc.)
+    :param age: Age range (string like "20-24")
+    :param images_count: Count of images for generation
+    :return: Pending generation job or the completed one if the images are cached
+    """
+
+    settings = get_application_settings()
+
+    job = GenerationJobSchema(
+        id=task_id,
+        user_id=user_id,
+        status=GenerationJobStatus.PENDING,
+        images_count=images_count,
+    )
+
+    cache = get_generation_cache()
+    cache_key = cache.make_key(model, prompt, gender, age)
+    media_ids = await cache.get(cache_key, images_count)
+
+    if media_ids is not None:
+        job.media = [MediaSchema.model_validate(x) for x in await get_media_by_ids(media_ids)]
+
+        if len(job.media) == images_count:
+            job.status = GenerationJobStatus.SUCCESS
+
+            await _save_generation_job(job)
+
+            return job
+
+        job.media = []
+
+    generation = cache.join(cache_key, images_count)
+
+    if generation is not None:
+        get_result_dispatcher().watch(_follow_generation_job(job, generation))
+
+        await _save_generation_job(job)
+
+        return job
+
+    # Nothing is awaited between the join and the share, so identical concurrent jobs find this one
+    delivery = send_generation_task(task_id, model, prompt, gender, age, images_count, is_awaited=True)
+
+    # The shared generation is the only one which releases the result waiter, so it starts before anything can fail
+    cache.share(
+        cache_key,
+        images_count,
+        lambda: _run_generation_job(job, delivery=delivery, timeout=settings.GENERATION_JOB_TIMEOUT),
+    )
+
+    # Saved only after the queue accepted the task, a rejected job has nobody to complete it
+    await asyncio.shield(delivery)
+    await _save_generation_job(job)
+
+    return job
+
+
+async def get_generation_job(job_id: int) -> GenerationJobSchema | None:
+    """
+    Get the image generation job by its identifier
+
+    :param job_id: Job identifier
+    :return: Generation job or None if it is unknown or expired
+    """
+
+    redis = get_redis()
+    value = await redis.get(_get_job_key(job_id))
+
+    if value is None:
+        return None
+
+    return GenerationJobSchema.model_validate_json(value)
+
+
+async def _run_generation_job(job: GenerationJobSchema, delivery: asyncio.Future, timeout: int) -> list[int]:
+    """
+    Completes the job which sent the task, identical jobs share its images
+
+    :param job: Pending generation job
+    :param delivery: Future of the task acknowledgment
+    :param timeout: Wait timeout for the final result
+    :return: Media identifiers of the generated images
+    """
+
+    await delivery
+    await _watch_generation_job(job, timeout=timeout)
+
+    if job.status != GenerationJobStatus.SUCCESS:
+        raise KafkaError(detail=job.message)
+
+    return [x.id for x in job.media]
+
+
+async def _watch_generation_job(job: GenerationJobSchema, timeout: int) -> None:
+    """
+    Publishes every image as soon as it is generated and completes the job
+
+    :param job: Pending generation job
+    :param timeout: Wait timeout for the final result
+    :return:
+    """
+
+    stored_images = set()
+
+    try:
+        async for result in stream_generation_results(job.id, timeout=timeout):
+            images = [x for x in result.images if x not in stored_images]
+
+            if not images:
+                continue
+
+            stored_images.update(images)
+            media_list = await store_generated_images(result.model_copy(update={'images': images}))
+
+            for media in media_list:
+                schema = MediaSchema.model_validate(media)
+                job.media.append(schema)
+
+                await _publish_generation_image(job, schema)
+
+            await _save_generation_job(job)
+    except KafkaError as e:
+        job.status = GenerationJobStatus.FAILED
+        job.message = e.detail
+    except Exception as e:
+        logger.exception(f'Can\'t complete generation job: {e}')
+
+        job.status = GenerationJobStatus.FAILED
+        job.message = 'The images could not be saved'
+    else:
+        job.status = GenerationJobStatus.SUCCESS
+
+    await _complete_generation_job(job)
+
+
+async def _follow_generation_job(job: GenerationJobSchema, generation: asyncio.Task) -> None:
+    """
+    Completes the job with the images of the identical job which is running already
+
+    :param job: Pending generation job
+    :param generation: Shared generation of the same parameters
+    :return:
+    """
+
+    try:
+        media_ids = (await asyncio.shield(generation))[:job.images_count]
+        job.media = [MediaSchema.model_validate(x) for x in await get_media_by_ids(media_ids)]
+    except KafkaError as e:
+        job.status = GenerationJobStatus.FAILED
+        job.message = e.detail
+    except Exception as e:
+        logger.exception(f'Can\'t complete generation job: {e}')
+
+        job.status = GenerationJobStatus.FAILED
+        job.message = 'The images could not be saved'
+    else:
+        job.status = GenerationJobStatus.SUCCESS
+
+        for schema in job.media:
+            await _publish_generation_image(job, schema)
+
+    await _complete_generation_job(job)
+
+
+async def _publish_generation_image(job: GenerationJobSchema, media: MediaSchema) -> None:
+    await publish_event(
+        channel=f'user_{job.user_id}',
+        event=EventEnvelope.from_schema(
+            WSGenerationImageSchema(
+                content=GenerationImageSchema(job_id=job.id, media=media),
+            ),
+        ),
+    )
+
+
+async def _complete_generation_job(job: GenerationJobSchema) -> None:
+    await _save_generation_job(job)
+
+    await publish_event(
+        channel=f'user_{job.user_id}',
+        event=EventEnvelope.from_schema(WSGenerationSchema(content=job)),
+    )
+
+
+async def _save_generation_job(job: GenerationJobSchema) -> None:
+    settings = get_application_settings()
+    redis = get_redis()
+
+    await redis.set(_get_job_key(job.id), job.model_dump_json(), ex=settings.GENERATION_JOB_TTL)
+
+
+def _get_job_key(job_id: int) -> str:
+    return f'generation:job:{job_id}'
+
+
+__all__ = (
+    'submit_generation_job',
+    'get_generation_job',
+)
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends
+
+from users.dependencies import current_user
+
+from .schemas import GenerationJobSchema
+from .services import get_generation_job
+from .exceptions import GenerationJobNotFound
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from users.models import User
+
+
+router = APIRouter()
+
+
+@router.get('/{job_id}', response_model=GenerationJobSchema)
+async def generation_job_view(
+    job_id: int,
+    user: 'User' = Depends(current_user),
+) -> GenerationJobSchema:
+    """ An API method for checking the state of the image generation job """
+
+    job = await get_generation_job(job_id)
+
+    if not job or job.user_id != user.id:
+        raise GenerationJobNotFound()
+
+    return job
+
+
+__all__ = (
+    'router',
+)
@@ -1,6 +1,6 @@
-from sqlalchemy import select
+from sqlalchemy import select, insert
 
-from core.db import get_session_maker, get_session
+from core.db import get_session
 from core.settings import get_application_settings
 
 from .client import S3Client
@@ -44,14 +44,36 @@ async def store_photo(file: BytesIO | str, extension: str = None) -> Media:
     file_name = await client.upload_file(file=file, extension=extension)
     full_path = settings.S3_STORAGE_URL + file_name
 
-    media = Media(name=file_name, url=full_path)
-    session = get_session_maker()
+    media_list = await create_media_list([(file_name, full_path)])
+
+    return media_list[0]
+
+
+async def create_media_list(items: list[tuple[str, str]], session: 'AsyncSession' = None) -> list[Media]:
+    """
+    Saves many media objects with a single INSERT ... RETURNING statement
+
+    :param items: Pairs of file name and its full address
+    :param session: Database session
+    :return: Saved media model objects in the order of items
+    """
+
+    if not items:
+        return []
+
+    session, is_new_session = get_session(session)
+
+    statement = insert(Media).returning(Media, sort_by_parameter_order=True)
+
+    query = await session.scalars(statement, [{'name': name, 'url': url} for name, url in items])
+    media_list = query.all()
 
-    session.add(media)
     await session.commit()
-    await session.close()
 
-    return media
+    if is_new_session:
+        await session.close()
+
+    return media_list
 
 
 async def get_media_by_id(media_id: int, session: 'AsyncSession' = None) -> Media | None:
@@ -75,7 +97,32 @@ async def get_media_by_id(media_id: int, session: 'AsyncSession' = None) -> Medi
     return query.scalar_one_or_none()
 
 
+async def get_media_by_ids(media_ids: list[int], session: 'AsyncSession' = None) -> list[Media]:
+    """
+    Get media content list by its identifiers
+
+    :param media_ids: Media objects identifiers
+    :param session: Database session
+    :return: List of media model objects in the order of identifiers
+    """
+
+    session, is_new_session = get_session(session)
+
+    statement = select(Media).where(Media.id.in_(media_ids))
+
+    query = await session.execute(statement)
+
+    if is_new_session:
+        await session.close()
+
+    media = {x.id: x for x in query.scalars().all()}
+
+    return [media[x] for x in media_ids if x in media]
+
+
 __all__ = (
     'store_photo',
+    'create_media_list',
     'get_media_by_id',
+    'get_media_by_ids',
 )
@@ -1,19 +1,22 @@
 from sqlalchemy import select, update, func
-from sqlalchemy.orm import joinedload, aliased, selectinload
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.dialects.postgresql import insert
 
 from core.db import get_session
+from core.pagination import paginate
 
 from users.models import User
 
-from avatars.models import Avatar, AvatarOnline
-from avatars.services import update_avatars_online
+from avatars.models import Avatar
 
 from .types import Role, DialogSchema, ChatSchema, MessageSchema
-from .models import Message, AssistantMessage
+from .models import Message, AssistantMessage, Dialog
+from .presence import get_avatars_presence
 
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
+    from sqlalchemy.dialects.postgresql import Insert
     from sqlalchemy.ext.asyncio import AsyncSession
 
 
@@ -64,6 +67,9 @@ async def send_message(
     session, is_new_session = get_session(session)
 
     session.add(message)
+    await session.flush()
+
+    await session.execute(_get_dialog_upsert_statement(message))
     await session.commit()
 
     if is_new_session:
@@ -72,6 +78,33 @@ async def send_message(
     return message
 
 
+def _get_dialog_upsert_statement(message: Message) -> 'Insert':
+    """
+    Builds the statement which moves the dialog summary to the new message,
+    concurrent transactions of the same dialog are serialized by the row lock of the summary
+
+    :param message: Flushed message model object
+    :return: Upsert statement
+    """
+
+    statement = insert(Dialog).values(
+        user_id=message.user_id,
+        avatar_id=message.avatar_id,
+        last_message_id=message.id,
+        last_activity_at=func.now(),
+        unread_count=1 if message.unread_mark else 0,
+    )
+
+    return statement.on_conflict_do_update(
+        constraint='uq_dialogs_user_id_avatar_id',
+        set_={
+            'last_message_id': func.greatest(Dialog.last_message_id, statement.excluded.last_message_id),
+            'last_activity_at': func.greatest(Dialog.last_activity_at, statement.excluded.last_activity_at),
+            'unread_count': Dialog.unread_count + statement.excluded.unread_count,
+        },
+    )
+
+
 async def send_message_to_assistant(
     user: User,
     text: str,
@@ -112,7 +145,7 @@ async def get_dialog_list(
     session: 'AsyncSession' = None,
 ) -> list[DialogSchema]:
     """
-    Returns a list of user dialogs
+    Returns a list of user dialogs, read from the dialog summaries with one index range
 
     :param user: User model object
     :param offset: The number of dialogs that must be skipped to receive the following
@@ -123,50 +156,37 @@ async def get_dialog_list(
 
     session, is_new_session = get_session(session)
 
-    await update_avatars_online(user=user, session=session)
-
     if offset is None:
         offset = 0
 
-    AliasedMessage = aliased(Message)
-
-    unread_subquery = select(func.count(AliasedMessage.id)).where(
-        AliasedMessage.user_id == Message.user_id,
-        AliasedMessage.avatar_id == Message.avatar_id,
-        AliasedMessage.unread_mark == True,
-    ).scalar_subquery()
-
-    message_subquery = select(func.max(Message.id)).where(Message.user_id == user.id).group_by(Message.avatar_id)
-
-    online_subquery = select(AvatarOnline.is_online).where(
-        AvatarOnline.user_id == Message.user_id,
-        AvatarOnline.avatar_id == Message.avatar_id,
-    ).scalar_subquery()
-
-    statement = select(Message, unread_subquery, online_subquery).where(
-        Message.id.in_(message_subquery),
-    ).order_by(Message.id.desc()).offset(offset).options(selectinload(Message.photo))
+    statement = select(Dialog).where(
+        Dialog.user_id == user.id,
+    ).order_by(Dialog.last_message_id.desc()).offset(offset)
 
     if limit is not None and limit > 0:
         statement = statement.limit(limit)
 
-    statement = statement.options(joinedload(Message.avatar).selectinload(Avatar.photo))
+    statement = statement.options(
+        joinedload(Dialog.last_message).selectinload(Message.photo),
+        joinedload(Dialog.avatar).selectinload(Avatar.photo),
+    )
 
     query = await session.execute(statement)
+    summaries = query.scalars().all()
+
+    avatars_presence = await get_avatars_presence(user.id, [x.avatar_id for x in summaries])
 
     dialogs = []
 
-    for top_message in query:
-        is_avatar_online = top_message[2]
-        unread_count = top_message[1]
-        message = top_message[0]
+    for summary in summaries:
+        message = summary.last_message
 
         avatar_chat_schema = ChatSchema(
-            id=message.avatar_id,
-            name=message.avatar.name,
-            is_online=is_avatar_online or False,
+            id=summary.avatar_id,
+            name=summary.avatar.name,
+            is_online=avatars_presence[summary.avatar_id],
             is_avatar=True,
-            photo=message.avatar.photo[0] if len(message.avatar.photo) > 0 else None,
+            photo=summary.avatar.photo[0] if len(summary.avatar.photo) > 0 else None,
         )
 
         top_message_schema = MessageSchema(
@@ -185,7 +205,7 @@ async def get_dialog_list(
         )
 
         dialogs.append(DialogSchema(
-            unread_count=unread_count,
+            unread_count=summary.unread_count,
             chat=avatar_chat_schema,
             top_message=top_message_schema,
         ))
@@ -196,18 +216,68 @@ async def get_dialog_list(
     return dialogs
 
 
+async def rebuild_dialogs(from_user_id: int, to_user_id: int, session: 'AsyncSession' = None) -> int:
+    """
+    Recomputes dialog summaries of the users from their messages (backfill)
+
+    :param from_user_id: The first user identifier of the range
+    :param to_user_id: The user identifier after the range
+    :param session: Database session
+    :return: Number of the rebuilt dialogs
+    """
+
+    selection = select(
+        Message.user_id,
+        Message.avatar_id,
+        func.max(Message.id),
+        func.max(Message.created_at),
+        func.count(Message.id).filter(Message.unread_mark == True),
+    ).where(
+        Message.user_id >= from_user_id,
+        Message.user_id < to_user_id,
+    ).group_by(Message.user_id, Message.avatar_id)
+
+    statement = insert(Dialog).from_select(
+        ['user_id', 'avatar_id', 'last_message_id', 'last_activity_at', 'unread_count'],
+        selection,
+    )
+
+    statement = statement.on_conflict_do_update(
+        constraint='uq_dialogs_user_id_avatar_id',
+        set_={
+            'last_message_id': func.greatest(Dialog.last_message_id, statement.excluded.last_message_id),
+            'last_activity_at': func.greatest(Dialog.last_activity_at, statement.excluded.last_activity_at),
+            'unread_count': statement.excluded.unread_count,
+        },
+    )
+
+    session, is_new_session = get_session(session)
+
+    query = await session.execute(statement)
+    await session.commit()
+
+    if is_new_session:
+        await session.close()
+
+    return query.rowcount
+
+
 async def get_dialog_messages(
     *participants: User | Avatar,
     offset: int = None,
     limit: int = None,
+    before: int = None,
+    after: int = None,
     session: 'AsyncSession' = None,
 ) -> list[Message]:
     """
-    Returns a list of all messages between two interlocutors
+    Returns a list of messages between two interlocutors, the newest first
 
     :param participants: Interlocutors (user and avatar)
-    :param offset: The number of messages that must be skipped to receive the following
+    :param offset: The number of messages that must be skipped to receive the following (deprecated)
     :param limit: The maximum number of messages to receive
+    :param before: Identifier of the message, only older messages are returned
+    :param after: Identifier of the message, only the nearest newer messages are returned
     :param session: Database session
     :return: List of the received messages
     """
@@ -215,19 +285,15 @@ async def get_dialog_messages(
     if len(participants) != 2:
         raise AttributeError('To receive messages, you need to transfer 2 participants of the dialogue')
 
-    if offset is None:
-        offset = 0
-
     user = participants[0] if isinstance(participants[0], User) else participants[1]
     avatar = participants[1] if user == participants[0] else participants[0]
 
     statement = select(Message).where(
         Message.user_id == user.id,
         Message.avatar_id == avatar.id,
-    ).order_by(Message.created_at.desc()).offset(offset)
+    )
 
-    if limit is not None and limit > 0:
-        statement = statement.limit(limit)
+    statement, is_ascending = paginate(statement, Message.id, offset, limit, before, after)
 
     statement = statement.options(
         joinedload(Message.avatar).selectinload(Avatar.photo),
@@ -242,7 +308,9 @@ async def get_dialog_messages(
     if is_new_session:
         await session.close()
 
-    return query.scalars().all()
+    messages = query.scalars().all()
+
+    return messages[::-1] if is_ascending else messages
 
 
 async def read_dialog_messages(user: 'User', avatar: 'Avatar', session: 'AsyncSession' = None) -> None:
@@ -261,8 +329,16 @@ async def read_dialog_messages(user: 'User', avatar: 'Avatar', session: 'AsyncSe
         Message.unread_mark == True,
     ).values(unread_mark=False)
 
+    dialog_statement = update(Dialog).where(
+        Dialog.user_id == user.id,
+        Dialog.avatar_id == avatar.id,
+    ).values(unread_count=0)
+
     session, is_new_session = get_session(session)
 
+    # The summary row is locked first, so the concurrent send_message either commits its message before
+    # it is marked as read or waits to increment the counter until the reset is committed
+    await session.execute(dialog_statement)
     await session.execute(statement)
     await session.commit()
 
@@ -434,26 +510,24 @@ async def get_assistant_messages(
     user: 'User',
     offset: int = None,
     limit: int = None,
+    before: int = None,
+    after: int = None,
     session: 'AsyncSession' = None,
 ) -> list[AssistantMessage]:
     """
-    Retrieve assistant messages list
+    Retrieve assistant messages list, the newest first
 
     :param user: User model object
-    :param offset: Offset for retrieving messages
+    :param offset: Offset for retrieving messages (deprecated)
     :param limit: Limit of messages
+    :param before: Identifier of the message, only older messages are returned
+    :param after: Identifier of the message, only the nearest newer messages are returned
     :param session: Database session
     :return: Messages list between user and assistant
     """
 
-    if offset is None:
-        offset = 0
-
-    statement = (select(AssistantMessage).where(AssistantMessage.user_id == user.id)
-                 .order_by(AssistantMessage.created_at.desc()).offset(offset))
-
-    if limit is not None and limit > 0:
-        statement = statement.limit(limit)
+    statement = select(AssistantMessage).where(AssistantMessage.user_id == user.id)
+    statement, is_ascending = paginate(statement, AssistantMessage.id, offset, limit, before, after)
 
     statement = statement.options(
         joinedload(AssistantMessage.user),
@@ -466,12 +540,15 @@ async def get_assistant_messages(
     if is_new_session:
         await session.close()
 
-    return query.scalars().all()
+    messages = query.scalars().all()
+
+    return messages[::-1] if is_ascending else messages
 
 
 __all__ = (
     'send_message',
     'get_dialog_list',
+    'rebuild_dialogs',
     'get_dialog_messages',
     'read_dialog_messages',
     'get_assistant_messages',
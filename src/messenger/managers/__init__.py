@@ -1,14 +1,34 @@
-from .connection import ConnectionManager
+from core.pubsub import get_channel_multiplexer
+from core.presence import get_presence_service
+from core.settings import get_application_settings
+from core.streams import get_event_stream, is_event_stream_enabled
+
+from .connection import ConnectionManager, USER_CHANNEL_PREFIX, USER_PRESENCE_KIND, get_user_channel
+from .outbound import SlowConsumerPolicy, OutboundConnection
 
 from functools import lru_cache
 
 
 @lru_cache
 def get_connection_manager() -> 'ConnectionManager':
-    return ConnectionManager()
+    settings = get_application_settings()
+
+    return ConnectionManager(
+        multiplexer=get_channel_multiplexer(),
+        queue_size=settings.WS_OUTBOUND_QUEUE_SIZE,
+        policy=settings.WS_SLOW_CONSUMER_POLICY,
+        send_timeout=settings.WS_SEND_TIMEOUT,
+        event_stream=get_event_stream() if is_event_stream_enabled() else None,
+        presence=get_presence_service() if settings.PRESENCE_ENABLED else None,
+    )
 
 
 __all__ = (
+    'USER_CHANNEL_PREFIX',
+    'USER_PRESENCE_KIND',
+    'get_user_channel',
+    'SlowConsumerPolicy',
+    'OutboundConnection',
     'ConnectionManager',
     'get_connection_manager',
 )
@@ -1,4 +1,11 @@
+from core.pubsub import ChannelMultiplexer
+from core.presence import PresenceService
+from core.streams import EventStream, EventEnvelope
+
 from ..types import WSMessageSchema
+from .outbound import SlowConsumerPolicy, OutboundConnection
+
+from loguru import logger
 
 from typing import TYPE_CHECKING
 
@@ -6,48 +13,197 @@ if TYPE_CHECKING:
     from fastapi import WebSocket
 
 
+USER_CHANNEL_PREFIX = 'user_'
+
+USER_PRESENCE_KIND = 'user'
+
+RESYNC_MESSAGE = EventEnvelope.from_schema(WSMessageSchema(type='resync'))
+
+
+def get_user_channel(user_id: int) -> str:
+    """
+    Returns the name of the pub/sub channel with events of the user
+
+    :param user_id: User identifier
+    :return: Channel name
+    """
+
+    return f'{USER_CHANNEL_PREFIX}{user_id}'
+
+
 class ConnectionManager:
-    _active_connections: dict[int, list['WebSocket']]
+    _active_connections: dict[int, list[OutboundConnection]]
+    _multiplexer: ChannelMultiplexer
+    _queue_size: int
+    _policy: SlowConsumerPolicy
+    _send_timeout: float
+    _event_stream: EventStream | None
+    _presence: PresenceService | None
 
-    def __init__(self) -> None:
-        """ WebSocket connections manager """
+    def __init__(
+        self,
+        multiplexer: ChannelMultiplexer,
+        queue_size: int = 64,
+        policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST,
+        send_timeout: float = 10,
+        event_stream: EventStream = None,
+        presence: PresenceService = None,
+    ) -> None:
+        """
+        WebSocket connections manager, the user channel is subscribed while the user has local connections
+
+        :param multiplexer: Shared pub/sub connection of the worker process
+        :param queue_size: Maximum number of messages waiting for the single client
+        :param policy: What to do with the new message when the client does not keep up
+        :param send_timeout: Maximum time of the single send (in seconds)
+        :param event_stream: Stream of recent events replayed to the reconnecting client
+        :param presence: Presence service which marks users with local connections as online
+        """
 
         self._active_connections = {}
+        self._multiplexer = multiplexer
+        self._queue_size = queue_size
+        self._policy = SlowConsumerPolicy(policy)
+        self._send_timeout = send_timeout
+        self._event_stream = event_stream
+        self._presence = presence
+
+    @property
+    def connections_count(self) -> int:
+        return sum(len(x) for x in self._active_connections.values())
+
+    @property
+    def stats(self) -> dict[str, int | float]:
+        stats = {'connections': 0, 'sent': 0, 'dropped': 0, 'coalesced': 0, 'queued': 0, 'send_time_max': 0}
+
+        for connections in self._active_connections.values():
+            for connection in connections:
+                connection_stats = connection.stats
+
+                stats['connections'] += 1
+                stats['sent'] += connection_stats['sent']
+                stats['dropped'] += connection_stats['dropped']
+                stats['coalesced'] += connection_stats['coalesced']
+                stats['queued'] += connection_stats['queued']
+                stats['send_time_max'] = max(stats['send_time_max'], connection_stats['send_time_max'])
+
+        return stats
 
-    async def broadcast(self, user_id: int, message: WSMessageSchema) -> None:
+    async def broadcast(self, user_id: int, event: EventEnvelope) -> None:
         """
-        Broadcast message to specified user
+        Broadcast event to specified user
 
         :param user_id: User identifier
-        :param message: Message object
+        :param event: Event encoded by EventEnvelope.from_schema
         :return:
         """
 
-        if user_id not in self._active_connections:
-            return
+        self.send(user_id, event, key=self._get_key(event))
 
-        message_json = message.model_dump_json()
+    def send(self, user_id: int, event: EventEnvelope, key: str = None) -> None:
+        """
+        Queue the encoded event for local connections of specified user without waiting for them
 
-        for websocket in self._active_connections[user_id]:
-            await websocket.send_text(message_json)
+        :param user_id: User identifier
+        :param event: Encoded event shared by all connections
+        :param key: Coalescing key (the event type)
+        :return:
+        """
 
-    async def connect(self, user_id: int, websocket: 'WebSocket') -> None:
+        for connection in self._active_connections.get(user_id, ()):
+            connection.put(event, key=key)
+
+    async def connect(self, user_id: int, websocket: 'WebSocket', last_event_id: str = None) -> None:
         """
         Accept websocket connection for specified user
 
         :param user_id: User identifier
         :param websocket: WebSocket connection
+        :param last_event_id: Identifier of the last event received before the reconnection
         :return:
         """
 
         await websocket.accept()
 
-        if user_id not in self._active_connections:
-            self._active_connections[user_id] = []
+        connection = OutboundConnection(
+            websocket=websocket,
+            user_id=user_id,
+            size=self._queue_size,
+            policy=self._policy,
+            send_timeout=self._send_timeout,
+        )
+
+        is_replay = last_event_id is not None and self._event_stream is not None
+
+        if is_replay:
+            connection.hold()
+
+        # The connection is registered before any await, so concurrent connects see the user channel is taken
+        connections = self._active_connections.setdefault(user_id, [])
+        connections.append(connection)
+
+        if len(connections) == 1:
+            try:
+                await self._multiplexer.subscribe(get_user_channel(user_id), self._on_event)
+
+                if self._presence is not None:
+                    await self._presence.connect(USER_PRESENCE_KIND, user_id)
+            except Exception:
+                await self._abort(user_id, connections)
+                raise
+
+        connection.start()
+
+        if is_replay:
+            connection.release(await self._read_missed_events(user_id, last_event_id))
+
+    async def _read_missed_events(self, user_id: int, last_event_id: str) -> list[EventEnvelope]:
+        """
+        Reads events missed by the reconnecting client from the stream
+
+        :param user_id: User identifier
+        :param last_event_id: Identifier of the last received event
+        :return: Events, the first one asks to reload the data if the events can't be replayed
+        """
+
+        try:
+            events, is_trimmed = await self._event_stream.read(get_user_channel(user_id), after=last_event_id)
+        except Exception as e:
+            logger.error(f'Can\'t read missed events: {user_id=}, {e}')
+            return [RESYNC_MESSAGE]
+
+        return [RESYNC_MESSAGE, *events] if is_trimmed else events
+
+    async def _abort(self, user_id: int, connections: list[OutboundConnection]) -> None:
+        """
+        Unregisters connections of the user whose channel could not be subscribed,
+        the ones which joined meanwhile are closed so their clients reconnect instead of missing events
+
+        :param user_id: User identifier
+        :param connections: Registered connections of the user
+        :return:
+        """
+
+        if self._active_connections.get(user_id) is connections:
+            del self._active_connections[user_id]
+
+        aborted, connections[:] = list(connections), []
+
+        for connection in aborted:
+            if connection.is_started:
+                connection.close()
+            else:
+                await connection.stop()
+
+        if user_id in self._active_connections:
+            return
 
-        self._active_connections[user_id].append(websocket)
+        try:
+            await self._multiplexer.unsubscribe(get_user_channel(user_id), self._on_event)
+        except Exception as e:
+            logger.error(f'Can\'t unsubscribe user channel: {user_id=}, {e}')
 
-    def disconnect(self, user_id: int, websocket: 'WebSocket') -> None:
+    async def disconnect(self, user_id: int, websocket: 'WebSocket') -> None:
         """
         Remove websocket connection for specified user
 
@@ -57,25 +213,69 @@ class ConnectionManager:
         """
 
         selected_identifier = None
-        is_connection_found = user_id in self._active_connections and websocket in self._active_connections[user_id]
+        selected_connection = None
 
-        if not is_connection_found:
-            for connection_user_id in self._active_connections.keys():
-                if websocket in self._active_connections[connection_user_id]:
-                    selected_identifier = connection_user_id
+        for connection_user_id in [user_id, *self._active_connections.keys()]:
+            for connection in self._active_connections.get(connection_user_id, ()):
+                if connection.websocket is websocket:
+                    selected_identifier, selected_connection = connection_user_id, connection
                     break
-        else:
-            selected_identifier = user_id
 
-        if not selected_identifier or not self._active_connections[selected_identifier]:
+            if selected_connection is not None:
+                break
+
+        if selected_connection is None:
             return
 
-        self._active_connections[selected_identifier].remove(websocket)
+        connections = self._active_connections[selected_identifier]
+        connections.remove(selected_connection)
+
+        await selected_connection.stop()
 
-        if len(self._active_connections[selected_identifier]) == 0:
+        if len(connections) == 0 and self._active_connections.get(selected_identifier) is connections:
             del self._active_connections[selected_identifier]
+            await self._multiplexer.unsubscribe(get_user_channel(selected_identifier), self._on_event)
+
+            if self._presence is not None:
+                await self._presence.disconnect(USER_PRESENCE_KIND, selected_identifier)
+
+    async def touch(self, user_id: int) -> None:
+        """
+        Handles the ping frame of the user connection
+
+        :param user_id: User identifier
+        :return:
+        """
+
+        if self._presence is not None:
+            await self._presence.touch(USER_PRESENCE_KIND, user_id)
+
+    async def _on_event(self, channel: str, event: EventEnvelope) -> None:
+        """
+        Delivers the event of the user channel to local connections
+
+        :param channel: Channel name
+        :param event: Received event
+        :return:
+        """
+
+        self.send(int(channel.removeprefix(USER_CHANNEL_PREFIX)), event, key=self._get_key(event))
+
+    def _get_key(self, event: EventEnvelope) -> str | None:
+        """
+        Returns the coalescing key of the event, events are keyed by their type only under the coalesce policy
+
+        :param event: Encoded event
+        :return: Coalescing key
+        """
+
+        return event.type if self._policy == SlowConsumerPolicy.COALESCE else None
 
 
 __all__ = (
+    'USER_CHANNEL_PREFIX',
+    'USER_PRESENCE_KIND',
+    'RESYNC_MESSAGE',
+    'get_user_channel',
     'ConnectionManager',
 )
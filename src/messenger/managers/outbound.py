@@ -0,0 +1,250 @@
+from starlette.websockets import WebSocketState
+
+from core.streams import EventEnvelope, parse_event_id
+
+from loguru import logger
+
+from collections import deque
+from enum import Enum
+from typing import TYPE_CHECKING
+
+import asyncio, time
+
+if TYPE_CHECKING:
+    from fastapi import WebSocket
+
+
+class SlowConsumerPolicy(str, Enum):
+    """ What to do with the new message when the outbound queue of the socket is full """
+
+    DROP_OLDEST = 'drop_oldest'
+    COALESCE = 'coalesce'
+    DISCONNECT = 'disconnect'
+
+
+class OutboundConnection:
+    """ WebSocket connection with the bounded outbound queue drained by its own writer """
+
+    websocket: 'WebSocket'
+    user_id: int
+
+    _size: int
+    _policy: SlowConsumerPolicy
+    _send_timeout: float
+    _queue: deque[tuple[str | None, EventEnvelope, float]]
+    _ready: asyncio.Event
+    _counters: dict[str, int | float]
+    _held: list[tuple[str | None, EventEnvelope]] | None = None
+    _writer: asyncio.Task | None = None
+    _closer: asyncio.Task | None = None
+    _is_closed: bool = False
+
+    def __init__(
+        self,
+        websocket: 'WebSocket',
+        user_id: int,
+        size: int = 64,
+        policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST,
+        send_timeout: float = 10,
+    ) -> None:
+        """
+        Putting the message never waits for the client, so a slow socket
+        delays only its own messages
+
+        :param websocket: Accepted websocket connection
+        :param user_id: User identifier
+        :param size: Maximum number of messages waiting for the client
+        :param policy: What to do when the queue is full
+        :param send_timeout: Maximum time of the single send, the connection is closed after it (in seconds)
+        """
+
+        self.websocket = websocket
+        self.user_id = user_id
+
+        self._size = size
+        self._policy = SlowConsumerPolicy(policy)
+        self._send_timeout = send_timeout
+        self._queue = deque()
+        self._ready = asyncio.Event()
+        self._counters = {
+            'sent': 0,
+            'dropped': 0,
+            'coalesced': 0,
+            'queue_time_max': 0,
+            'send_time_total': 0,
+            'send_time_max': 0,
+        }
+
+    @property
+    def is_closed(self) -> bool:
+        return self._is_closed
+
+    @property
+    def is_started(self) -> bool:
+        return self._writer is not None
+
+    @property
+    def stats(self) -> dict[str, int | float]:
+        sent = self._counters['sent']
+
+        return {
+            **self._counters,
+            'queued': len(self._queue),
+            'send_time_avg': self._counters['send_time_total'] / sent if sent else 0,
+        }
+
+    def start(self) -> None:
+        """ Starts the writer """
+
+        self._writer = asyncio.create_task(self._write())
+
+    async def stop(self) -> None:
+        """ Stops the writer and drops unsent messages """
+
+        self._is_closed = True
+
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+
+        self._writer = None
+        self._queue.clear()
+
+    def close(self) -> None:
+        """ Closes the websocket in the background, the view gets the disconnect """
+
+        self._schedule_close()
+
+    def put(self, event: EventEnvelope, key: str = None) -> bool:
+        """
+        Queues the event for sending, the envelope is shared with other sockets and never re-encoded
+
+        :param event: Encoded event
+        :param key: Messages with the same key replace each other under the coalesce policy
+        :return: Whether the message was queued
+        """
+
+        if self._is_closed:
+            return False
+
+        if self._held is not None:
+            self._held.append((key, event))
+            return True
+
+        if len(self._queue) >= self._size and not self._make_room(key):
+            return False
+
+        self._queue.append((key, event, time.monotonic()))
+        self._ready.set()
+
+        return True
+
+    def hold(self) -> None:
+        """ Keeps live messages aside while missed events are replayed """
+
+        self._held = []
+
+    def release(self, events: list[EventEnvelope]) -> None:
+        """
+        Queues replayed events followed by live messages which were not among them
+
+        :param events: Replayed events in the order of their identifiers
+        :return:
+        """
+
+        held, self._held = self._held or [], None
+        last_event_id = events[-1].event_id if events else None
+
+        for event in events:
+            self.put(event)
+
+        for key, event in held:
+            event_id = event.event_id
+
+            if last_event_id and event_id and parse_event_id(event_id) <= parse_event_id(last_event_id):
+                continue
+
+            self.put(event, key=key)
+
+    def _make_room(self, key: str | None) -> bool:
+        """
+        Applies the slow consumer policy to the full queue
+
+        :param key: Key of the new message
+        :return: Whether the new message can be queued
+        """
+
+        if self._policy == SlowConsumerPolicy.DISCONNECT:
+            logger.warning(f'Closing slow websocket consumer: {self.user_id=}, {self.stats=}')
+            self._schedule_close()
+            return False
+
+        if self._policy == SlowConsumerPolicy.COALESCE and key is not None:
+            for index, (queued_key, _, _) in enumerate(self._queue):
+                if queued_key == key:
+                    del self._queue[index]
+                    self._counters['coalesced'] += 1
+                    return True
+
+        self._queue.popleft()
+        self._counters['dropped'] += 1
+
+        return True
+
+    def _schedule_close(self) -> None:
+        if self._closer is None:
+            self._is_closed = True
+            self._closer = asyncio.create_task(self._close())
+
+    async def _close(self, code: int = 1013) -> None:
+        """
+        Closes the websocket, the view gets the disconnect and unregisters the connection
+
+        :param code: Close code (1013 asks the client to reconnect later)
+        :return:
+        """
+
+        await self.stop()
+
+        if self.websocket.application_state == WebSocketState.CONNECTED:
+            try:
+                await self.websocket.close(code=code)
+            except Exception as e:
+                logger.warning(f'Can\'t close websocket: {self.user_id=}, {e}')
+
+    async def _write(self) -> None:
+        """ Sends queued messages until the connection is closed """
+
+        while not self._is_closed:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            _, event, queued_at = self._queue.popleft()
+            started_at = time.monotonic()
+
+            try:
+                await asyncio.wait_for(self.websocket.send_text(event.text), timeout=self._send_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f'Websocket send timed out: {self.user_id=}')
+                self._schedule_close()
+                return
+            except Exception as e:
+                # The socket is most likely gone, the rest of the queue would fail the same way
+                logger.warning(f'Can\'t send websocket message, closing: {self.user_id=}, {e}')
+                self._schedule_close()
+                return
+
+            send_time = time.monotonic() - started_at
+
+            self._counters['sent'] += 1
+            self._counters['queue_time_max'] = max(self._counters['queue_time_max'], started_at - queued_at)
+            self._counters['send_time_total'] += send_time
+            self._counters['send_time_max'] = max(self._counters['send_time_max'], send_time)
+
+
+__all__ = (
+    'SlowConsumerPolicy',
+    'OutboundConnection',
+)
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Text, Enum as SqlEnum
+from sqlalchemy import ForeignKey, Index, UniqueConstraint, DateTime, Text, Enum as SqlEnum, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from core.db.base import BaseModel, TimestampMixin
@@ -9,6 +9,7 @@ from media.models import Media
 
 from .types import Role
 
+from datetime import datetime
 from typing import TYPE_CHECKING
 
 
@@ -19,6 +20,18 @@ class Message(BaseModel, TimestampMixin):
     """
 
     __tablename__ = 'messages'
+    __table_args__ = (
+        Index('ix_messages_user_id_avatar_id_id', 'user_id', 'avatar_id', 'id'),
+        Index('ix_messages_user_id_avatar_id_created_at', 'user_id', 'avatar_id', 'created_at'),
+        Index('ix_messages_unread', 'user_id', 'avatar_id', postgresql_where=text('unread_mark = true')),
+        Index(
+            'ix_messages_photo',
+            'user_id',
+            'avatar_id',
+            'created_at',
+            postgresql_where=text('photo_id IS NOT NULL'),
+        ),
+    )
 
     if TYPE_CHECKING:
         role: Role
@@ -63,6 +76,10 @@ class AssistantMessage(BaseModel, TimestampMixin):
     """ A message model describing the communication between the user and the dating assistant """
 
     __tablename__ = 'assistant_messages'
+    __table_args__ = (
+        Index('ix_assistant_messages_user_id_id', 'user_id', 'id'),
+        Index('ix_assistant_messages_user_id_created_at', 'user_id', 'created_at'),
+    )
 
     if TYPE_CHECKING:
         role: Role
@@ -83,7 +100,51 @@ class AssistantMessage(BaseModel, TimestampMixin):
         # The text sent in this message
 
 
+class Dialog(BaseModel):
+    """
+    Summary of the dialog between the user and the avatar,
+    maintained in the same transaction as the messages of the dialog
+    """
+
+    __tablename__ = 'dialogs'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'avatar_id', name='uq_dialogs_user_id_avatar_id'),
+        Index('ix_dialogs_user_id_last_message_id', 'user_id', 'last_message_id'),
+    )
+
+    if TYPE_CHECKING:
+        user_id: int
+        avatar_id: int
+        avatar: Avatar
+        last_message_id: int
+        last_message: Message
+        last_activity_at: datetime
+        unread_count: int
+    else:
+        user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
+        # The ID of the user of the dialog
+
+        avatar_id: Mapped[int] = mapped_column(ForeignKey('avatars.id'))
+        # The ID of the avatar of the dialog
+
+        avatar: Mapped[Avatar] = relationship(Avatar)
+        # The avatar of the dialog
+
+        last_message_id: Mapped[int] = mapped_column(ForeignKey('messages.id'))
+        # The ID of the last message in the dialog
+
+        last_message: Mapped[Message] = relationship(Message)
+        # The last message in the dialog
+
+        last_activity_at: Mapped[datetime] = mapped_column(DateTime)
+        # Date of the last message in the dialog
+
+        unread_count: Mapped[int] = mapped_column(default=0, server_default='0')
+        # The number of unread messages in the dialog
+
+
 __all__ = (
     'Message',
     'AssistantMessage',
+    'Dialog',
 )
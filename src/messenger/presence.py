@@ -0,0 +1,74 @@
+from core.presence import get_presence_service
+from core.settings import get_application_settings
+
+from typing import Iterable
+
+
+AVATAR_PRESENCE_KIND = 'avatar'
+
+
+def get_avatar_presence_id(user_id: int, avatar_id: int) -> str:
+    """
+    Returns the presence identifier of the avatar, the avatar is online for the specific user
+
+    :param user_id: User identifier
+    :param avatar_id: Avatar identifier
+    :return: Presence identifier
+    """
+
+    return f'{user_id}:{avatar_id}'
+
+
+async def set_avatar_presence(user_id: int, avatar_id: int) -> None:
+    """
+    Marks the avatar which has just replied to the user as online for a while
+
+    :param user_id: User identifier
+    :param avatar_id: Avatar identifier
+    :return:
+    """
+
+    settings = get_application_settings()
+
+    if not settings.PRESENCE_ENABLED:
+        return
+
+    presence_service = get_presence_service()
+
+    await presence_service.set_online(
+        AVATAR_PRESENCE_KIND,
+        get_avatar_presence_id(user_id, avatar_id),
+        ttl=settings.PRESENCE_AVATAR_TTL,
+    )
+
+
+async def get_avatars_presence(user_id: int, avatar_ids: Iterable[int]) -> dict[int, bool]:
+    """
+    Reads the online state of the user avatars with one request
+
+    :param user_id: User identifier
+    :param avatar_ids: Avatar identifiers
+    :return: Online state by avatar identifier
+    """
+
+    settings = get_application_settings()
+    avatar_ids = list(avatar_ids)
+
+    if not settings.PRESENCE_ENABLED:
+        return {x: False for x in avatar_ids}
+
+    presence_service = get_presence_service()
+    presence = await presence_service.get_presence(
+        AVATAR_PRESENCE_KIND,
+        [get_avatar_presence_id(user_id, x) for x in avatar_ids],
+    )
+
+    return {x: presence.get(get_avatar_presence_id(user_id, x), False) for x in avatar_ids}
+
+
+__all__ = (
+    'AVATAR_PRESENCE_KIND',
+    'get_avatar_presence_id',
+    'set_avatar_presence',
+    'get_avatars_presence',
+)
@@ -0,0 +1,150 @@
+from core.quotas import get_quota_counters
+
+from .crud import (
+    get_messages_count_with_photo,
+    get_assistant_messages_from_user,
+    get_dialog_messages_count_from_participant,
+)
+
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from users.models import User
+    from avatars.models import Avatar
+
+
+DAILY_PHOTOS_QUOTA = 'photos'
+MESSAGES_QUOTA = 'messages'
+ASSISTANT_MESSAGES_QUOTA = 'assistant_messages'
+
+
+def get_user_day(user: 'User') -> tuple[datetime, datetime]:
+    """
+    Returns bounds of the current day in the user timezone
+
+    :param user: User model object
+    :return: Start and end of the day (naive UTC)
+    """
+
+    tz = timezone(timedelta(hours=user.timezone))
+
+    from_date = datetime.now(tz).replace(hour=0, minute=0, second=0, microsecond=0) \
+        .astimezone(timezone.utc).replace(tzinfo=None)
+
+    return from_date, from_date + timedelta(days=1)
+
+
+def _get_daily_photos_key(user: 'User', avatar: 'Avatar') -> tuple[str, datetime, datetime]:
+    from_date, to_date = get_user_day(user)
+    key = get_quota_counters().get_key(DAILY_PHOTOS_QUOTA, user.id, avatar.id, from_date.strftime('%Y%m%d%H%M'))
+
+    return key, from_date, to_date
+
+
+async def get_daily_photos_count(user: 'User', avatar: 'Avatar', session: 'AsyncSession' = None) -> int:
+    """
+    Returns the number of photos sent by the avatar to the user today, the counter expires at the user midnight
+
+    :param user: User model object
+    :param avatar: Avatar model object
+    :param session: Database session
+    :return: Count of the messages with photo
+    """
+
+    key, from_date, to_date = _get_daily_photos_key(user, avatar)
+
+    return await get_quota_counters().get(
+        key,
+        lambda: get_messages_count_with_photo(user, avatar, from_date=from_date, to_date=to_date, session=session),
+        expire_at=to_date,
+    )
+
+
+async def count_daily_photo(user: 'User', avatar: 'Avatar') -> None:
+    """
+    Counts the photo which has just been sent by the avatar
+
+    :param user: User model object
+    :param avatar: Avatar model object
+    :return:
+    """
+
+    key, _, _ = _get_daily_photos_key(user, avatar)
+
+    await get_quota_counters().increment(key)
+
+
+async def get_messages_count(user: 'User', avatar: 'Avatar', session: 'AsyncSession' = None) -> int:
+    """
+    Returns the number of messages sent by the user to the avatar
+
+    :param user: User model object
+    :param avatar: Avatar model object
+    :param session: Database session
+    :return: Count of messages
+    """
+
+    quota_counters = get_quota_counters()
+
+    return await quota_counters.get(
+        quota_counters.get_key(MESSAGES_QUOTA, user.id, avatar.id),
+        lambda: get_dialog_messages_count_from_participant(user, avatar, from_participant=user, session=session),
+    )
+
+
+async def count_message(user: 'User', avatar: 'Avatar') -> None:
+    """
+    Counts the message which has just been sent by the user to the avatar
+
+    :param user: User model object
+    :param avatar: Avatar model object
+    :return:
+    """
+
+    quota_counters = get_quota_counters()
+
+    await quota_counters.increment(quota_counters.get_key(MESSAGES_QUOTA, user.id, avatar.id))
+
+
+async def get_assistant_messages_count(user: 'User', session: 'AsyncSession' = None) -> int:
+    """
+    Returns the number of messages sent by the user to the dating assistant
+
+    :param user: User model object
+    :param session: Database session
+    :return: Count of messages
+    """
+
+    quota_counters = get_quota_counters()
+
+    return await quota_counters.get(
+        quota_counters.get_key(ASSISTANT_MESSAGES_QUOTA, user.id),
+        lambda: get_assistant_messages_from_user(user=user, session=session),
+    )
+
+
+async def count_assistant_message(user: 'User') -> None:
+    """
+    Counts the message which has just been sent by the user to the dating assistant
+
+    :param user: User model object
+    :return:
+    """
+
+    quota_counters = get_quota_counters()
+
+    await quota_counters.increment(quota_counters.get_key(ASSISTANT_MESSAGES_QUOTA, user.id))
+
+
+__all__ = (
+    'get_user_day',
+    'get_daily_photos_count',
+    'count_daily_photo',
+    'get_messages_count',
+    'count_message',
+    'get_assistant_messages_count',
+    'count_assistant_message',
+)
@@ -1,12 +1,11 @@
 from core.db import get_session
-from core.broadcaster import get_broadcast
+from core.streams import EventEnvelope, publish_event
 
 from ai.types import Prompt
 from ai.services import send_prompt, get_intent_classifier
 
 from users.models import User
 from users.schemas import UserAnswer
-from users.dependencies import subscribed_user
 from users.exceptions import UnsubscribedError
 
 from avatars.services import set_avatar_online, get_random_farewell_message, get_random_photo_message
@@ -19,17 +18,23 @@ from .crud import (
     get_assistant_messages,
     send_message_to_assistant as _send_message_to_assistant,
     get_dialog_messages_count,
-    get_messages_count_with_photo,
-    get_assistant_messages_from_user,
     get_last_message_with_media_in_dialog,
-    get_dialog_messages_count_from_participant,
 )
 
 from .types import Role, MessageSchema, ChatSchema, WSMessageSchema, WSTypingSchema
+from .presence import set_avatar_presence
+from .subscriptions import is_user_subscribed
+from .quotas import (
+    get_daily_photos_count,
+    count_daily_photo,
+    get_messages_count,
+    count_message,
+    get_assistant_messages_count,
+    count_assistant_message,
+)
 from .exceptions import OpenAIError
 
 from functools import lru_cache
-from datetime import datetime, timedelta, timezone
 from typing import Union, TYPE_CHECKING
 
 import asyncio
@@ -58,33 +63,25 @@ async def process_avatar_message(
     :return:
     """
 
-    broadcast = get_broadcast()
-
-    await broadcast.publish(
+    await publish_event(
         channel=f'user_{user.id}',
-        message=WSMessageSchema(
-            type='typing',
-            content=WSTypingSchema(
-                avatar_id=avatar.id,
+        event=EventEnvelope.from_schema(
+            WSMessageSchema(
+                type='typing',
+                content=WSTypingSchema(
+                    avatar_id=avatar.id,
+                ),
             ),
-        ).model_dump_json(),
+        ),
+        is_durable=False,
+        coalesce_key=f'typing:{avatar.id}',
     )
 
     session, is_new_session = get_session(session)
 
-    tz = timezone(timedelta(hours=user.timezone))
-
-    from_date = datetime.now(tz).replace(hour=0, minute=0, second=0, microsecond=0) \
-        .astimezone(timezone.utc).replace(tzinfo=None)
-    to_date = from_date + timedelta(days=1)
     limit_daily_image = False
 
-    messages_with_photo_count = await get_messages_count_with_photo(
-        user,
-        avatar,
-        from_date=from_date,
-        to_date=to_date,
-    )
+    messages_with_photo_count = await get_daily_photos_count(user, avatar, session=session)
 
     if messages_with_photo_count < 4:
         intent_classifier = get_intent_classifier()
@@ -119,12 +116,14 @@ async def process_avatar_message(
                     ),
                 )
 
-                await broadcast.publish(
+                await publish_event(
                     channel=f'user_{user.id}',
-                    message=WSMessageSchema(
-                        type='message',
-                        content=sent_message_schema,
-                    ).model_dump_json(),
+                    event=EventEnvelope.from_schema(
+                        WSMessageSchema(
+                            type='message',
+                            content=sent_message_schema,
+                        ),
+                    ),
                 )
 
             await asyncio.sleep(3)
@@ -150,6 +149,8 @@ async def process_avatar_message(
                 photo_to_send = avatar.message_photo[0]
 
             message = await send_message(sender=avatar, recipient=user, photo_id=photo_to_send.id, session=session)
+
+            await count_daily_photo(user, avatar)
         else:
             system_prompt = _get_system_prompt_by_avatar(avatar=avatar)
             previous_messages = (await get_dialog_messages(user, avatar, limit=5, session=session))[::-1]
@@ -182,6 +183,7 @@ async def process_avatar_message(
             limit_daily_image = True
 
     await set_avatar_online(user=user, avatar=avatar, session=session)
+    await set_avatar_presence(user.id, avatar.id)
 
     if is_new_session:
         await session.close()
@@ -207,12 +209,14 @@ async def process_avatar_message(
         ),
     )
 
-    await broadcast.publish(
+    await publish_event(
         channel=f'user_{user.id}',
-        message=WSMessageSchema(
-            type='message',
-            content=schema,
-        ).model_dump_json(),
+        event=EventEnvelope.from_schema(
+            WSMessageSchema(
+                type='message',
+                content=schema,
+            ),
+        ),
     )
 
 
@@ -234,26 +238,16 @@ async def send_message_to_avatar(
 
     session, is_new_session = get_session(session)
 
-    try:
-        await subscribed_user(user=user, session=session)
-
-        is_user_subscribed = True
-    except UnsubscribedError:
-        is_user_subscribed = False
+    if not await is_user_subscribed(user):
+        messages_count = await get_messages_count(user, avatar, session=session)
 
-    if not is_user_subscribed:
-        messages_count = await get_dialog_messages_count_from_participant(
-            user,
-            avatar,
-            from_participant=user,
-            session=session,
-        )
-
-        if messages_count >= 15:
+        if messages_count >= 15 and not await is_user_subscribed(user, is_revalidated=True):
             raise UnsubscribedError()
 
     message = await send_message(sender=user, recipient=avatar, text=text, unread_mark=False, session=session)
 
+    await count_message(user, avatar)
+
     if is_new_session:
         await session.close()
 
@@ -291,20 +285,14 @@ async def send_message_to_assistant(
 
     session, is_new_session = get_session(session=session)
 
-    try:
-        await subscribed_user(user=user, session=session)
+    if not await is_user_subscribed(user):
+        messages_count = await get_assistant_messages_count(user, session=session)
 
-        is_user_subscribed = True
-    except UnsubscribedError:
-        is_user_subscribed = False
-
-    if not is_user_subscribed:
-        messages_count = await get_assistant_messages_from_user(user=user, session=session)
-
-        if messages_count >= 10:
+        if messages_count >= 10 and not await is_user_subscribed(user, is_revalidated=True):
             raise UnsubscribedError()
 
     await _send_message_to_assistant(user=user, text=text, session=session)
+    await count_assistant_message(user)
 
     system_prompt = _get_assistant_system_prompts()
     previous_messages = (await get_assistant_messages(user=user, limit=5, session=session))[::-1]
@@ -334,14 +322,18 @@ async def get_messages(
     *participants: Union['User', 'Avatar'],
     offset: int = None,
     limit: int = None,
+    before: int = None,
+    after: int = None,
     session: 'AsyncSession' = None,
 ) -> list[MessageSchema]:
     """
-    Returns a list of all messages between two interlocutors
+    Returns a list of messages between two interlocutors, the newest first
 
     :param participants: Interlocutors (user and avatar)
-    :param offset: The number of messages that must be skipped to receive the following
+    :param offset: The number of messages that must be skipped to receive the following (deprecated)
     :param limit: The maximum number of messages to receive
+    :param before: Identifier of the message, only older messages are returned
+    :param after: Identifier of the message, only the nearest newer messages are returned
     :param session: Database session
     :return: List of the received messages
     """
@@ -357,7 +349,14 @@ async def get_messages(
         for hello_message in avatar.hello_messages:
             await send_message(sender=avatar, recipient=user, text=hello_message.text, session=session)
 
-    messages = await get_dialog_messages(*participants, offset=offset, limit=limit, session=session)
+    messages = await get_dialog_messages(
+        *participants,
+        offset=offset,
+        limit=limit,
+        before=before,
+        after=after,
+        session=session,
+    )
 
     if is_new_session:
         await session.close()
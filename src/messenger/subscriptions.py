@@ -0,0 +1,75 @@
+from core.db import get_session
+from core.entitlements import get_entitlement_cache
+
+from users.dependencies import subscribed_user
+from users.exceptions import UnsubscribedError
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from users.models import User
+
+
+SUBSCRIPTION_ENTITLEMENT = 'subscription'
+
+
+async def _load_subscription(user: 'User') -> bool:
+    """
+    Asks the subscription check of the users module, the load may outlive the request so it has its own session
+
+    :param user: User model object
+    :return: Whether the user is subscribed
+    """
+
+    session, is_new_session = get_session()
+
+    try:
+        await subscribed_user(user=user, session=session)
+
+        return True
+    except UnsubscribedError:
+        return False
+    finally:
+        if is_new_session:
+            await session.close()
+
+
+async def is_user_subscribed(user: 'User', is_revalidated: bool = False) -> bool:
+    """
+    Returns the cached subscription status of the user, nothing invalidates it in this application yet,
+    so the ended subscription is granted for up to ENTITLEMENT_TTL plus the one request which starts the refresh
+    (after ENTITLEMENT_STALE_TTL the status is loaded before answering)
+
+    :param user: User model object
+    :param is_revalidated: Whether the status must be asked again, used before refusing the user
+    :return: Whether the user is subscribed
+    """
+
+    entitlement_cache = get_entitlement_cache()
+
+    return await entitlement_cache.get(
+        SUBSCRIPTION_ENTITLEMENT,
+        user.id,
+        lambda: _load_subscription(user),
+        is_revalidated=is_revalidated,
+    )
+
+
+async def invalidate_user_subscription(user_id: int) -> None:
+    """
+    Drops the cached subscription status, the handlers of subscription changes (purchase, refund, expiration)
+    call it to apply the change at once instead of after ENTITLEMENT_TTL
+
+    :param user_id: User identifier
+    :return:
+    """
+
+    entitlement_cache = get_entitlement_cache()
+    await entitlement_cache.invalidate(SUBSCRIPTION_ENTITLEMENT, user_id)
+
+
+__all__ = (
+    'SUBSCRIPTION_ENTITLEMENT',
+    'is_user_subscribed',
+    'invalidate_user_subscription',
+)
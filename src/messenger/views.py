@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Query, Depends, Body, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Query, Depends, Body, Response, WebSocket, WebSocketDisconnect
 
 from core.schemas import StatusSchema
-from core.broadcaster import get_broadcast
+from core.streams import is_event_id
+from core.pagination import decode_cursor, set_cursor_headers
 
 from users.dependencies import current_user, ws_current_user
 
 from avatars.dependencies import validate_avatar_id
 
+from .managers import get_connection_manager
 from .types import DialogSchema, MessageSchema, AssistantMessageSchema
 from .crud import get_dialog_list, read_dialog_messages, get_assistant_messages
 from .services import send_message_to_avatar, get_messages, send_message_to_assistant
@@ -43,19 +45,26 @@ async def dialogs_list_view(
 async def messenger_websocket(
     websocket: WebSocket,
     user: 'User' = Depends(ws_current_user),
+    last_event_id: str | None = Query(default=None),
 ) -> None:
     """ A websocket for exchanging information about user actions with dialogs """
 
-    await websocket.accept()
+    last_event_id = last_event_id or websocket.headers.get('last-event-id')
 
-    broadcast = get_broadcast()
+    if last_event_id is not None and not is_event_id(last_event_id):
+        last_event_id = None
+
+    manager = get_connection_manager()
+    await manager.connect(user.id, websocket, last_event_id=last_event_id)
 
     try:
-        async with broadcast.subscribe(channel=f'user_{user.id}') as subscriber:
-            async for event in subscriber:
-                await websocket.send_text(event.message)
+        while True:
+            await websocket.receive_text()
+            await manager.touch(user.id)
     except WebSocketDisconnect:
         return
+    finally:
+        await manager.disconnect(user.id, websocket)
 
 
 @router.post('/assistant/send', response_model=AssistantMessageSchema)
@@ -73,25 +82,58 @@ async def send_assistant_message_view(
 
 @router.get('/assistant', response_model=list[AssistantMessageSchema])
 async def assistant_messages_list_view(
+    response: Response,
     user: 'User' = Depends(current_user),
-    offset: int = Query(ge=0, default=0),
+    before: str | None = Query(default=None),
+    after: str | None = Query(default=None),
+    offset: int | None = Query(ge=0, default=None, deprecated=True),
     limit: int = Query(ge=1, le=100, default=20),
 ) -> list['AssistantMessage']:
-    """ An API method for getting a list of messages for specified dialog """
+    """
+    An API method for getting a list of messages for specified dialog,
+    the cursors of the older and the newer pages are returned in X-Cursor-Before and X-Cursor-After headers
+    """
+
+    messages = await get_assistant_messages(
+        user=user,
+        offset=offset,
+        limit=limit,
+        before=decode_cursor(before),
+        after=decode_cursor(after),
+    )
 
-    return await get_assistant_messages(user=user, offset=offset, limit=limit)
+    set_cursor_headers(response, [x.id for x in messages])
+
+    return messages
 
 
 @router.get('/{recipient_id}', response_model=list[MessageSchema])
 async def messages_list_view(
+    response: Response,
     avatar: 'Avatar' = Depends(validate_avatar_id),
     user: 'User' = Depends(current_user),
-    offset: int = Query(ge=0, default=0),
+    before: str | None = Query(default=None),
+    after: str | None = Query(default=None),
+    offset: int | None = Query(ge=0, default=None, deprecated=True),
     limit: int = Query(ge=1, le=100, default=20),
 ) -> list[MessageSchema]:
-    """ An API method for getting a list of messages for specified dialog """
+    """
+    An API method for getting a list of messages for specified dialog,
+    the cursors of the older and the newer pages are returned in X-Cursor-Before and X-Cursor-After headers
+    """
+
+    messages = await get_messages(
+        avatar,
+        user,
+        offset=offset,
+        limit=limit,
+        before=decode_cursor(before),
+        after=decode_cursor(after),
+    )
+
+    set_cursor_headers(response, [x.id for x in messages])
 
-    return await get_messages(avatar, user, offset=offset, limit=limit)
+    return messages
 
 
 @router.post(path='/{recipient_id}/send', response_model=MessageSchema)
@@ -4,6 +4,7 @@ from media.views import router as media_router
 from users.views import router as users_router
 from avatars.views import router as avatars_router
 from messenger.views import router as messenger_router
+from generation.views import router as generation_router
 
 
 router = APIRouter(prefix='/v1')
@@ -11,6 +12,7 @@ router.include_router(media_router, tags=['media'], prefix='/media')
 router.include_router(users_router, tags=['users'], prefix='/users')
 router.include_router(avatars_router, tags=['avatars'], prefix='/avatars')
 router.include_router(messenger_router, tags=['messenger'], prefix='/messages')
+router.include_router(generation_router, tags=['generation'], prefix='/generation')
 
 
 __all__ = (
@@ -0,0 +1,52 @@
+from core.kafka.admission import AdmissionController
+from core.kafka.dispatcher import ResultDispatcher
+from core.kafka.exceptions import QueueThrottled
+
+import pytest
+
+import asyncio
+
+
+def test_waiting_for_results_throttles_new_tasks() -> None:
+    """ Tasks sent without is_awaited are counted while get_generated_images() etc. wait for them """
+
+    async def run() -> None:
+        dispatcher = ResultDispatcher(consumer=None)
+        admission_controller = AdmissionController(dispatcher=dispatcher, consumer=None, topic='tasks', max_in_flight=2)
+
+        admission_controller.check(is_awaited=False)
+        waiters = [asyncio.create_task(dispatcher.wait(x, timeout=10)) for x in (1, 2)]
+        await asyncio.sleep(0)
+
+        assert dispatcher.in_flight == 2
+
+        with pytest.raises(QueueThrottled) as error:
+            admission_controller.check(is_awaited=False)
+
+        assert error.value.status_code == 429
+        assert admission_controller.stats['throttled'] == 1
+
+        dispatcher.discard(1)
+        await asyncio.gather(*waiters[:1])
+
+        admission_controller.check(is_awaited=False)
+
+        dispatcher.discard(2)
+        await asyncio.gather(*waiters[1:])
+
+        assert dispatcher.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_bulk_of_not_awaited_tasks_needs_room_for_one() -> None:
+    async def run() -> None:
+        dispatcher = ResultDispatcher(consumer=None)
+        admission_controller = AdmissionController(dispatcher=dispatcher, consumer=None, topic='tasks', max_in_flight=2)
+
+        admission_controller.check(1000, is_awaited=False)
+
+        with pytest.raises(QueueThrottled):
+            admission_controller.check(3, is_awaited=True)
+
+    asyncio.run(run())
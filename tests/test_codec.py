@@ -0,0 +1,49 @@
+from core.kafka.codec import BINARY_CONTENT_TYPE, build_headers, encode, decode, peek_task_id
+from core.kafka.schemas import ImageTask, ImageResult
+
+import pytest
+
+
+TASK = ImageTask(id=42, model='sdxl', prompt='портрет', gender='female', age='adult', images_count=2)
+
+RESULT = ImageResult(
+    **TASK.model_dump(),
+    info={'attempt': 2, 'last_attempt_error': 'CUDA out of memory'},
+    images=['https://cdn/1.png', 'https://cdn/2.png'],
+    status='success',
+    message='',
+)
+
+
+@pytest.mark.parametrize('wire_format', ['json', 'binary'])
+@pytest.mark.parametrize('schema, value', [(ImageTask, TASK), (ImageResult, RESULT)])
+def test_round_trip(wire_format: str, schema: type, value: ImageTask) -> None:
+    headers = list(build_headers(value, wire_format).items())
+    encoded = encode(value, wire_format)
+
+    assert decode(encoded, [(k, v.encode('utf-8')) for k, v in headers], schema) == value
+    assert decode(encoded, None, schema) == value
+
+
+def test_peek_task_id() -> None:
+    encoded = encode(TASK, 'binary')
+
+    assert peek_task_id(encoded, [('task-id', b'7')]) == 7
+    assert peek_task_id(encoded, [('content-type', BINARY_CONTENT_TYPE.encode('utf-8'))]) == 42
+    assert peek_task_id(encoded, None) == 42
+    assert peek_task_id(encode(TASK, 'json'), None) is None
+
+
+def test_binary_task_is_not_a_result() -> None:
+    with pytest.raises(ValueError):
+        decode(encode(TASK, 'binary'), None, ImageResult)
+
+
+@pytest.mark.parametrize('update, field', [
+    ({'images_count': -1}, 'images_count'),
+    ({'images_count': 2 ** 32}, 'images_count'),
+    ({'id': 2 ** 63}, 'id'),
+])
+def test_out_of_range_number_is_rejected(update: dict, field: str) -> None:
+    with pytest.raises(ValueError, match=field):
+        encode(TASK.model_copy(update=update), 'binary')
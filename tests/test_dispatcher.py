@@ -0,0 +1,104 @@
+from core.kafka.codec import build_headers, encode
+from core.kafka.dispatcher import ResultDispatcher
+from core.kafka.memory import MemoryMessage
+from core.kafka.schemas import ImageResult
+
+import asyncio
+
+
+def make_message(images: list[str], status: str, attempt: int = 1) -> MemoryMessage:
+    result = ImageResult(
+        id=1,
+        model='sdxl',
+        prompt='portrait',
+        gender='female',
+        age='adult',
+        images_count=4,
+        info={'attempt': attempt, 'last_attempt_error': ''},
+        images=images,
+        status=status,
+        message='',
+    )
+    headers = [(k, v.encode('utf-8')) for k, v in build_headers(result, 'binary').items()]
+
+    return MemoryMessage('results', 0, 0, None, encode(result, 'binary'), headers)
+
+
+class RetryScheduler:
+    """ Retries every failed attempt at once """
+
+    def __init__(self) -> None:
+        self.retried = 0
+        self.recovered = 0
+
+    async def retry(self, result: ImageResult, attempt: int, deadline: float) -> bool:
+        self.retried += 1
+        return True
+
+    def record_recovered(self) -> None:
+        self.recovered += 1
+
+
+def test_retried_attempt_yields_only_missing_images() -> None:
+    async def run() -> list[ImageResult]:
+        retry_scheduler = RetryScheduler()
+        dispatcher = ResultDispatcher(consumer=None, retry_scheduler=retry_scheduler)
+        stream = dispatcher.stream(1, timeout=10)
+        results = []
+
+        messages = [
+            make_message(['a1'], 'partial'),
+            make_message(['b1'], 'partial'),
+            make_message([], 'error'),
+            make_message(['a2'], 'partial', attempt=2),
+            make_message(['b2'], 'partial', attempt=2),
+            make_message(['c2'], 'partial', attempt=2),
+            make_message(['a2', 'b2', 'c2', 'd2'], 'success', attempt=2),
+        ]
+
+        async def feed() -> None:
+            await asyncio.sleep(0)
+
+            for message in messages:
+                dispatcher._dispatch(message)
+
+        feeder = asyncio.create_task(feed())
+
+        async for result in stream:
+            results.append(result)
+
+        await feeder
+
+        assert retry_scheduler.retried == 1
+        assert retry_scheduler.recovered == 1
+        assert dispatcher.in_flight == 0
+
+        return results
+
+    results = asyncio.run(run())
+
+    assert [(x.status, x.images) for x in results] == [
+        ('partial', ['a1']),
+        ('partial', ['b1']),
+        ('partial', ['c2']),
+        ('success', ['a1', 'b1', 'c2', 'd2']),
+    ]
+
+
+def test_result_without_waiter_is_skipped() -> None:
+    async def run() -> None:
+        dispatcher = ResultDispatcher(consumer=None)
+        dispatcher._dispatch(make_message(['a1'], 'success'))
+
+        assert dispatcher.completed == 0
+
+        waiter = asyncio.create_task(dispatcher.wait(1, timeout=10))
+        await asyncio.sleep(0)
+
+        dispatcher._dispatch(make_message(['a1'], 'success'))
+        result = await waiter
+
+        assert result.images == ['a1']
+        assert dispatcher.completed == 1
+
+    asyncio.run(run())
@@ -0,0 +1,72 @@
+from core.kafka.memory import MemoryBroker, MemoryProducer, MemoryConsumer
+from core.kafka.routing import get_partition
+
+import pytest
+
+
+def test_key_selects_partition_and_delivery_is_reported() -> None:
+    broker = MemoryBroker(partitions=4)
+    producer = MemoryProducer(broker)
+    reports = []
+
+    producer.produce('tasks', value=b'1', key='user-1', headers={'task-id': '1'}, on_delivery=lambda e, m: reports.append((e, m)))
+
+    assert len(producer) == 1
+    assert producer.flush() == 0
+
+    error, message = reports[0]
+
+    assert error is None
+    assert message.partition() == get_partition(b'user-1', 4)
+    assert message.offset() == 0
+    assert message.headers() == [('task-id', b'1')]
+
+
+def test_full_local_queue_raises_buffer_error() -> None:
+    producer = MemoryProducer(MemoryBroker(), {'queue.buffering.max.messages': 1})
+    producer.produce('tasks', value=b'1')
+
+    with pytest.raises(BufferError):
+        producer.produce('tasks', value=b'2')
+
+    producer.poll(0)
+    producer.produce('tasks', value=b'2')
+
+
+def test_group_members_share_partitions() -> None:
+    broker = MemoryBroker(partitions=4)
+    config = {'group.id': 'workers', 'auto.offset.reset': 'earliest'}
+    first, second = MemoryConsumer(broker, config), MemoryConsumer(broker, config)
+
+    first.subscribe(['tasks'])
+    second.subscribe(['tasks'])
+
+    for partition in range(4):
+        broker.append('tasks', value=str(partition).encode('utf-8'), key=None, headers=None, partition=partition)
+
+    first_messages = first.consume(10, timeout=0)
+    second_messages = second.consume(10, timeout=0)
+
+    assert sorted(x.partition() for x in first_messages) == [0, 2]
+    assert sorted(x.partition() for x in second_messages) == [1, 3]
+
+
+def test_group_resumes_from_committed_offset() -> None:
+    broker = MemoryBroker(partitions=1)
+    config = {'group.id': 'workers', 'auto.offset.reset': 'earliest'}
+
+    for value in (b'1', b'2', b'3'):
+        broker.append('tasks', value=value, key=None, headers=None)
+
+    consumer = MemoryConsumer(broker, config)
+    consumer.subscribe(['tasks'])
+
+    assert [x.value() for x in consumer.consume(2, timeout=0)] == [b'1', b'2']
+
+    consumer.close()
+
+    consumer = MemoryConsumer(broker, config)
+    consumer.subscribe(['tasks'])
+
+    assert [x.value() for x in consumer.consume(10, timeout=0)] == [b'3']
+    assert consumer.consume(10, timeout=0) == []
@@ -0,0 +1,15 @@
+import pytest
+
+import asyncio, os
+
+
+@pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='DATABASE_URL of the migrated database is not set')
+def test_hot_queries_use_indexes() -> None:
+    """ Every hot messenger query must be planned with one of the indexes made for it """
+
+    from benchmarks.messages_plans import get_plans
+
+    plans = asyncio.run(get_plans())
+    missed = {name: sorted(used) for name, used, expected in plans if not used & expected}
+
+    assert not missed, f'Plans do not use the expected indexes: {missed}'
@@ -0,0 +1,118 @@
+from starlette.websockets import WebSocketState
+
+from core.streams import EventEnvelope
+from messenger.managers.outbound import SlowConsumerPolicy, OutboundConnection
+
+import asyncio
+
+
+class WebSocket:
+    def __init__(self, error: Exception = None) -> None:
+        self.application_state = WebSocketState.CONNECTED
+        self.sent = []
+        self.close_code = None
+        self._error = error
+
+    async def send_text(self, text: str) -> None:
+        if self._error is not None:
+            raise self._error
+
+        self.sent.append(text)
+
+    async def close(self, code: int) -> None:
+        self.application_state = WebSocketState.DISCONNECTED
+        self.close_code = code
+
+
+def make_event(type: str, text: str) -> EventEnvelope:
+    return EventEnvelope(f'{{"type":"{type}","text":"{text}"}}'.encode('utf-8'))
+
+
+def get_texts(connection: OutboundConnection) -> list[str]:
+    return [event.text for _, event, _ in connection._queue]
+
+
+def test_drop_oldest() -> None:
+    async def run() -> None:
+        connection = OutboundConnection(WebSocket(), user_id=1, size=2, policy=SlowConsumerPolicy.DROP_OLDEST)
+
+        for text in ('1', '2', '3'):
+            assert connection.put(make_event('message', text), key='message')
+
+        assert get_texts(connection) == [make_event('message', x).text for x in ('2', '3')]
+        assert connection.stats['dropped'] == 1
+
+    asyncio.run(run())
+
+
+def test_coalesce_replaces_message_with_same_key() -> None:
+    async def run() -> None:
+        connection = OutboundConnection(WebSocket(), user_id=1, size=2, policy=SlowConsumerPolicy.COALESCE)
+
+        connection.put(make_event('typing', '1'), key='typing')
+        connection.put(make_event('message', '2'), key='message')
+        connection.put(make_event('typing', '3'), key='typing')
+
+        assert get_texts(connection) == [make_event('message', '2').text, make_event('typing', '3').text]
+        assert connection.stats['coalesced'] == 1
+
+        # Without the queued message of the same key the oldest one is dropped
+        connection.put(make_event('presence', '4'), key='presence')
+
+        assert get_texts(connection) == [make_event('typing', '3').text, make_event('presence', '4').text]
+        assert connection.stats['dropped'] == 1
+
+    asyncio.run(run())
+
+
+def test_disconnect_closes_slow_consumer() -> None:
+    async def run() -> None:
+        websocket = WebSocket()
+        connection = OutboundConnection(websocket, user_id=1, size=1, policy=SlowConsumerPolicy.DISCONNECT)
+
+        assert connection.put(make_event('message', '1'))
+        assert not connection.put(make_event('message', '2'))
+        assert connection.is_closed
+
+        await connection._closer
+
+        assert websocket.close_code == 1013
+        assert not connection.put(make_event('message', '3'))
+
+    asyncio.run(run())
+
+
+def test_writer_sends_in_order() -> None:
+    async def run() -> None:
+        websocket = WebSocket()
+        connection = OutboundConnection(websocket, user_id=1)
+        connection.start()
+
+        for text in ('1', '2'):
+            connection.put(make_event('message', text))
+
+        await asyncio.sleep(0.01)
+        await connection.stop()
+
+        assert websocket.sent == [make_event('message', x).text for x in ('1', '2')]
+        assert connection.stats['sent'] == 2
+
+    asyncio.run(run())
+
+
+def test_writer_closes_socket_after_failed_send() -> None:
+    async def run() -> None:
+        websocket = WebSocket(error=RuntimeError('gone'))
+        connection = OutboundConnection(websocket, user_id=1)
+        connection.start()
+
+        connection.put(make_event('message', '1'))
+        connection.put(make_event('message', '2'))
+
+        await asyncio.sleep(0.01)
+        await connection._closer
+
+        assert connection.is_closed
+        assert websocket.close_code == 1013
+
+    asyncio.run(run())
@@ -0,0 +1,56 @@
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, select
+
+from core.pagination import InvalidCursorError, encode_cursor, decode_cursor, paginate
+
+import pytest
+
+import base64
+
+
+items = Table('items', MetaData(), Column('id', Integer, primary_key=True))
+
+
+@pytest.fixture(scope='module')
+def connection():
+    engine = create_engine('sqlite://')
+
+    with engine.connect() as connection:
+        items.create(connection)
+        connection.execute(items.insert(), [{'id': x} for x in range(1, 11)])
+
+        yield connection
+
+
+def test_cursor_round_trip() -> None:
+    for identifier in (0, 1, 10 ** 18):
+        assert decode_cursor(encode_cursor(identifier)) == identifier
+
+    assert decode_cursor(None) is None
+
+
+@pytest.mark.parametrize('value', ['id:', 'id:-1', 'id:1a', 'id:²', 'pk:1'])
+def test_invalid_cursor(value: str) -> None:
+    cursor = base64.urlsafe_b64encode(value.encode('utf-8')).decode('utf-8')
+
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+
+def test_malformed_cursor() -> None:
+    with pytest.raises(InvalidCursorError):
+        decode_cursor('!!!')
+
+
+@pytest.mark.parametrize('kwargs, expected, is_ascending', [
+    ({'limit': 3}, [10, 9, 8], False),
+    ({'limit': 3, 'offset': 3}, [7, 6, 5], False),
+    ({'limit': 3, 'before': 5}, [4, 3, 2], False),
+    ({'limit': 3, 'after': 5}, [6, 7, 8], True),
+    ({'before': 5, 'after': 2}, [3, 4], True),
+    ({'limit': 0, 'before': 3}, [2, 1], False),
+])
+def test_paginate(connection, kwargs: dict, expected: list[int], is_ascending: bool) -> None:
+    statement, is_page_ascending = paginate(select(items.c.id), items.c.id, **kwargs)
+
+    assert connection.execute(statement).scalars().all() == expected
+    assert is_page_ascending is is_ascending
@@ -0,0 +1,25 @@
+from core.kafka.routing import murmur2, get_partition
+
+import pytest
+
+
+@pytest.mark.parametrize('data, expected', [
+    # Values of the Java client (org.apache.kafka.common.utils.Utils.murmur2) as signed integers
+    (b'21', -973932308),
+    (b'foobar', -790332482),
+    (b'a-little-bit-long-string', -985981536),
+    (b'a-little-bit-longer-string', -1486304829),
+    (b'lkjh234lh9fiuh90y23oiuhsafujhadof229phr9h19h89h8', -58897971),
+    (b'abc', 479470107),
+])
+def test_murmur2_matches_kafka(data: bytes, expected: int) -> None:
+    assert murmur2(data) == expected & 0xffffffff
+
+
+def test_partition_is_positive_and_stable() -> None:
+    for key in (b'21', b'foobar', b'abc'):
+        partition = get_partition(key, 12)
+
+        assert partition == (murmur2(key) & 0x7fffffff) % 12
+        assert 0 <= partition < 12
+        assert get_partition(key, 12) == partition
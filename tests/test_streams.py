@@ -0,0 +1,36 @@
+from core.streams import EventEnvelope, is_event_id, parse_event_id, make_event_message
+
+import pytest
+
+
+def test_type_and_event_id_are_read_from_prefix() -> None:
+    event = EventEnvelope(make_event_message(b'{"type":"message","text":"hi"}', b'1718000000000-1'))
+
+    assert event.event_id == '1718000000000-1'
+    assert event.type == 'message'
+
+
+def test_type_of_other_payloads_is_decoded() -> None:
+    assert EventEnvelope(b'{"text":"hi","type":"message"}').type == 'message'
+    assert EventEnvelope(b'{"type":"a\\"b"}').type == 'a"b'
+    assert EventEnvelope(b'["message"]').type is None
+    assert EventEnvelope(b'not json').type is None
+
+
+def test_event_without_identifier() -> None:
+    assert EventEnvelope(b'{"type":"typing"}').event_id is None
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1718000000000-0', True),
+    ('1718000000000', False),
+    ('1718000000000-0-1', False),
+    ('abc-1', False),
+])
+def test_is_event_id(value: str, expected: bool) -> None:
+    assert is_event_id(value) is expected
+
+
+def test_event_ids_are_compared_as_numbers() -> None:
+    assert parse_event_id('1718000000000-10') > parse_event_id('1718000000000-9')
+    assert parse_event_id('999-0') < parse_event_id('1000-0')